@@ -0,0 +1,93 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# startup benchmark: wall time of `python -c "import xkn"` in fresh interpreters, with
+# the binary table cache already populated (warm) and with an empty one (cold), and
+# check that the optional heavy dependencies are not loaded at import
+
+heavy_modules = ["astropy", "matplotlib", "mpmath", "numba"]
+repeat = 10
+
+
+def import_time(env):
+    out = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, time; t = time.perf_counter(); import xkn; "
+            "print(time.perf_counter() - t); "
+            f"print(','.join(m for m in {heavy_modules} if m in sys.modules))",
+        ],
+        env=env,
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split("\n")
+    return float(out[0]), [m for m in out[1].split(",") if m]
+
+
+# the example configuration refers to the data folders relative to the repository root
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+config_path = os.path.join("examples", "kn_config.ini")
+
+inputs = {
+    "view_angle": 0.524,
+    "distance": 40,
+    "m_ej_dynamics": 0.03,
+    "vel_dynamics": 0.13,
+    "high_lat_op_dynamics": 5,
+    "low_lat_op_dynamics": 20,
+    "m_ej_secular": 0.08,
+    "vel_secular": 0.06,
+    "op_secular": 5,
+    "m_ej_wind": 0.02,
+    "vel_wind": 0.1,
+    "high_lat_op_wind": 1,
+    "low_lat_op_wind": 5,
+}
+
+
+def first_model_time(env):
+    # import plus the first magnitudes of the example configuration, which load the
+    # data tables
+    script = (
+        "import time; t = time.perf_counter(); import xkn; "
+        f"mkn_config = xkn.MKNConfig({config_path!r}); "
+        "mkn = xkn.MKN(*mkn_config.get_params(), log_level='WARNING'); "
+        f"mkn.calc_magnitudes(mkn_config.get_vars({inputs!r})); "
+        "print(time.perf_counter() - t)"
+    )
+    return float(
+        subprocess.run(
+            [sys.executable, "-c", script],
+            env=env,
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    )
+
+
+if __name__ == "__main__":
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_cache:
+        env = dict(os.environ, XKN_CACHE_DIR=tmp_cache)
+        results["cold_first_model"] = first_model_time(env)
+        results["warm_first_model"] = first_model_time(env)
+        times, loaded = zip(*[import_time(env) for _ in range(repeat)])
+    results["import_median"] = statistics.median(times)
+    results["import_min"] = min(times)
+    results["heavy_modules_loaded"] = sorted(set(sum(loaded, [])))
+
+    if "--json" in sys.argv:
+        print(json.dumps(results))
+    else:
+        for key, value in results.items():
+            print(f"{key:>22}: {value}")
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+# memory benchmark: peak traced memory (tracemalloc, which includes the numpy arrays) of
+# MKN construction, calc_lightcurve_vars, calc_magnitudes and calc_log_like, and of the
+# stages recorded by xkn.instrumentation within them, for representative
+# configurations up to ricigliano_lippold with thin shells, 30 slices, n_thin = 100
+# and the times of all the measures. With --budget (MiB) the exit status is 1 if a
+# peak is above it:
+#   python benchmarks/memory.py --budget 1024
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from suite import metadata, setup
+
+from xkn import MKN, instrumentation
+
+configs = [
+    {"lc_model": "grossman", "thin_shells": False, "slices_num": 30},
+    {"lc_model": "villar", "thin_shells": False, "slices_num": 30},
+    {"lc_model": "ricigliano_lippold", "thin_shells": False, "slices_num": 30},
+    {
+        "lc_model": "ricigliano_lippold",
+        "thin_shells": True,
+        "slices_num": 30,
+        "n_thin": 100,
+    },
+    {
+        "lc_model": "ricigliano_lippold",
+        "thin_shells": True,
+        "slices_num": 30,
+        "n_thin": 100,
+        "t_scale": "all_measures",
+    },
+]
+steps = ["construction", "calc_lightcurve_vars", "calc_magnitudes", "calc_log_like"]
+
+MiB = 2.0**20
+
+
+def memory_benchmark(config):
+    shell_params, glob_params, mkn_vars = setup(config)
+    funcs = {
+        "construction": lambda: MKN(shell_params, glob_params, log_level="WARNING"),
+    }
+    # the first calls load the data tables, which stay in memory, and compile the
+    # numba kernels: they are excluded
+    mkn = funcs["construction"]()
+    mkn.calc_log_like(mkn_vars)
+    funcs["calc_lightcurve_vars"] = lambda: mkn.calc_lightcurve_vars(mkn_vars)
+    funcs["calc_magnitudes"] = lambda: mkn.calc_magnitudes(mkn_vars)
+    funcs["calc_log_like"] = lambda: mkn.calc_log_like(mkn_vars)
+
+    results = {}
+    instrumentation.enable()
+    tracemalloc.start()
+    try:
+        for step in steps:
+            instrumentation.reset()
+            with instrumentation.stage(step):
+                funcs[step]()
+            stages = instrumentation.stats()["stages"]
+            results[step] = {
+                "peak": stages.pop(step)["peak_memory"],
+                "stages": {
+                    name: values["peak_memory"] for name, values in stages.items()
+                },
+            }
+    finally:
+        tracemalloc.stop()
+        instrumentation.disable()
+        instrumentation.reset()
+    results["times"] = len(mkn.times)
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="xkn memory benchmark")
+    parser.add_argument(
+        "--budget", type=float, help="peak memory budget per step [MiB] (exit status 1)"
+    )
+    parser.add_argument(
+        "--filter", default="", help="only run the configurations containing this string"
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument(
+        "--json", action="store_true", help="print the results as JSON"
+    )
+    args = parser.parse_args()
+
+    # the example configuration refers to the data folders relative to the repository
+    # root
+    os.chdir(root)
+
+    results = []
+    over_budget = []
+    for config in configs:
+        label = " ".join(f"{param}={value}" for param, value in config.items())
+        if args.filter not in label:
+            continue
+        result = {"params": config, **memory_benchmark(config)}
+        results.append(result)
+        for step in steps:
+            if args.budget is not None and result[step]["peak"] > args.budget * MiB:
+                over_budget.append(f"{label} {step}")
+        if not args.json:
+            print(f"{label} ({result['times']} times)")
+            for step in steps:
+                stages = ", ".join(
+                    f"{name} {peak / MiB:.1f}"
+                    for name, peak in sorted(
+                        result[step]["stages"].items(), key=lambda item: -item[1]
+                    )
+                )
+                print(
+                    f"  {step:<22} {result[step]['peak'] / MiB:9.1f} MiB  ({stages})",
+                    flush=True,
+                )
+
+    output = {"metadata": metadata(), "budget": args.budget, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=1)
+    if args.json:
+        print(json.dumps(output))
+
+    if over_budget:
+        print(f"\npeak memory above {args.budget} MiB:")
+        for step in over_budget:
+            print(f"  {step}")
+        sys.exit(1)
@@ -0,0 +1,124 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# accuracy and speed of the tabulated Planck function (xkn/planck.py) against the
+# exponential form, on x = h nu / (kB T) and in the magnitudes and log-likelihood of
+# the example configuration (grossman and ricigliano_lippold with thin shells)
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from xkn import MKN, MKNConfig
+from xkn import filters as flt
+from xkn.planck import lookup_x_max, max_rel_error, planck_x3
+
+config_path = os.path.join(root, "examples", "kn_config.ini")
+repeat = 5
+
+inputs = {
+    "view_angle": 0.524,
+    "distance": 40,
+    "m_ej_dynamics": 0.03,
+    "vel_dynamics": 0.13,
+    "high_lat_op_dynamics": 5,
+    "low_lat_op_dynamics": 20,
+    "m_ej_secular": 0.08,
+    "vel_secular": 0.06,
+    "op_secular": 5,
+    "m_ej_wind": 0.02,
+    "vel_wind": 0.1,
+    "high_lat_op_wind": 1,
+    "low_lat_op_wind": 5,
+}
+
+
+def best_time(func, *args):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def accuracy():
+    x = np.concatenate(
+        [np.geomspace(1e-8, 1, 10**6), np.linspace(1, lookup_x_max, 10**7)[1:-1]]
+    )
+    rel_error = np.abs(planck_x3(x) / (x**3 / np.expm1(x)) - 1)
+    return {
+        "max_rel_error": float(rel_error.max()),
+        "x_at_max": float(x[rel_error.argmax()]),
+        "bound": max_rel_error,
+        "within_bound": bool(rel_error.max() <= max_rel_error),
+    }
+
+
+def kernel_speed(T, nu):
+    # Planck function on the model temperatures, at one frequency (as per filter in the
+    # magnitudes) and at a chunk of frequencies (as in calc_sed)
+    results = {"size": T.size}
+    for label, freqs in [("1_nu", nu[0]), ("64_nu", nu[:, None, None, None, None])]:
+        exact = best_time(flt.planckian, freqs, T)
+        flt.planckian(freqs, T, lookup=True)
+        lookup = best_time(lambda: flt.planckian(freqs, T, lookup=True))
+        results[f"exact_{label}_s"] = exact
+        results[f"lookup_{label}_s"] = lookup
+        results[f"speedup_{label}"] = exact / lookup
+    return results
+
+
+def model(lc_model, thin_shells):
+    mkn_config = MKNConfig(config_path)
+    shell_params, glob_params = mkn_config.get_params()
+    glob_params["lc_model"] = lc_model
+    glob_params["thin_shells"] = thin_shells
+    glob_params["n_thin"] = 30
+    mkn_vars = mkn_config.get_vars(inputs)
+
+    results = {}
+    for planck_lookup in [False, True]:
+        glob_params["planck_lookup"] = planck_lookup
+        cwd = os.getcwd()
+        os.chdir(root)
+        mkn = MKN(shell_params, glob_params, log_level="WARNING")
+        os.chdir(cwd)
+        mkn.calc_log_like(mkn_vars)
+        mags = mkn.calc_magnitudes(mkn_vars)
+        results[planck_lookup] = {
+            "log_like": mkn.calc_log_like(mkn_vars),
+            "log_like_s": best_time(mkn.calc_log_like, mkn_vars),
+            "mags": np.concatenate([mags[lam]["mag"] for lam in mags]),
+        }
+    finite = np.isfinite(results[False]["mags"])
+    T = mkn.ejecta.T_photo if mkn.ejecta.T_shells is None else mkn.ejecta.T_shells
+    return {
+        **kernel_speed(T, np.geomspace(1e14, 3e15, 64)),
+        "log_like_exact_s": results[False]["log_like_s"],
+        "log_like_lookup_s": results[True]["log_like_s"],
+        "log_like_diff": results[True]["log_like"] - results[False]["log_like"],
+        "max_abs_dmag": float(
+            np.max(np.abs(results[True]["mags"] - results[False]["mags"])[finite])
+        ),
+    }
+
+
+if __name__ == "__main__":
+
+    results = {
+        "accuracy": accuracy(),
+        "grossman": model("grossman", False),
+        "ricigliano_lippold_thin": model("ricigliano_lippold", True),
+    }
+
+    if "--json" in sys.argv:
+        print(json.dumps(results))
+    else:
+        for group, values in results.items():
+            print(group)
+            for key, value in values.items():
+                print(f"{key:>22}: {value}")
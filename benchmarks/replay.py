@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+# replay of a workload trace recorded with the trace_file glob parameter (format in
+# xkn/trace.py): every recorded calc_log_like / calc_magnitudes call is evaluated
+# again, reporting the throughput of the recording and of the replay and the drift of
+# the results. The trace is read here, so that it can be replayed against any xkn
+# source tree:
+#   python benchmarks/replay.py trace.bin
+#   python benchmarks/replay.py trace.bin --xkn /path/to/other/xkn/tree
+# The data paths of the recorded glob_params are relative to the directory the trace
+# was recorded in (--cwd).
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+magic = b"XKNTRACE1"
+methods = {
+    1: ("calc_log_like", {}),
+    2: ("calc_magnitudes", {"measures": False}),
+    3: ("calc_magnitudes", {"measures": True}),
+}
+
+
+def read_trace(filename):
+    # yields (schema, kind, wall time, mkn_vars, results) for every recorded call
+    with open(filename, "rb") as f:
+        data = f.read()
+    if not data.startswith(magic):
+        sys.exit(f"{filename} is not an xkn trace")
+    pos = len(magic)
+    schema = None
+    while pos < len(data):
+        kind = data[pos]
+        pos += 1
+        if kind == 0:
+            (length,) = struct.unpack_from("<I", data, pos)
+            pos += 4
+            schema = json.loads(data[pos : pos + length])
+            pos += length
+            continue
+        elapsed, nresults = struct.unpack_from("<dI", data, pos)
+        pos += 12
+        values = np.frombuffer(data, count=len(schema["vars"]), offset=pos)
+        pos += values.nbytes
+        results = np.frombuffer(data, count=nresults, offset=pos)
+        pos += results.nbytes
+        mkn_vars = {}
+        for (comp, var, var_type), value in zip(schema["vars"], values):
+            if np.isnan(value):
+                value = None
+            elif var_type == "bool":
+                value = bool(value)
+            else:
+                value = float(value)
+            mkn_vars.setdefault(comp, {})[var] = value
+        yield schema, kind, elapsed, mkn_vars, results
+
+
+def flatten_results(results):
+    if isinstance(results, dict):
+        return np.concatenate([results[lam]["mag"] for lam in results])
+    return np.array([results])
+
+
+def replay(filename, limit=None):
+    from xkn import MKN
+
+    mkns = {}
+    stats = {}
+    for i, (schema, kind, elapsed, mkn_vars, results) in enumerate(
+        read_trace(filename)
+    ):
+        if limit is not None and i >= limit:
+            break
+        # one MKN per recorded configuration, without recording the replay nor reading
+        # the light curves from the model cache of the recording
+        config = json.dumps([schema[key] for key in ["shell_params", "glob_params"]])
+        if config not in mkns:
+            glob_params = dict(schema["glob_params"], trace_file=None, model_cache=None)
+            mkns[config] = MKN(
+                schema["shell_params"],
+                glob_params,
+                inj_dict=schema["inj_dict"],
+                log_level="WARNING",
+            )
+        name, kwargs = methods[kind]
+        label = name + (" (measures)" if kwargs.get("measures") else "")
+        func = getattr(mkns[config], name)
+        if label not in stats:
+            # untimed first call: data tables and numba kernels are loaded
+            func(mkn_vars, **kwargs)
+        start = time.perf_counter()
+        replayed = flatten_results(func(mkn_vars, **kwargs))
+        replay_time = time.perf_counter() - start
+
+        stat = stats.setdefault(
+            label,
+            {
+                "calls": 0,
+                "recorded_time": 0.0,
+                "replay_time": 0.0,
+                "max_abs_drift": 0.0,
+                "max_rel_drift": 0.0,
+                "nan_mismatches": 0,
+                "recorded_version": schema["version"],
+            },
+        )
+        stat["calls"] += 1
+        stat["recorded_time"] += elapsed
+        stat["replay_time"] += replay_time
+        if replayed.shape != results.shape:
+            stat["nan_mismatches"] += max(replayed.size, results.size)
+            continue
+        finite = np.isfinite(results) & np.isfinite(replayed)
+        stat["nan_mismatches"] += int(
+            np.sum(np.isfinite(results) != np.isfinite(replayed))
+        )
+        if np.any(finite):
+            drift = np.abs(replayed[finite] - results[finite])
+            stat["max_abs_drift"] = max(stat["max_abs_drift"], float(drift.max()))
+            stat["max_rel_drift"] = max(
+                stat["max_rel_drift"],
+                float(np.max(drift / np.maximum(np.abs(results[finite]), 1e-300))),
+            )
+
+    for stat in stats.values():
+        stat["recorded_throughput"] = stat["calls"] / stat["recorded_time"]
+        stat["replay_throughput"] = stat["calls"] / stat["replay_time"]
+        stat["speedup"] = stat["recorded_time"] / stat["replay_time"]
+    return stats
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="replay of an xkn workload trace")
+    parser.add_argument("trace", help="trace file")
+    parser.add_argument(
+        "--xkn", default=root, help="source tree of the xkn version to replay with"
+    )
+    parser.add_argument(
+        "--cwd", default=root, help="directory the data paths are relative to"
+    )
+    parser.add_argument("--limit", type=int, help="replay only the first calls")
+    parser.add_argument(
+        "--json", action="store_true", help="print the results as JSON"
+    )
+    args = parser.parse_args()
+
+    trace = os.path.abspath(args.trace)
+    sys.path.insert(0, os.path.abspath(args.xkn))
+    os.chdir(args.cwd)
+
+    stats = replay(trace, limit=args.limit)
+    if args.json:
+        print(json.dumps(stats))
+    else:
+        for label, stat in stats.items():
+            print(f"{label}: {stat['calls']} calls")
+            for key, value in stat.items():
+                if key != "calls":
+                    print(f"{key:>22}: {value}")
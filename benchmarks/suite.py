@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# benchmark suite: wall times of the MKN stages (construction, calc_lightcurve_vars,
+# calc_magnitudes, calc_log_like, calc_lum_iso) for every light-curve model, with and
+# without thin shells (ricigliano_lippold only) and with 12 and 30 angular slices, and
+# of the DiffusionLum, Thermalization and calc_fnu kernels, on the AT2017gfo data of the
+# example configuration. Results are written as JSON (with the git commit) and can be
+# compared with a previous run:
+#   python benchmarks/suite.py --output before.json
+#   python benchmarks/suite.py --compare before.json
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from xkn import MKN, MKNConfig
+from xkn import filters as flt
+from xkn.diffusion_luminosity import DiffusionLum
+from xkn.thermalization import Thermalization
+from xkn.utils import Mpc2cm, Msun, c
+
+config_path = os.path.join("examples", "kn_config.ini")
+
+inputs = {
+    "view_angle": 0.524,
+    "distance": 40,
+    "m_ej_dynamics": 0.03,
+    "vel_dynamics": 0.13,
+    "high_lat_op_dynamics": 5,
+    "low_lat_op_dynamics": 20,
+    "m_ej_secular": 0.08,
+    "vel_secular": 0.06,
+    "op_secular": 5,
+    "m_ej_wind": 0.02,
+    "vel_wind": 0.1,
+    "high_lat_op_wind": 1,
+    "low_lat_op_wind": 5,
+}
+
+lc_models = ["grossman", "villar", "ricigliano_lippold"]
+slices_nums = [12, 30]
+# the optically thin shells correction is only implemented for ricigliano_lippold
+thin_shells_models = ["ricigliano_lippold"]
+
+
+def configs():
+    for lc_model in lc_models:
+        for thin_shells in [False, True]:
+            if thin_shells and lc_model not in thin_shells_models:
+                continue
+            for slices_num in slices_nums:
+                yield {
+                    "lc_model": lc_model,
+                    "thin_shells": thin_shells,
+                    "slices_num": slices_num,
+                }
+
+
+def setup(config):
+    mkn_config = MKNConfig(config_path)
+    shell_params, glob_params = mkn_config.get_params()
+    if config["thin_shells"]:
+        glob_params["n_thin"] = 30
+    glob_params.update(config)
+    return shell_params, glob_params, mkn_config.get_vars(inputs)
+
+
+def timings(func, repeat):
+    func()  # first call excluded: caches, numba compilation
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+
+
+def model_benchmarks(config):
+    shell_params, glob_params, mkn_vars = setup(config)
+    mkn = MKN(shell_params, glob_params, log_level="WARNING")
+    return {
+        "construction": lambda: MKN(shell_params, glob_params, log_level="WARNING"),
+        "calc_lightcurve_vars": lambda: mkn.calc_lightcurve_vars(mkn_vars),
+        "calc_magnitudes": lambda: mkn.calc_magnitudes(mkn_vars),
+        "calc_log_like": lambda: mkn.calc_log_like(mkn_vars),
+        "calc_lum_iso": lambda: mkn.calc_lum_iso(mkn_vars),
+    }
+
+
+def kernel_benchmarks():
+    shell_params, glob_params, mkn_vars = setup(
+        {"lc_model": "ricigliano_lippold", "thin_shells": True, "slices_num": 30}
+    )
+    mkn = MKN(shell_params, glob_params, log_level="WARNING")
+    mkn.calc_lightcurve_vars(mkn_vars)
+    times = mkn.time_source(mkn_vars)
+    omegas = mkn.omegas
+    flux_factors = mkn.calc_flux_factors(mkn_vars)
+    redshift = mkn.redshift(mkn_vars["glob"]["distance"])
+    thermalization = Thermalization("BKWM")
+    diff_lum_args = (
+        glob_params["t_0"],
+        times,
+        glob_params["T_0"],
+        2e18,
+        glob_params["idx_eff"] + 1.3,
+    )
+    diff_lum = DiffusionLum(*diff_lum_args)
+    return {
+        "DiffusionLum.__init__": lambda: DiffusionLum(*diff_lum_args),
+        "DiffusionLum.calc_lum": lambda: diff_lum.calc_lum(0.1 * c, 5.0, 0.01 * Msun),
+        "Thermalization.BKWM": lambda: thermalization(
+            times=times,
+            omegas=omegas,
+            mass_ej=np.full(len(omegas), 0.01),
+            vel=np.full(len(omegas), 0.1),
+        ),
+        "calc_fnu": lambda: flt.calc_fnu(
+            flux_factors,
+            6.0e-7,
+            mkn_vars["glob"]["distance"] * Mpc2cm,
+            redshift,
+            mkn.ejecta.radius_photo,
+            T_photo=mkn.ejecta.T_photo,
+            lum_shells=mkn.ejecta.lum_shells,
+            T_shells=mkn.ejecta.T_shells,
+            omegas=omegas,
+        ),
+    }
+
+
+model_stages = [
+    "construction",
+    "calc_lightcurve_vars",
+    "calc_magnitudes",
+    "calc_log_like",
+    "calc_lum_iso",
+]
+kernels = [
+    "DiffusionLum.__init__",
+    "DiffusionLum.calc_lum",
+    "Thermalization.BKWM",
+    "calc_fnu",
+]
+
+
+def groups():
+    # (names, params, setup): setup builds the benchmarked functions of the group, and
+    # is only called if some of them are selected
+    for config in configs():
+        yield model_stages, config, lambda config=config: model_benchmarks(config)
+    yield kernels, {}, kernel_benchmarks
+
+
+def key(result):
+    return result["name"] + "".join(
+        f" {param}={value}" for param, value in result["params"].items()
+    )
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, previous, threshold):
+    previous = {key(result): result for result in previous["results"]}
+    regressions = []
+    for result in results:
+        if key(result) not in previous:
+            continue
+        ratio = result["min"] / previous[key(result)]["min"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key(result))
+        elif ratio < 1 / threshold:
+            flag = "  improvement"
+        print(f"{key(result):<72} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="xkn benchmark suite")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="timed calls per benchmark"
+    )
+    parser.add_argument(
+        "--filter", default="", help="only run the benchmarks containing this string"
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument(
+        "--compare", help="JSON file of a previous run to compare with"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="slowdown ratio reported as a regression (exit status 1)",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print the results as JSON"
+    )
+    args = parser.parse_args()
+
+    # the example configuration refers to the data folders relative to the repository
+    # root
+    os.chdir(root)
+
+    results = []
+    for names, params, setup_group in groups():
+        selected = [
+            name
+            for name in names
+            if args.filter in key({"name": name, "params": params})
+        ]
+        if not selected:
+            continue
+        funcs = setup_group()
+        for name in selected:
+            result = {
+                "name": name,
+                "params": params,
+                **timings(funcs[name], args.repeat),
+            }
+            results.append(result)
+            if not args.json:
+                print(
+                    f"{key(result):<72} {result['min'] * 1e3:10.2f} ms (median {result['median'] * 1e3:.2f} ms)",
+                    flush=True,
+                )
+
+    output = {"metadata": metadata(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=1)
+    if args.json:
+        print(json.dumps(output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print(f"\ncompared with {previous['metadata']['commit']} (ratio of min times):")
+        if compare(results, previous, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,50 @@
+import logging
+
+from xkn import MKNConfig
+from xkn.precision import autotune
+
+# cheapest numerical resolution of the example configuration (ricigliano_lippold) for
+# which the magnitudes at the times of the measures are within 0.05 mag of the
+# accurate precision preset; the settings found can be set in the [glob] section
+
+config_path = "examples/kn_config.ini"
+mkn_config = MKNConfig(config_path)
+
+inputs = {
+    "view_angle": 0.524,
+    "distance": 40,
+    "m_ej_dynamics": 0.03,
+    "vel_dynamics": 0.13,
+    "high_lat_op_dynamics": 5,
+    "low_lat_op_dynamics": 20,
+    "m_ej_secular": 0.08,
+    "vel_secular": 0.06,
+    "op_secular": 5,
+    "m_ej_wind": 0.02,
+    "vel_wind": 0.1,
+    "high_lat_op_wind": 1,
+    "low_lat_op_wind": 5,
+}
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    shell_params, glob_params = mkn_config.get_params()
+    glob_params["lc_model"] = "ricigliano_lippold"
+    result = autotune(
+        shell_params,
+        glob_params,
+        mkn_config.get_vars(inputs),
+        0.05,
+        logger=logging.getLogger("autotune"),
+    )
+
+    for knob, value in result["settings"].items():
+        if isinstance(value, list):
+            value = " ".join(str(val) for val in value)
+        print(f"{knob:<24}= {value}")
+    print(
+        f"error {result['error']:.3f} mag, calc_magnitudes {result['time']:.3f} s"
+        f" (accurate: {result['reference_time']:.3f} s)"
+    )
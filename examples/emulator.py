@@ -0,0 +1,75 @@
+import logging
+import time
+
+from xkn import MKN, MKNConfig
+from xkn.emulator import Emulator, generate_training_data
+
+# emulator of the example configuration (grossman model, 12 slices) over the masses of
+# the dynamical and secular ejecta and the viewing angle: the training and validation
+# sets are generated in parallel (and resumed if interrupted) in emulator_train and
+# emulator_test, then the emulator is compared with MKN
+
+config_path = "examples/kn_config.ini"
+mkn_config = MKNConfig(config_path)
+
+inputs = {
+    "view_angle": 0.524,
+    "distance": 40,
+    "m_ej_dynamics": 0.03,
+    "vel_dynamics": 0.13,
+    "high_lat_op_dynamics": 5,
+    "low_lat_op_dynamics": 20,
+    "m_ej_secular": 0.08,
+    "vel_secular": 0.06,
+    "op_secular": 5,
+    "m_ej_wind": 0.02,
+    "vel_wind": 0.1,
+    "high_lat_op_wind": 1,
+    "low_lat_op_wind": 5,
+}
+
+box = {
+    "dynamics": {"m_ej": [0.005, 0.05, "log"]},
+    "secular": {"m_ej": [0.02, 0.15, "log"]},
+    "glob": {"view_angle": [0.0, 1.5]},
+}
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    shell_params, glob_params = mkn_config.get_params()
+    glob_params.update(lc_model="grossman", slices_num=12)
+    mkn_vars = mkn_config.get_vars(inputs)
+
+    for path, num, seed in [("emulator_train", 256, 0), ("emulator_test", 64, 1)]:
+        generate_training_data(
+            path,
+            shell_params,
+            glob_params,
+            mkn_vars,
+            box,
+            num,
+            seed=seed,
+            logger=logging.getLogger(path),
+        )
+
+    emulator = Emulator("emulator_train")
+    validation = emulator.validate("emulator_test")
+    print(
+        f"validation: max {validation['max']:.3f} mag, rms {validation['rms']:.3f} mag,"
+        f" {100 * validation['within_2sigma']:.1f}% within 2 sigma"
+    )
+
+    mkn = MKN(shell_params, glob_params, log_level="WARNING")
+    start = time.perf_counter()
+    log_like = mkn.calc_log_like(mkn_vars)
+    mkn_time = time.perf_counter() - start
+    start = time.perf_counter()
+    log_like_emulator, error = emulator.calc_log_like(mkn_vars, return_error=True)
+    emulator_time = time.perf_counter() - start
+    print(f"log_like: MKN {log_like:.1f} ({mkn_time:.4f} s)")
+    print(
+        f"log_like: emulator {log_like_emulator:.1f} +- {error:.1f}"
+        f" ({emulator_time:.4f} s)"
+    )
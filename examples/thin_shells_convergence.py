@@ -0,0 +1,54 @@
+import numpy as np
+
+from xkn import MKN, MKNConfig
+
+# convergence study of the optically thin shells discretization: the shell layouts
+# "vel", "mass" and "gauss" are compared for increasing n_thin against the reference
+# obtained with shell_const = vel and n_thin = 100
+
+config_path = "examples/kn_config.ini"
+mkn_config = MKNConfig(config_path)
+
+inputs = {
+    "view_angle": 0.524,
+    "distance": 40,
+    "m_ej_dynamics": 0.03,
+    "vel_dynamics": 0.13,
+    "high_lat_op_dynamics": 5,
+    "low_lat_op_dynamics": 20,
+    "m_ej_secular": 0.08,
+    "vel_secular": 0.06,
+    "op_secular": 5,
+    "m_ej_wind": 0.02,
+    "vel_wind": 0.1,
+    "high_lat_op_wind": 1,
+    "low_lat_op_wind": 5,
+}
+
+
+def run(shell_const, n_thin):
+    shell_params, glob_params = mkn_config.get_params()
+    glob_params["lc_model"] = "ricigliano_lippold"
+    glob_params["thin_shells"] = True
+    glob_params["shell_const"] = shell_const
+    glob_params["n_thin"] = n_thin
+    mkn = MKN(shell_params, glob_params, log_level="WARNING")
+    mkn_vars = mkn_config.get_vars(inputs)
+    lum_bol = 2 * np.sum(mkn.calc_lightcurve_vars(mkn_vars)[0], axis=0)
+    mags = mkn.calc_magnitudes(mkn_vars)
+    return lum_bol, np.array([mags[lam]["mag"] for lam in mags])
+
+
+if __name__ == "__main__":
+
+    lum_ref, mags_ref = run("vel", 100)
+
+    print(f"{'shell_const':>12} {'n_thin':>7} {'max |dL/L|':>12} {'max |dmag|':>12}")
+    for shell_const in ["vel", "mass", "gauss"]:
+        for n_thin in [6, 9, 13, 21, 31, 51]:
+            lum_bol, mags = run(shell_const, n_thin)
+            print(
+                f"{shell_const:>12} {n_thin:>7d}"
+                f" {np.amax(np.abs(lum_bol / lum_ref - 1)):>12.3e}"
+                f" {np.amax(np.abs(mags - mags_ref)):>12.3e}"
+            )
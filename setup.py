@@ -14,6 +14,9 @@ setup(
         "xkn.flux_factor_data": ["*.dat"],
         "xkn.interp_tables": ["hires_sym0_results", "*.dat", "*.npz"],
     },
+    entry_points={
+        "console_scripts": ["xkn = xkn.__main__:main"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
     ],
@@ -1,2 +1,2 @@
 from .config import MKNConfig
-from .mkn import MKN, gen_inj_dict
+from .mkn import MKN, gen_inj_dict, get_mkn
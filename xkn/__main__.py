@@ -0,0 +1,115 @@
+import argparse
+import importlib
+import json
+import logging
+import os
+import pkgutil
+import sys
+import time
+
+from . import __path__ as mkn_path
+
+
+def warmup():
+    # compile every numba kernel of the package with the signatures listed in the
+    # `numba_signatures` dictionary of its module; with the on-disk cache, later
+    # processes load the compiled kernels instead of compiling them again
+    for module_info in pkgutil.iter_modules(mkn_path):
+        if module_info.name in ["__main__", "plotting"]:
+            continue
+        module = importlib.import_module(f"{__package__}.{module_info.name}")
+        for name, signatures in getattr(module, "numba_signatures", {}).items():
+            for signature in signatures:
+                t = time.perf_counter()
+                getattr(module, name).compile(signature)
+                print(
+                    f"{module_info.name}.{name}({signature}): {time.perf_counter() - t:.2f} s"
+                )
+    print(f"numba cache directory: {os.environ.get('NUMBA_CACHE_DIR')}")
+
+
+def grid(config, grid_file, path, inputs_file=None, chunk_size=64, max_workers=None):
+    # light curves of the MKN of the config file on the grid of grid_file (JSON,
+    # {component: {variable: [values]}}), stored in path; the free variables of the
+    # config file are set from inputs_file (JSON, {input: value}), those on the grid
+    # being replaced by its values (their inputs default to the first grid node).
+    # Running it again resumes an interrupted evaluation.
+    import numpy as np
+
+    from .config import MKNConfig
+    from .grid import generate_grid, grid_axes
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    mkn_config = MKNConfig(config)
+    shell_params, glob_params = mkn_config.get_params()
+    with open(grid_file) as f:
+        grid_values = json.load(f)
+    inputs = {}
+    if inputs_file is not None:
+        with open(inputs_file) as f:
+            inputs = json.load(f)
+    for (comp, var), axis in zip(*grid_axes(grid_values)):
+        if var in mkn_config.vars_free.get(comp, {}):
+            name, transform = mkn_config.vars_free[comp][var]
+            inputs.setdefault(
+                name, np.cos(axis[0]) if transform is np.arccos else axis[0]
+            )
+    missing = {
+        name: None
+        for comp_vars in mkn_config.vars_free.values()
+        for name, _ in comp_vars.values()
+        if name not in inputs
+    }
+    if missing:
+        sys.exit(f"Missing inputs of the free variables: {', '.join(missing)}!")
+    generate_grid(
+        path,
+        shell_params,
+        glob_params,
+        mkn_config.get_vars(inputs),
+        grid_values,
+        chunk_size=chunk_size,
+        max_workers=max_workers,
+        logger=logging.getLogger("xkn grid"),
+    )
+    print(f"grid stored in {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="xkn")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "warmup", help="compile the numba kernels and store them in the on-disk cache"
+    )
+    grid_parser = subparsers.add_parser(
+        "grid", help="evaluate the light curves on a grid of variables (resumable)"
+    )
+    grid_parser.add_argument("config", help="config file (.ini)")
+    grid_parser.add_argument("grid", help="grid file (JSON)")
+    grid_parser.add_argument("path", help="directory of the grid store")
+    grid_parser.add_argument(
+        "--inputs", help="values of the free variables of the config file, but the grid ones (JSON)"
+    )
+    grid_parser.add_argument(
+        "--chunk-size", type=int, default=64, help="grid nodes per chunk"
+    )
+    grid_parser.add_argument(
+        "--workers", type=int, help="worker processes (default: one per CPU)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "warmup":
+        warmup()
+    elif args.command == "grid":
+        grid(
+            args.config,
+            args.grid,
+            args.path,
+            inputs_file=args.inputs,
+            chunk_size=args.chunk_size,
+            max_workers=args.workers,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,56 @@ import sys
 
 import numpy as np
 
+from . import instrumentation
+
 labels = {"mass": "mass", "op": "opacity", "vel": "velocity"}
 
 
+class BinGeometry(object):
+    """
+    geometry of the angular bins [[a0, a1], ...]:
+    edges, cosines and sines of the edges, their cosine difference,
+    central angles and their cosines and sines
+    """
+
+    def __init__(self, angles):
+        angles = np.asarray(angles, dtype=float)
+        self.a0 = angles[:, 0]
+        self.a1 = angles[:, 1]
+        self.cos_a0 = np.cos(self.a0)
+        self.cos_a1 = np.cos(self.a1)
+        self.sin_a0 = np.sin(self.a0)
+        self.sin_a1 = np.sin(self.a1)
+        self.dcos = self.cos_a0 - self.cos_a1
+        self.mid = 0.5 * (self.a1 + self.a0)
+        self.cos_mid = np.cos(self.mid)
+        self.sin_mid = np.sin(self.mid)
+
+
+# the geometry is computed once for every angular grid (the one of each MKN object and
+# its subsets of visible bins) and cached at module level, keyed by the bin edges
+_bin_geometries = {}
+
+
+def bin_geometry(angles):
+    if isinstance(angles, BinGeometry):
+        return angles
+    angles = np.asarray(angles, dtype=float)
+    key = (angles.shape, angles.tobytes())
+    instrumentation.cache("bin_geometry", key in _bin_geometries)
+    if key not in _bin_geometries:
+        if len(_bin_geometries) >= 64:
+            _bin_geometries.clear()
+        _bin_geometries[key] = BinGeometry(angles)
+    return _bin_geometries[key]
+
+
+# distribution parameters are broadcast against the bins, so that a leading batch axis
+# of parameters returns a (batch, bin) array
+def batch(var):
+    return np.asarray(var, dtype=float)[..., None]
+
+
 class AngularDistribution(object):
     """
     angular distribution class
@@ -27,19 +74,16 @@ class AngularDistribution(object):
 
     def uniform_ang(self, n, omega_fraction):
         delta = np.pi / 2.0 / float(n)
-        a = np.array([[delta * i, delta * (i + 1)] for i in range(int(n))])
-        o = np.array([2.0 * np.pi * (np.cos(x[0]) - np.cos(x[1])) for x in a])
+        i = np.arange(int(n), dtype=float)
+        a = np.stack([delta * i, delta * (i + 1)], axis=1)
+        o = 2.0 * np.pi * bin_geometry(a).dcos
         return a, o * omega_fraction
 
     def cos_uniform_ang(self, n, omega_fraction):
         delta = 1.0 / float(n)
-        a = np.array(
-            [
-                [np.arccos(delta * float(i)), np.arccos(delta * float(i - 1))]
-                for i in range(int(n), 0, -1)
-            ]
-        )
-        o = np.array([2.0 * np.pi * (np.cos(x[0]) - np.cos(x[1])) for x in a])
+        i = np.arange(int(n), 0, -1, dtype=float)
+        a = np.stack([np.arccos(delta * i), np.arccos(delta * (i - 1))], axis=1)
+        o = 2.0 * np.pi * bin_geometry(a).dcos
         return a, o * omega_fraction
 
 
@@ -111,140 +155,97 @@ class VelocityAngularDistribution(object):
 
 
 def uniform_distribution(key, angles, **kwargs):
+    geo = bin_geometry(angles)
     if key == "mass":
         m_tot = kwargs["m_tot"]
         if m_tot is None:
             sys.exit(
                 "Error! user must specify a total {}! exiting\n".format(labels[key])
             )
-        return np.array([m_tot * 0.5 * (np.cos(a[0]) - np.cos(a[1])) for a in angles])
+        return batch(m_tot) * 0.5 * geo.dcos
     else:
         central_var = kwargs["central_" + key]
         if central_var is None:
             sys.exit("Error! user must specify a {}! exiting\n".format(labels[key]))
-        return np.array([central_var for a in angles])
+        return batch(central_var) * np.ones_like(geo.mid)
+
+
+def check_min_max(key, kwargs):
+    min_var = kwargs["min_" + key]
+    max_var = kwargs["max_" + key]
+    if min_var is None:
+        sys.exit("Error! user must specify a minimum {}! exiting\n".format(labels[key]))
+    if max_var is None:
+        sys.exit("Error! user must specify a maximum {}! exiting\n".format(labels[key]))
+    return batch(min_var), batch(max_var) - batch(min_var)
 
 
 def sin_distribution(key, angles, **kwargs):
+    geo = bin_geometry(angles)
     if key == "mass":
         m_tot = kwargs["m_tot"]
         if m_tot is None:
             sys.exit(
                 "Error! user must specify a total {}! exiting\n".format(labels[key])
             )
-        return np.array(
-            [
-                (m_tot / np.pi)
-                * (
-                    a[1]
-                    - a[0]
-                    - (np.sin(a[1]) * np.cos(a[1]) - np.sin(a[0]) * np.cos(a[0]))
-                )
-                for a in angles
-            ]
+        return (batch(m_tot) / np.pi) * (
+            geo.a1
+            - geo.a0
+            - (geo.sin_a1 * geo.cos_a1 - geo.sin_a0 * geo.cos_a0)
         )
     else:
-        min_var = kwargs["min_" + key]
-        max_var = kwargs["max_" + key]
-        if min_var is None:
-            sys.exit(
-                "Error! user must specify a minimum {}! exiting\n".format(labels[key])
-            )
-        if max_var is None:
-            sys.exit(
-                "Error! user must specify a maximum {}! exiting\n".format(labels[key])
-            )
-        delta_var = max_var - min_var
-        return np.array(
-            [min_var + delta_var * np.sin(0.5 * (a[1] + a[0])) for a in angles]
-        )
+        min_var, delta_var = check_min_max(key, kwargs)
+        return min_var + delta_var * geo.sin_mid
 
 
 def sin2_distribution(key, angles, **kwargs):
+    geo = bin_geometry(angles)
     if key == "mass":
         m_tot = kwargs["m_tot"]
         if m_tot is None:
             sys.exit(
                 "Error! user must specify a total {}! exiting\n".format(labels[key])
             )
-        return np.array(
-            [
-                m_tot
-                * 0.0625
-                * (
-                    np.cos(3.0 * a[1])
-                    - 9.0 * np.cos(a[1])
-                    - np.cos(3.0 * a[0])
-                    + 9.0 * np.cos(a[0])
-                )
-                for a in angles
-            ]
-        )
-    else:
-        min_var = kwargs["min_" + key]
-        max_var = kwargs["max_" + key]
-        if min_var is None:
-            sys.exit(
-                "Error! user must specify a minimum {}! exiting\n".format(labels[key])
-            )
-        if max_var is None:
-            sys.exit(
-                "Error! user must specify a maximum {}! exiting\n".format(labels[key])
+        return (
+            batch(m_tot)
+            * 0.0625
+            * (
+                np.cos(3.0 * geo.a1)
+                - 9.0 * geo.cos_a1
+                - np.cos(3.0 * geo.a0)
+                + 9.0 * geo.cos_a0
             )
-        delta_var = max_var - min_var
-        return np.array(
-            [min_var + delta_var * (np.sin(0.5 * (a[1] + a[0])) ** 2) for a in angles]
         )
+    else:
+        min_var, delta_var = check_min_max(key, kwargs)
+        return min_var + delta_var * (geo.sin_mid**2)
 
 
 def cos2_distribution(key, angles, **kwargs):
+    geo = bin_geometry(angles)
     if key == "mass":
         m_tot = kwargs["m_tot"]
         if m_tot is None:
             sys.exit(
                 "Error! user must specify a total {}! exiting\n".format(labels[key])
             )
-        return np.array(
-            [m_tot * 0.5 * (np.cos(a[0]) ** 3 - np.cos(a[1]) ** 3) for a in angles]
-        )
+        return batch(m_tot) * 0.5 * (geo.cos_a0**3 - geo.cos_a1**3)
     else:
-        min_var = kwargs["min_" + key]
-        max_var = kwargs["max_" + key]
-        if min_var is None:
-            sys.exit(
-                "Error! user must specify a minimum {}! exiting\n".format(labels[key])
-            )
-        if max_var is None:
-            sys.exit(
-                "Error! user must specify a maximum {}! exiting\n".format(labels[key])
-            )
-        delta_var = max_var - min_var
-        return np.array(
-            [min_var + delta_var * (np.cos(0.5 * (a[1] + a[0])) ** 2) for a in angles]
-        )
+        min_var, delta_var = check_min_max(key, kwargs)
+        return min_var + delta_var * (geo.cos_mid**2)
 
 
 def abscos_distribution(key, angles, **kwargs):
+    geo = bin_geometry(angles)
     if key == "mass":
         sys.exit("Error! abscos angular distribution not defined for mass! exiting\n")
     else:
-        min_var = kwargs["min_" + key]
-        max_var = kwargs["max_" + key]
-        if min_var is None:
-            sys.exit(
-                "Error! user must specify a minimum {}! exiting\n".format(labels[key])
-            )
-        if max_var is None:
-            sys.exit(
-                "Error! user must specify a maximum {}! exiting\n".format(labels[key])
-            )
-        delta_var = max_var - min_var
-        return np.array(
-            [min_var + delta_var * (abs(np.cos(0.5 * (a[1] + a[0])))) for a in angles]
-        )
+        min_var, delta_var = check_min_max(key, kwargs)
+        return min_var + delta_var * (abs(geo.cos_mid))
 
 
 def step_distribution(key, angles, **kwargs):
+    geo = bin_geometry(angles)
     if key == "mass":
         m_tot = kwargs["m_tot"]
         if m_tot is None:
@@ -262,30 +263,18 @@ def step_distribution(key, angles, **kwargs):
                 "Error! User must specify 1 for high latitude and 0 for low latitude! exiting\n"
             )
 
-        prefac1 = m_tot * 0.5 / (1.0 - np.cos(step_angle))
-        prefac2 = m_tot * 0.5 / np.cos(step_angle)
+        m_tot = batch(m_tot)
+        step_angle = batch(step_angle)
         maxval = np.maximum(m_tot * 1.0e-4, 1.0e-5)
         if high_lat_flag:
-            return np.array(
-                [
-                    (
-                        prefac1 * (np.cos(a[0]) - np.cos(a[1]))
-                        if (np.sin(0.5 * (a[1] + a[0])) < np.sin(step_angle))
-                        else maxval
-                    )
-                    for a in angles
-                ]
+            prefac1 = m_tot * 0.5 / (1.0 - np.cos(step_angle))
+            return np.where(
+                geo.sin_mid < np.sin(step_angle), prefac1 * geo.dcos, maxval
             )
         else:
-            return np.array(
-                [
-                    (
-                        prefac2 * (np.cos(a[0]) - np.cos(a[1]))
-                        if (np.sin(0.5 * (a[1] + a[0])) > np.sin(step_angle))
-                        else maxval
-                    )
-                    for a in angles
-                ]
+            prefac2 = m_tot * 0.5 / np.cos(step_angle)
+            return np.where(
+                geo.sin_mid > np.sin(step_angle), prefac2 * geo.dcos, maxval
             )
     else:
         step_angle_var = kwargs["step_angle_" + key]
@@ -305,13 +294,8 @@ def step_distribution(key, angles, **kwargs):
                     labels[key]
                 )
             )
-        return np.array(
-            [
-                (
-                    high_lat_var
-                    if (np.sin(0.5 * (a[1] + a[0])) < np.sin(step_angle_var))
-                    else low_lat_var
-                )
-                for a in angles
-            ]
+        return np.where(
+            geo.sin_mid < np.sin(batch(step_angle_var)),
+            batch(high_lat_var),
+            batch(low_lat_var),
         )
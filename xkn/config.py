@@ -234,13 +234,37 @@ glob_params_info_dict = {
     ],
     "filter_dictionary": [
         "str",
-        "dictionary used for the filters [telescopes, iso_calc, AT2017gfo, lsst]",
+        "dictionary used for the filters [telescopes, iso_calc, AT2017gfo, lsst]: if None (and no filter_dictionary_path), it is built from the names of the files in filter_data_path",
     ],
     "filter_dictionary_path": [
         "str",
         "path to the filter dictionary: if None, uses the default one to telescopes",
     ],
     "filter_data_path": ["str", "path to the data"],
+    "transmission_data_path": [
+        "str",
+        "path to the filter transmission curves (two columns: wavelength in nm and transmission) named in the 'transmission' entries of the filter dictionary: if None, every filter is evaluated at its central wavelength",
+    ],
+    "transmission_num": [
+        "int",
+        "number of log-spaced wavelengths sampling each transmission curve [32]",
+    ],
+    "trace_file": [
+        "str",
+        "binary file recording the calc_log_like and calc_magnitudes calls, replayed with benchmarks/replay.py ({pid} is replaced by the process id): if None, nothing is recorded",
+    ],
+    "model_cache": [
+        "str",
+        "directory of the on-disk cache of the lightcurve variables and magnitudes, shared by concurrent processes (see model_cache.py): if None, nothing is cached",
+    ],
+    "model_cache_size": [
+        "float",
+        "size of the model cache [MiB] above which the least recently used entries are evicted [1024]",
+    ],
+    "planck_lookup": [
+        "bool",
+        "evaluate the Planck function in the magnitudes from a lookup table (relative error < 1e-5) instead of the exponential",
+    ],
     "lam_list": ["int_list", "values need to be single-space separated"],
     "lam_min": ["int", "minimum wavelenght in nm considered from data"],
     "lam_max": ["int", "maximum wavelenght in nm considered from data"],
@@ -263,6 +287,10 @@ glob_params_info_dict = {
         "discretization law for the polar angle [uniform, cos_uniform]",
     ],
     "omega_frac": ["float", "auxiliary parameter [1]"],
+    "ff_toll": [
+        "float",
+        "relative flux factor below which angular bins are not evaluated: if None, evaluates every bin",
+    ],
     # times handling
     "t_scale": [
         "str",
@@ -310,9 +338,30 @@ glob_params_info_dict = {
     "n_thin": ["int", "number of optically thin shells"],
     "shell_const": [
         "str",
-        "uniform discretization in mass (mass) or velocity (vel) for optically thin shells",
+        "uniform discretization in mass (mass) or velocity (vel), or Gauss-Legendre nodes in velocity (gauss) for optically thin shells",
     ],
     "n_heat": ["int", "auxiliary parameter [30]"],
+    # numerical precision
+    "precision": [
+        "str",
+        "resolution preset [fast, default, accurate], overriding slices_num, t_num, vel_num, n_thin, diff_lum_N, diff_lum_Np, diff_lum_Np_K and villar_NN: if None, their values are used",
+    ],
+    "diff_lum_N": [
+        "int",
+        "number of terms of the diffusion luminosity expansion (ricigliano_lippold) [500]",
+    ],
+    "diff_lum_Np": [
+        "int",
+        "number of points of the diffusion luminosity 1D interpolation (ricigliano_lippold) [300]",
+    ],
+    "diff_lum_Np_K": [
+        "int_list",
+        "number of points in time, terms and optical depth of the diffusion luminosity 3D interpolation (ricigliano_lippold) [50 100 50]",
+    ],
+    "villar_NN": [
+        "int",
+        "number of points of the early time integral of the villar model [100]",
+    ],
 }
 
 comp_params_info_dict = {
@@ -337,7 +386,10 @@ comp_params_info_dict = {
     "entropy": ["float", "entropy value in k_B/baryon for heating rate"],
     "tau": ["float", "expansion timescale in ms for heating rate"],
     "NR_data": ["bool", "if True imports ejecta profile from NR_data_filename"],
-    "NR_data_filename": ["str", "name of file containing ejecta profile"],
+    "NR_data_filename": [
+        "str",
+        "name of file containing ejecta profile (text, or binary .npy/.npz with theta, mass, ye, vel)",
+    ],
 }
 
 ############################################################
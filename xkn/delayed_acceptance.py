@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class DelayedAcceptance(object):
+    """
+    Two-stage (delayed-acceptance) Metropolis-Hastings step on the likelihood of an MKN
+    (Christen & Fox 2005): a proposal is first accepted or rejected on the likelihood
+    of a coarse MKN (same shells and data, e.g. with the fast precision preset, fewer
+    slices or times, or the grossman model), and only the proposals passing this
+    screen are evaluated with the full MKN. The second stage acceptance probability
+        min(1, exp([L(y) - L(x)] - [L_c(y) - L_c(x)]))
+    corrects for the coarse screen, so that the chain samples the full posterior.
+    """
+
+    def __init__(self, mkn, coarse_glob_params=None, rng=None):
+        # the coarse MKN is built from the glob_params of the full one without its
+        # precision preset (which would override coarse_glob_params), updated with
+        # coarse_glob_params (by default the fast precision preset)
+        from .mkn import MKN
+
+        if coarse_glob_params is None:
+            coarse_glob_params = {"precision": "fast"}
+        self.mkn = mkn
+        self.coarse = MKN(
+            mkn.shell_params,
+            {
+                **mkn.glob_params,
+                "precision": None,
+                "trace_file": None,
+                **coarse_glob_params,
+            },
+            inj_dict=mkn.inj_dict,
+            log_name="COARSE-MKN",
+            log_level="WARNING",
+        )
+        self.rng = np.random.default_rng(rng)
+        self.state = None
+        self.proposals = 0
+        self.coarse_rejections = 0
+        self.full_rejections = 0
+
+    # current point of the chain, with its full and coarse log-likelihoods
+    def set_state(self, mkn_vars, log_like=None, log_like_coarse=None):
+        if log_like is None:
+            log_like = self.mkn.calc_log_like(mkn_vars)
+        if log_like_coarse is None:
+            log_like_coarse = self.coarse.calc_log_like(mkn_vars)
+        self.state = (mkn_vars, log_like, log_like_coarse)
+
+    # log of the second stage acceptance probability of y from x, given the full (L)
+    # and coarse (L_c) log-likelihoods of both (NaN log-likelihoods give NaN, which
+    # rejects the proposal)
+    @staticmethod
+    def log_correction(
+        log_like, log_like_coarse, log_like_current, log_like_coarse_current
+    ):
+        return np.minimum(
+            0.0,
+            (log_like - log_like_current) - (log_like_coarse - log_like_coarse_current),
+        )
+
+    # One step from the current state to the proposal mkn_vars, with log_prior_ratio =
+    # log p(y) - log p(x) and log_proposal_ratio = log q(x|y) - log q(y|x) (zero for a
+    # symmetric proposal). Returns whether the proposal is accepted (the new state) and
+    # its full log-likelihood, None if it was rejected at the first stage.
+    def step(self, mkn_vars, log_prior_ratio=0.0, log_proposal_ratio=0.0):
+        current, log_like_current, log_like_coarse_current = self.state
+        self.proposals += 1
+
+        log_like_coarse = self.coarse.calc_log_like(mkn_vars)
+        log_alpha = (
+            log_like_coarse
+            - log_like_coarse_current
+            + log_prior_ratio
+            + log_proposal_ratio
+        )
+        if not np.log(self.rng.uniform()) < log_alpha:
+            self.coarse_rejections += 1
+            return False, None
+
+        log_like = self.mkn.calc_log_like(mkn_vars)
+        log_alpha = self.log_correction(
+            log_like, log_like_coarse, log_like_current, log_like_coarse_current
+        )
+        if not np.log(self.rng.uniform()) < log_alpha:
+            self.full_rejections += 1
+            return False, log_like
+
+        self.state = (mkn_vars, log_like, log_like_coarse)
+        return True, log_like
+
+    def stats(self):
+        full = self.proposals - self.coarse_rejections
+        return {
+            "proposals": self.proposals,
+            "full_evaluations": full,
+            "accepted": full - self.full_rejections,
+            # fraction of the proposals for which the full model was not evaluated
+            "avoided_fraction": (
+                self.coarse_rejections / self.proposals if self.proposals else None
+            ),
+        }
@@ -1,25 +1,41 @@
 import sys
+from functools import lru_cache
+
 import numpy as np
 from scipy.interpolate import interp1d, RegularGridInterpolator
 
+from . import instrumentation
 from . import nuclear_heat as nh
 from .utils import c, day2sec
-from .incomplete_gamma import scaled_upper_gamma
+
 
 # Note: np.frompyfunc returns dtype=object, while np.vectorize handles the type
 # correctly. In this particular applications, np.frompyfunc leads to a 50% slow
 # down, probably because of the type mishandling, so np.vectorize is
 # preferable.
-sug = np.vectorize(scaled_upper_gamma, otypes=["float64"]) # scaled upper incomplete gamma function, i.e exp(z) * Gamma(s, z)
+# The numba implementation (and the mpmath quadrature nodes it is built on) is only
+# imported at the first evaluation.
+@lru_cache(maxsize=None)
+def vectorized_scaled_upper_gamma():
+    from .incomplete_gamma import scaled_upper_gamma
+
+    return np.vectorize(scaled_upper_gamma, otypes=["float64"])
+
+
+instrumentation.register_lru_cache(
+    "vectorized_scaled_upper_gamma", vectorized_scaled_upper_gamma
+)
+
+
+def sug(s, z):  # scaled upper incomplete gamma function, i.e exp(z) * Gamma(s, z)
+    return vectorized_scaled_upper_gamma()(s, z)
 
 
 def generate_diff_lums(
     ye, entropy, tau, times, glob_vars, shell_params, glob_params, **kwargs
 ):
     if shell_params["heat_model"] == "RP":
-        A_alphas = [
-            nh.skynet_heating_params(YE, S, TAU) for YE, S, TAU in zip(ye, entropy, tau)
-        ]
+        A_alphas = list(zip(*nh.skynet_heating_params(ye, entropy, tau)))
     elif shell_params["heat_model"] == "K":
         A_alphas = len(ye) * [
             (1.95e10 * glob_vars["eps0"] / 2e18, glob_params["alpha"])
@@ -30,9 +46,7 @@ def generate_diff_lums(
             (1.95e10 * glob_vars["eps0"] / 2e18, glob_params["alpha"])
         ]
     elif shell_params["heat_model"] == "LR":
-        A_alphas = [
-            nh.skynet_heating_params(YE, S, TAU) for YE, S, TAU in zip(ye, entropy, tau)
-        ]
+        A_alphas = list(zip(*nh.skynet_heating_params(ye, entropy, tau)))
     else:
         sys.exit(
             "Wrong input name for heating rate model\n"
@@ -43,24 +57,31 @@ def generate_diff_lums(
             + '"K" for Korobkin 2015'
         )
 
-    return [
-        DiffusionLum(
-            glob_params["t_0"],
-            times,
-            glob_params["T_0"],
-            glob_params["cnst_eff"] * A,
-            glob_params["idx_eff"] + alpha,
-        )
-        for (A, alpha) in A_alphas
-    ]
-
-
-# definition of luminosity class:
-class DiffusionLum(object):
-    # class parameters (cgs):
-
-    N = 500  # number of terms in the luminosity semi-analytical expansion formula (for convergence)
-
+    # expansion and interpolation resolution, if given (see precision.py)
+    resolution = {
+        key: glob_params[f"diff_lum_{key}"]
+        for key in ["N", "Np", "Np_K"]
+        if glob_params.get(f"diff_lum_{key}") is not None
+    }
+
+    # bins sharing the same heating parameters share the same luminosity solver
+    diff_lums = {}
+    for A, alpha in A_alphas:
+        instrumentation.cache("diff_lum", (float(A), float(alpha)) in diff_lums)
+        if (float(A), float(alpha)) not in diff_lums:
+            diff_lums[(float(A), float(alpha))] = DiffusionLum(
+                glob_params["t_0"],
+                times,
+                glob_params["T_0"],
+                glob_params["cnst_eff"] * A,
+                glob_params["idx_eff"] + alpha,
+                **resolution,
+            )
+    return [diff_lums[(float(A), float(alpha))] for A, alpha in A_alphas]
+
+
+# arrays of the terms of the luminosity semi-analytical expansion formula
+def expansion_terms(N):
     # array of expansion terms indices:
     no = np.arange(1, N + 1)
     n = no[
@@ -78,9 +99,22 @@ class DiffusionLum(object):
     sign[::2] = 1
     sign[1::2] = -1
     sign = sign[:, np.newaxis]
+    return no, n, S, sign
+
+
+# definition of luminosity class:
+class DiffusionLum(object):
+    # class parameters (cgs):
+
+    N = 500  # number of terms in the luminosity semi-analytical expansion formula (for convergence)
+    no, n, S, sign = expansion_terms(N)
 
-    # class instance definition:
-    def __init__(self, t_0, time, T_0, A, alpha):
+    # class instance definition: N, Np and Np_K set the precision of the expansion and
+    # of the interpolations (see precision.py)
+    def __init__(self, t_0, time, T_0, A, alpha, N=500, Np=300, Np_K=(50, 100, 50)):
+        if N != DiffusionLum.N:
+            self.N = N
+            self.no, self.n, self.S, self.sign = expansion_terms(N)
 
         # class instance parameters(cgs):
         self.t_0 = t_0
@@ -94,8 +128,8 @@ class DiffusionLum(object):
 
         # array factors in the solution of the temporal differential equation:
         self.A_n_factor = (
-            np.power(DiffusionLum.n, self.alpha - 3)
-            * DiffusionLum.sign
+            np.power(self.n, self.alpha - 3)
+            * self.sign
             * np.power(np.pi, self.alpha - 3)
             * 2**0.5
             / np.power(2, self.alpha / 2)
@@ -103,14 +137,14 @@ class DiffusionLum(object):
             * np.power(t_0, -self.alpha / 2)
             / self.E_0
         )
-        self.gamma_factor = -0.5 * (np.pi * DiffusionLum.n * self.t) ** 2 / t_0
-        self.gamma_K_nt_factor = 0.5 * (np.pi * DiffusionLum.n) ** 2 * t_0
+        self.gamma_factor = -0.5 * (np.pi * self.n * self.t) ** 2 / t_0
+        self.gamma_K_nt_factor = 0.5 * (np.pi * self.n) ** 2 * t_0
 
         # linear 1D interpolation of first function in temporal differential equation solution:
-        self.Np = 300  # number of sample points x (interpolation precision)
+        self.Np = Np  # number of sample points x (interpolation precision)
         self.x_i = (
             -0.5
-            * (np.pi * DiffusionLum.N * self.t_f) ** 2
+            * (np.pi * self.N * self.t_f) ** 2
             / (t_0 * 63661977.23675813 / 10000)
         )  # x mesh left extreme
         self.x_f = (
@@ -125,12 +159,12 @@ class DiffusionLum(object):
 
         # linear 3D interpolation of second function in temporal differential equation solution:
         self.Np_K = np.array(
-            [50, 100, 50]
+            Np_K
         )  # number of sample points for first, second and third sample mesh (interpolation precision)
         self.t_K = np.logspace(
             np.log10(t_0), np.log10(self.t_f), self.Np_K[0]
         )  # first sample mesh
-        self.n_K = np.linspace(1, DiffusionLum.N, self.Np_K[1])  # second sample mesh
+        self.n_K = np.linspace(1, self.N, self.Np_K[1])  # second sample mesh
         self.tau_0_K = np.logspace(
             np.log10(63661977.23675813 / 10000),
             np.log10(63661977.23675813 * 10000),
@@ -162,9 +196,9 @@ class DiffusionLum(object):
     # solution of the temporal differential equation function definition:
     def solution(self, tau_0, rho_0):
         A_n = self.A_n_factor * np.power(tau_0, 1 - self.alpha / 2) * rho_0
-        K_nt = DiffusionLum.S * np.exp(
+        K_nt = self.S * np.exp(
             (self.gamma_factor + self.gamma_K_nt_factor) / tau_0
-        ) - A_n * self.f_K((self.t, DiffusionLum.n, tau_0))
+        ) - A_n * self.f_K((self.t, self.n, tau_0))
         return K_nt + A_n * self.f(self.gamma_factor / tau_0)
 
     # luminosity function definition:
@@ -179,7 +213,7 @@ class DiffusionLum(object):
             tau_0, rho_0
         )  # solution of the temporal differential equation (matrix generated using t and n arrays)
         T = (
-            DiffusionLum.sign * DiffusionLum.n * phi_nt
+            self.sign * self.n * phi_nt
         )  # matrix generated using t and n arrays
         return (
             np.sum(T, axis=0)
@@ -3,7 +3,8 @@ import sys
 import numpy as np
 import scipy.optimize
 
-from .shell import Shell
+from . import instrumentation
+from .shell import Shell, StackedShell, stack_key
 from .utils import (
     T_eff_calc,
     calc_Tfloor,
@@ -15,24 +16,74 @@ from .utils import (
 )
 from . import utils
 
+# lightcurve variables returned by calc_lightcurve_vars (lum_shells and T_shells are
+# None without thin shells)
+lightcurve_vars = [
+    "lum_bol",
+    "lum_photo",
+    "radius_photo",
+    "T_photo",
+    "lum_shells",
+    "T_shells",
+    "lum_bol_raw",
+]
+
 
 class Ejecta(object):
 
     def __init__(self, shell_names, shell_params, *args, **kwargs):
         self.ncomponents = len(shell_names)
         self.components = [Shell(n, shell_params[n], **kwargs) for n in shell_names]
+        self.set_stacks()
+
+    # group the components sharing the same models, each group is evaluated at once
+    # as a single stacked (component x bin) shell
+    def set_stacks(self):
+        groups = {}
+        for ic, c in enumerate(self.components):
+            groups.setdefault(stack_key(c.params), []).append(ic)
+        self.stack_ids = list(groups.values())
+        self.stacks = [
+            StackedShell([self.components[ic] for ic in ids]) for ids in self.stack_ids
+        ]
 
     def generate_diff_lums(
         self, angles, times, shell_vars, glob_vars, glob_params, **kwargs
     ):
-        for c in self.components:
-            c.generate_diff_lums(
-                angles, times, shell_vars[c.name], glob_vars, glob_params, **kwargs
+        for s in self.stacks:
+            s.generate_diff_lums(
+                angles, times, shell_vars, glob_vars, glob_params, **kwargs
             )
 
     def calc_lightcurve_vars(
         self, angles, omegas, times, shell_vars, glob_vars, glob_params, **kwargs
     ):
+        # evaluate only the angular bins selected by the boolean mask bins (if given)
+        # and expand the results to the full angular grid, with zeros elsewhere;
+        # NR profiles are normalized over the whole grid, so they are never pruned
+        if "bins" in kwargs:
+            bins = kwargs.pop("bins")
+            if (
+                bins is not None
+                and not np.all(bins)
+                and not any(c.params["NR_data"] for c in self.components)
+            ):
+                if check_dict_variables(dic=(kwargs, ["diff_lums"])):
+                    kwargs["diff_lums"] = [
+                        [d for d, b in zip(diff_lums, bins) if b]
+                        for diff_lums in kwargs["diff_lums"]
+                    ]
+                self.calc_lightcurve_vars(
+                    angles[bins],
+                    omegas[bins],
+                    times,
+                    shell_vars,
+                    glob_vars,
+                    glob_params,
+                    **kwargs
+                )
+                return self.expand_bins(bins)
+
         if check_dict_variables(
             dic=(kwargs, ["diff_lums"]), label="calc_lightcurve_vars"
         ):
@@ -47,19 +98,19 @@ class Ejecta(object):
         self.radius_photo = np.zeros((self.ncomponents, len(angles), len(times)))
         self.lum_bol_raw = np.zeros_like(self.radius_photo)
 
-        for ic, c in enumerate(self.components):
-            self.radius_photo[ic], self.lum_bol_raw[ic] = (
-                c.expansion_angular_distribution(
-                    angles,
-                    omegas,
-                    times,
-                    shell_vars[c.name],
-                    glob_vars,
-                    glob_params,
-                    diff_lums=diff_lums[ic],
-                    **kwargs
-                )
+        for ids, s in zip(self.stack_ids, self.stacks):
+            radius_photo, lum_bol_raw = s.expansion_angular_distribution(
+                angles,
+                np.tile(omegas, len(ids)),
+                times,
+                shell_vars,
+                glob_vars,
+                glob_params,
+                diff_lums=stack_diff_lums([diff_lums[ic] for ic in ids]),
+                **kwargs
             )
+            self.radius_photo[ids] = split_stack(radius_photo, len(ids))
+            self.lum_bol_raw[ids] = split_stack(lum_bol_raw, len(ids))
 
         # select the photospheric radius as the maximum between the different single photospheric radii
         self.radius_photo = np.amax(self.radius_photo, axis=0)
@@ -68,6 +119,9 @@ class Ejecta(object):
             self.v_shells = np.zeros(
                 (self.ncomponents, len(angles), glob_params["n_thin"])
             )
+            self.v_nodes = np.zeros(
+                (self.ncomponents, len(angles), glob_params["n_thin"] - 1)
+            )
             self.lum_shells = np.zeros(
                 (self.ncomponents, len(angles), len(times), glob_params["n_thin"] - 1)
             )
@@ -75,22 +129,26 @@ class Ejecta(object):
             self.mass_scaled = np.zeros((self.ncomponents, len(angles)))
             self.ye = np.zeros((self.ncomponents, len(angles)))
 
-            for ic, c in enumerate(self.components):
+            for ids, s in zip(self.stack_ids, self.stacks):
                 (
-                    self.v_shells[ic],
-                    self.lum_shells[ic],
-                    self.vel_woll[ic],
-                    self.mass_scaled[ic],
-                    self.ye[ic],
-                ) = c.expansion_angular_distribution_thin_layers(
-                    angles,
-                    omegas,
-                    times,
-                    shell_vars[c.name],
-                    glob_vars,
-                    glob_params,
-                    **kwargs
-                )
+                    self.v_shells[ids],
+                    self.v_nodes[ids],
+                    self.lum_shells[ids],
+                    self.vel_woll[ids],
+                    self.mass_scaled[ids],
+                    self.ye[ids],
+                ) = [
+                    split_stack(var, len(ids))
+                    for var in s.expansion_angular_distribution_thin_layers(
+                        angles,
+                        np.tile(omegas, len(ids)),
+                        times,
+                        shell_vars,
+                        glob_vars,
+                        glob_params,
+                        **kwargs
+                    )
+                ]
 
             return self.calc_lightcurve_vars_thin(
                 angles, omegas, times, shell_vars, glob_vars, glob_params, **kwargs
@@ -118,6 +176,33 @@ class Ejecta(object):
                 self.lum_bol_raw,
             )
 
+    # restore the lightcurve variables of a previous calc_lightcurve_vars (e.g. from the
+    # model cache of MKN), given as a dictionary without the None ones
+    def set_lightcurve_vars(self, state):
+        for key in lightcurve_vars:
+            setattr(self, key, state.get(key))
+        return tuple(getattr(self, key) for key in lightcurve_vars)
+
+    def expand_bins(self, bins):
+        # the angular axis is the third to last one for the thin shells variables,
+        # the second to last one otherwise
+        for key in ["lum_bol", "lum_photo", "radius_photo", "T_photo", "lum_bol_raw"]:
+            setattr(self, key, expand_axis(getattr(self, key), bins, -2))
+        for key in ["lum_shells", "T_shells"]:
+            if getattr(self, key) is not None:
+                setattr(self, key, expand_axis(getattr(self, key), bins, -3))
+
+        return (
+            self.lum_bol,
+            self.lum_photo,
+            self.radius_photo,
+            self.T_photo,
+            self.lum_shells,
+            self.T_shells,
+            self.lum_bol_raw,
+        )
+
+    @instrumentation.timed("thin_shells")
     def calc_lightcurve_vars_thin(
         self, angles, omegas, times, shell_vars, glob_vars, glob_params, **kwargs
     ):
@@ -234,7 +319,7 @@ class Ejecta(object):
             * (
                 1
                 - (
-                    v_shells[:, :, :, :-1]
+                    self.v_nodes[:, :, None, :]
                     / np.amax(self.vel_woll, axis=0)[None, :, None, None]
                 )
                 ** 2
@@ -261,3 +346,23 @@ class Ejecta(object):
             self.T_shells,
             self.lum_bol_raw,
         )
+
+
+def expand_axis(arr, mask, axis):
+    shape = list(arr.shape)
+    shape[axis] = len(mask)
+    full = np.zeros(shape, dtype=arr.dtype)
+    full[(slice(None),) * (arr.ndim + axis) + (mask,)] = arr
+    return full
+
+
+# split the leading (component x bin) axis of a stacked variable
+def split_stack(arr, ncomponents):
+    return arr.reshape((ncomponents, -1) + arr.shape[1:])
+
+
+# concatenate the diff_lum objects of the stacked components (if provided)
+def stack_diff_lums(diff_lums):
+    if None in diff_lums:
+        return None
+    return [diff_lum for dls in diff_lums for diff_lum in dls]
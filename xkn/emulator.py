@@ -0,0 +1,235 @@
+import numpy as np
+from scipy.linalg import LinAlgError, cho_factor, cho_solve, solve_triangular
+
+from .store import ChunkStore, StoredModel, fill
+from .utils import package_version
+
+# Surrogate of the MKN magnitudes for population studies and real-time work, where
+# millions of evaluations are needed:
+# - generate_training_data evaluates MKN.calc_magnitudes on a latin hypercube design
+#   of a box of variables (the others fixed to mkn_vars), in parallel processes, and
+#   stores the magnitudes of all the filters on the MKN times in memory-mapped chunks
+#   (store.py), so that an interrupted generation is resumed;
+# - Emulator compresses the light curve of every filter by PCA over time and
+#   interpolates the PCA coefficients over the box with a Gaussian process, giving the
+#   magnitudes of many variables at once (predict, e.g. ~1e4 per call) or the
+#   calc_magnitudes and calc_log_like of MKN, with error estimates.
+# The box is a dictionary {component: {variable: [min, max]}}, with "log" as third
+# element for the variables sampled (and interpolated) in log scale, e.g.
+#   {"dynamics": {"m_ej": [1e-3, 1e-1, "log"]}, "glob": {"view_angle": [0, 1.57]}}.
+
+
+class ParameterBox(object):
+
+    def __init__(self, box):
+        self.names = [[comp, var] for comp in box for var in box[comp]]
+        bounds = [box[comp][var] for comp, var in self.names]
+        self.log = np.array([len(bound) > 2 and bound[2] == "log" for bound in bounds])
+        self.lower = self.scale(np.array([bound[0] for bound in bounds], dtype=float))
+        self.upper = self.scale(np.array([bound[1] for bound in bounds], dtype=float))
+
+    def scale(self, values):
+        return np.where(self.log, np.log(np.where(self.log, values, 1.0)), values)
+
+    # values [..., variable] in the unit box
+    def to_unit(self, values):
+        return (self.scale(np.asarray(values, dtype=float)) - self.lower) / (
+            self.upper - self.lower
+        )
+
+    def from_unit(self, unit):
+        values = self.lower + unit * (self.upper - self.lower)
+        return np.where(self.log, np.exp(values), values)
+
+
+# num samples in the unit hypercube, one per stratum along every dimension
+def latin_hypercube(num, dim, rng):
+    return (np.argsort(rng.random((num, dim)), axis=0) + rng.random((num, dim))) / num
+
+
+# Evaluate the magnitudes of num samples of the box into the store at path (resuming
+# an interrupted generation with the same arguments); magnitudes fainter than
+# mag_limit are clipped to it.
+def generate_training_data(
+    path,
+    shell_params,
+    glob_params,
+    mkn_vars,
+    box,
+    num,
+    chunk_size=32,
+    seed=0,
+    mag_limit=40.0,
+    inj_dict=None,
+    max_workers=None,
+    logger=None,
+):
+    from .mkn import MKN
+
+    params = ParameterBox(box)
+    mkn = MKN(
+        shell_params,
+        {**glob_params, "trace_file": None},
+        inj_dict=inj_dict,
+        log_level="WARNING",
+    )
+    store = ChunkStore(
+        path,
+        {
+            "version": package_version(),
+            "shell_params": shell_params,
+            "glob_params": glob_params,
+            "inj_dict": inj_dict,
+            "mkn_vars": mkn_vars,
+            "box": box,
+            "num": num,
+            "seed": seed,
+            "chunk_size": chunk_size,
+            "mag_limit": mag_limit,
+            "lams": np.asarray(mkn.lams).tolist(),
+            "times": np.asarray(mkn.times).tolist(),
+        },
+        num_chunks=-(-num // chunk_size),
+    )
+    design = params.from_unit(
+        latin_hypercube(num, len(params.names), np.random.default_rng(seed))
+    )
+    fill(
+        store,
+        shell_params,
+        glob_params,
+        mkn_vars,
+        params.names,
+        design,
+        chunk_size,
+        inj_dict=inj_dict,
+        mag_limit=mag_limit,
+        max_workers=max_workers,
+        logger=logger,
+    )
+    return store
+
+
+def sq_distances(x1, x2):
+    return np.maximum(
+        np.sum(x1**2, axis=1)[:, None] + np.sum(x2**2, axis=1)[None, :] - 2 * x1 @ x2.T,
+        0.0,
+    )
+
+
+def kernel(x1, x2, length_scales):
+    return np.exp(-0.5 * sq_distances(x1 / length_scales, x2 / length_scales))
+
+
+class Emulator(StoredModel):
+    """
+    Emulator of the magnitudes trained on the store of generate_training_data at path.
+    The light curve of every filter is compressed to its first n_components principal
+    components over time; their (standardized) coefficients are interpolated by a
+    Gaussian process with squared exponential kernel, whose length scales maximize the
+    marginal likelihood on fit_size samples. The standard deviation of the magnitudes
+    combines the GP variance and the residual variance of the truncated PCA.
+    """
+
+    def __init__(
+        self, path, n_components=8, nugget=1e-6, fit_size=500, log_level="WARNING"
+    ):
+        store = ChunkStore(path)
+        self.box = ParameterBox(store.metadata["box"])
+        self.mag_limit = store.metadata["mag_limit"]
+        super().__init__(
+            store, self.box.names, log_name="EMULATOR-MKN", log_level=log_level
+        )
+        self.fit_pca(store.read("mag"), n_components)
+        self.fit_gp(self.box.to_unit(store.read("values")), nugget, fit_size)
+
+    def fit_pca(self, mags, n_components):
+        self.mean = mags.mean(axis=0)
+        # principal components times the scale of their coefficients [lam, component,
+        # time] (zero for the filters with fewer components), and the standardized
+        # coefficients [sample, lam * component]
+        self.basis = np.zeros((len(self.lams), n_components, len(self.times)))
+        coeffs = np.zeros((len(mags), len(self.lams), n_components))
+        self.pca_var = np.zeros(self.mean.shape)
+        for i in range(len(self.lams)):
+            centered = mags[:, i] - self.mean[i]
+            _, singular, vt = np.linalg.svd(centered, full_matrices=False)
+            num = min(n_components, int(np.sum(singular > 1e-10 * singular[0])))
+            coeff = centered @ vt[:num].T
+            scale = np.std(coeff, axis=0)
+            scale[scale == 0] = 1.0
+            self.basis[i, :num] = vt[:num] * scale[:, None]
+            coeffs[:, i, :num] = coeff / scale
+            self.pca_var[i] = np.mean((centered - coeff @ vt[:num]) ** 2, axis=0)
+        self.coeffs = coeffs.reshape(len(mags), -1)
+        self.num_outputs = np.count_nonzero(np.any(self.coeffs, axis=0))
+        self.basis_var = np.sum(self.basis**2, axis=1)
+
+    def log_marginal_likelihood(self, x, y, length_scales, nugget):
+        try:
+            chol = cho_factor(
+                kernel(x, x, length_scales) + nugget * np.eye(len(x)), lower=True
+            )
+        except LinAlgError:
+            return -np.inf
+        return -0.5 * np.sum(y * cho_solve(chol, y)) - self.num_outputs * np.sum(
+            np.log(np.diag(chol[0]))
+        )
+
+    def fit_gp(self, x, nugget, fit_size):
+        # length scales by coordinate descent over a grid, on at most fit_size samples
+        subset = np.random.default_rng(0).permutation(len(x))[:fit_size]
+        length_scales = np.full(x.shape[1], 0.5)
+        best = self.log_marginal_likelihood(
+            x[subset], self.coeffs[subset], length_scales, nugget
+        )
+        for _ in range(2):
+            for dim in range(x.shape[1]):
+                for value in np.geomspace(0.05, 5.0, 15):
+                    trial = length_scales.copy()
+                    trial[dim] = value
+                    lml = self.log_marginal_likelihood(
+                        x[subset], self.coeffs[subset], trial, nugget
+                    )
+                    if lml > best:
+                        best, length_scales = lml, trial
+
+        self.x = x
+        self.length_scales = length_scales
+        self.nugget = nugget
+        self.chol = np.linalg.cholesky(
+            kernel(x, x, length_scales) + nugget * np.eye(len(x))
+        )
+        self.alpha = cho_solve((self.chol, True), self.coeffs)
+
+    # Magnitudes and their standard deviation [sample, lam, time] on the MKN times for
+    # the values [sample, variable] of the box variables (in the order of the box)
+    def predict(self, values):
+        x = self.box.to_unit(np.atleast_2d(values))
+        k = kernel(x, self.x, self.length_scales)
+        gp_var = np.maximum(
+            1.0 - np.sum(solve_triangular(self.chol, k.T, lower=True) ** 2, axis=0),
+            0.0,
+        )
+        coeffs = (k @ self.alpha).reshape(len(x), *self.basis.shape[:2])
+        mags = np.matmul(coeffs.transpose(1, 0, 2), self.basis).transpose(1, 0, 2)
+        mags += self.mean
+        np.minimum(mags, self.mag_limit, out=mags)
+        sigma = gp_var[:, None, None] * self.basis_var
+        sigma += self.pca_var
+        return mags, np.sqrt(sigma, out=sigma)
+
+    # Error of the emulator on the samples of another store of the same box: largest
+    # and root mean square magnitude difference, and fraction within the predicted
+    # two standard deviations, where the magnitudes are brighter than mag_max
+    def validate(self, path, mag_max=30.0):
+        store = ChunkStore(path)
+        mags_true = store.read("mag")
+        mags, sigma = self.predict(store.read("values"))
+        mask = mags_true < mag_max
+        diff = np.abs(mags - mags_true)[mask]
+        return {
+            "max": float(np.max(diff)),
+            "rms": float(np.sqrt(np.mean(diff**2))),
+            "within_2sigma": float(np.mean(diff <= 2 * sigma[mask])),
+        }
@@ -1,12 +1,14 @@
 import json
 import os
 import sys
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
 
 import numpy as np
 from scipy import interpolate, integrate
 
-from . import utils
+from . import instrumentation, utils
 
 ###-------------------------------------------------------------------------------------------------
 # ------Reading data---------------------------------------------------------------------------------
@@ -50,6 +52,84 @@ def read_filters(
         sys.exit("Wrong usage for filters. Choose from 'measures' or 'properties'.")
 
 
+class FilterRegistry(Mapping):
+    """
+    Filter dictionary compiled from its JSON file into a binary table, sorted by
+    wavelength key, with the columns: lam (key in nm), lambda (wavelength in m),
+    active and plot flags, name (joined by "_") and the JSON record of the full entry.
+    The table is memory-mapped from the cache directory and reads as the dictionary
+    {lam: entry}; entries are decoded at the first access and shared by every
+    registry of the same file.
+    """
+
+    def __init__(self, table, entries=None):
+        self.table = table
+        self.lams = np.asarray(table["lam"])
+        self.lambdas = table["lambda"]
+        self.names = table["name"]
+        self.active = table["active"]
+        self.plot = table["plot"]
+        self.entries = {} if entries is None else entries
+
+    @classmethod
+    def compile(cls, filter_dict_path):
+        with open(filter_dict_path, "r") as fi:
+            dic_filt = json.load(fi)
+        keys = sorted(dic_filt.keys(), key=int)
+        names = [
+            "_".join(name) if isinstance(name, list) else str(name)
+            for name in [dic_filt[key].get("name", "") for key in keys]
+        ]
+        records = [json.dumps(dic_filt[key]) for key in keys]
+        table = np.zeros(
+            len(keys),
+            dtype=[
+                ("lam", "i8"),
+                ("lambda", "f8"),
+                ("active", "i1"),
+                ("plot", "i1"),
+                ("name", f"U{max([len(name) for name in names] + [1])}"),
+                ("record", f"U{max([len(record) for record in records] + [1])}"),
+            ],
+        )
+        table["lam"] = [int(key) for key in keys]
+        table["lambda"] = [dic_filt[key]["lambda"] for key in keys]
+        table["active"] = [dic_filt[key].get("active", 1) for key in keys]
+        table["plot"] = [dic_filt[key].get("plot", 1) for key in keys]
+        table["name"] = names
+        table["record"] = records
+        return table
+
+    def __getitem__(self, lam):
+        if lam not in self.entries:
+            idx = np.searchsorted(self.lams, lam)
+            if idx == len(self.lams) or self.lams[idx] != lam:
+                raise KeyError(lam)
+            self.entries[lam] = json.loads(self.table["record"][idx])
+        return self.entries[lam]
+
+    def __contains__(self, lam):
+        idx = np.searchsorted(self.lams, lam)
+        return idx < len(self.lams) and self.lams[idx] == lam
+
+    def __iter__(self):
+        return iter(self.lams)
+
+    def __len__(self):
+        return len(self.lams)
+
+    def select(self, lams):
+        if len(lams) == len(self.lams) and np.array_equal(self.lams, lams):
+            return self
+        return FilterRegistry(
+            self.table[np.isin(self.lams, lams)], entries=self.entries
+        )
+
+
+# registries already loaded in this process, keyed by file
+_filter_registries = {}
+
+
 def read_filter_properties(filter_dict="telescopes", filter_dict_path=None):
     # load the filter informations
     if filter_dict_path is None:
@@ -58,10 +138,188 @@ def read_filter_properties(filter_dict="telescopes", filter_dict_path=None):
             "filter_dictionary",
             filter_dict + ".json",
         )
-    with open(filter_dict_path, "r") as fi:
-        dic_filt = json.load(fi)
-    lams = np.sort(np.asarray(list(dic_filt.keys()), dtype=int))
-    return {lam: dic_filt[str(lam)] for lam in lams}, lams, {}
+    stat = os.stat(filter_dict_path)
+    key = (os.path.abspath(filter_dict_path), stat.st_size, stat.st_mtime_ns)
+    instrumentation.cache("filter_registry", key in _filter_registries)
+    if key not in _filter_registries:
+        _filter_registries[key] = FilterRegistry(
+            utils.cached_array(
+                os.path.basename(filter_dict_path),
+                key,
+                lambda: FilterRegistry.compile(filter_dict_path),
+                mmap_mode="r",
+            )
+        )
+    registry = _filter_registries[key]
+    return registry, registry.lams, {}
+
+
+def select_filters(dic_filt, lams):
+    # subset of a filter dictionary (a view for registries)
+    if isinstance(dic_filt, FilterRegistry):
+        return dic_filt.select(lams)
+    return {lam: dic_filt[lam] for lam in lams}
+
+
+def filter_dict_from_filenames(filter_data_path):
+    # build the filter dictionary from the names of the data files, which are formatted
+    # as mag_<name>_band_<band>_lam_<wavelength in Angstrom>_type_<AB or vega>.txt
+    filter_dict = {}
+    for filename in sorted(os.listdir(filter_data_path)):
+        _, name, _, band, _, lambd, _, mtype = filename[:-4].split("_")
+        lam = str(int(lambd) // 10)
+
+        if lam not in filter_dict:
+            filter_dict[lam] = {
+                "band": [],
+                "filename": [],
+                "lambdas": [],
+                "name": [],
+                "type": [],
+            }
+        filter_dict[lam]["band"].append(band)
+        filter_dict[lam]["filename"].append(filename)
+        filter_dict[lam]["lambdas"].append(float(lambd) * 1e-10)
+        filter_dict[lam]["name"].append(name)
+        filter_dict[lam]["type"].append(mtype)
+        filter_dict[lam]["lambda"] = np.mean(np.array(filter_dict[lam]["lambdas"]))
+    return filter_dict
+
+
+class PhotometryTable(Mapping):
+    """
+    Measured magnitudes stored as contiguous columns (time, mag, sigma and the index
+    of the band in lams), with the rows of each band contiguous. The table reads as
+    the dictionary {lam: {"time", "mag", "sigma", "name"}} of the bands with at least
+    one measure, whose arrays are views of the columns. Selections are boolean masks
+    over the rows, so no deep copy of the data is needed.
+    """
+
+    def __init__(self, lams, names, time, mag, sigma, band):
+        self.lams = np.asarray(lams)
+        self.names = list(names)
+        self.time = np.asarray(time, dtype=float)
+        self.mag = np.asarray(mag, dtype=float)
+        self.sigma = np.asarray(sigma, dtype=float)
+        self.band = np.asarray(band, dtype=int)
+        # selections keep the order of the rows, so only new tables may need sorting
+        if np.any(self.band[1:] < self.band[:-1]):
+            order = np.argsort(self.band, kind="stable")
+            self.time, self.mag, self.sigma, self.band = (
+                self.time[order],
+                self.mag[order],
+                self.sigma[order],
+                self.band[order],
+            )
+        bounds = np.searchsorted(self.band, np.arange(len(self.lams) + 1))
+        self.bands = {
+            lam: {
+                "time": self.time[bounds[k] : bounds[k + 1]],
+                "mag": self.mag[bounds[k] : bounds[k + 1]],
+                "sigma": self.sigma[bounds[k] : bounds[k + 1]],
+                "name": self.names[k],
+            }
+            for k, lam in enumerate(self.lams)
+            if bounds[k + 1] > bounds[k]
+        }
+
+    @classmethod
+    def from_dict(cls, measures):
+        if isinstance(measures, cls):
+            return measures
+        lams = list(measures.keys())
+        return cls(
+            lams,
+            [measures[lam].get("name", "") for lam in lams],
+            *[
+                np.concatenate([np.atleast_1d(measures[lam][key]) for lam in lams])
+                for key in ["time", "mag", "sigma"]
+            ],
+            np.repeat(
+                np.arange(len(lams)),
+                [len(np.atleast_1d(measures[lam]["time"])) for lam in lams],
+            ),
+        )
+
+    @classmethod
+    def from_filenames(cls, filter_data_path, t_min=-np.inf, t_max=np.inf, **kwargs):
+        # table of every data file in filter_data_path, with the filter dictionary built
+        # from the file names (see filter_dict_from_filenames)
+        return read_filter_measures(
+            filter_data_path, t_min, t_max, filter_dict=None, **kwargs
+        )[2]
+
+    def select(self, mask):
+        rows = np.flatnonzero(mask)
+        if len(rows) == len(self.band):
+            return self
+        return PhotometryTable(
+            self.lams,
+            self.names,
+            self.time.take(rows),
+            self.mag.take(rows),
+            self.sigma.take(rows),
+            self.band.take(rows),
+        )
+
+    def select_lams(self, lams):
+        return self.select(np.isin(self.lams, lams)[self.band])
+
+    def __getitem__(self, lam):
+        return self.bands[lam]
+
+    def __iter__(self):
+        return iter(self.bands)
+
+    def __len__(self):
+        return len(self.bands)
+
+
+def read_photometry_file(path):
+    return np.loadtxt(path, ndmin=2, usecols=(0, 1, 2))
+
+
+def read_photometry_files(filter_data_path, filenames, max_workers=None):
+    # parse the data files, in parallel processes for large datasets (e.g. LSST-like
+    # photometry); the parsed dataset (time, mag, sigma and the index of the file of
+    # every row) is cached in binary form, keyed by the files
+    paths = [os.path.join(filter_data_path, fname) for fname in filenames]
+    stats = [os.stat(path) for path in paths]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    def parse():
+        if max_workers > 1 and sum(stat.st_size for stat in stats) > 2**23:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                tables = list(
+                    executor.map(
+                        read_photometry_file,
+                        paths,
+                        chunksize=max(1, len(paths) // (4 * max_workers)),
+                    )
+                )
+        else:
+            tables = [read_photometry_file(path) for path in paths]
+        return np.concatenate(
+            [
+                np.concatenate([table.T, np.full((1, len(table)), i)])
+                for i, table in enumerate(tables)
+            ]
+            + [np.zeros((4, 0))],
+            axis=1,
+        )
+
+    time, mag, sigma, file_idx = utils.cached_array(
+        "photometry",
+        [
+            (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+            for path, stat in zip(paths, stats)
+        ],
+        parse,
+    )
+    return (time, mag, sigma), np.bincount(
+        file_idx.astype(int), minlength=len(paths)
+    )
 
 
 def read_filter_measures(
@@ -83,54 +341,68 @@ def read_filter_measures(
         )
 
     # load the filter information
-    dic_filt, lams, _ = read_filter_properties(
-        filter_dict=filter_dict, filter_dict_path=filter_dict_path
+    if filter_dict is None and filter_dict_path is None:
+        dic_filt = filter_dict_from_filenames(filter_data_path)
+        lams = np.sort(np.asarray(list(dic_filt.keys()), dtype=int))
+        dic_filt = {lam: dic_filt[str(lam)] for lam in lams}
+    else:
+        dic_filt, lams, _ = read_filter_properties(
+            filter_dict=filter_dict, filter_dict_path=filter_dict_path
+        )
+
+    # files of every band, in order
+    entries = [
+        (k, fname, mag_type)
+        for k, lam in enumerate(lams)
+        for fname, mag_type in zip(dic_filt[lam]["filename"], dic_filt[lam]["type"])
+    ]
+    filenames = list(dict.fromkeys(fname for _, fname, _ in entries))
+
+    # load the measured magnitudes: time, mag, sigma
+    (times, mags, sigmas), lengths = read_photometry_files(filter_data_path, filenames)
+    offsets = np.append(0, np.cumsum(lengths))
+    file_ids = [filenames.index(fname) for _, fname, _ in entries]
+    rows = np.concatenate(
+        [np.arange(offsets[i], offsets[i + 1]) for i in file_ids]
+        + [np.zeros(0, dtype=int)]
+    )
+    entry_lengths = lengths[file_ids]
+    band = np.repeat(np.array([k for k, _, _ in entries], dtype=int), entry_lengths)
+    times, mags, sigmas = times[rows], mags[rows], sigmas[rows]
+
+    # if the magnitude type is vega then convert the magnitudes to AB
+    mags = mags + np.repeat(
+        np.array(
+            [
+                get_corr_vega_to_AB(lams[k]) if mag_type == "vega" else 0.0
+                for k, _, mag_type in entries
+            ]
+        ),
+        entry_lengths,
     )
 
-    # load the measured magnitudes
-    measures = {}
-    for lam in lams:
-        times_tot = np.asarray([])
-        mags_tot = np.asarray([])
-        sigmas_tot = np.asarray([])
-
-        for fname, mag_type in zip(dic_filt[lam]["filename"], dic_filt[lam]["type"]):
-            # time, mag, sigma
-            times, mags, sigmas = np.loadtxt(
-                os.path.join(filter_data_path, fname), unpack=True, ndmin=1
-            )
-            t_mask = np.logical_and(times > t_min, times < t_max)
-            times = np.atleast_1d(times[t_mask])
-            mags = np.atleast_1d(mags[t_mask])
-            sigmas = np.atleast_1d(sigmas[t_mask])
-
-            # if the magnitude type is vega then convert the magnitudes to AB
-            if mag_type == "vega":
-                mags += get_corr_vega_to_AB(lam)
-
-            if upper_limits:
-                times_tot = np.append(times_tot, times)
-                mags_tot = np.append(mags_tot, mags)
-                sigmas_tot = np.append(sigmas_tot, sigmas)
-            else:
-                mask_upper = sigmas > 0
-                times_tot = np.append(times_tot, times[mask_upper])
-                mags_tot = np.append(mags_tot, mags[mask_upper])
-                sigmas_tot = np.append(sigmas_tot, sigmas[mask_upper])
-
-        # if dered_correction is 'True' it corrects the magnitudes [M_dered = M - correction]
-        if dered_correction:
-            mags_tot -= dered_CCM(np.asarray([lam]), R_V=R_V, EBV=EBV, A_V=A_V)
-
-        if len(times_tot):
-            measures[lam] = {
-                "time": times_tot,
-                "mag": mags_tot,
-                "sigma": sigmas_tot,
-                "name": "_".join(dic_filt[lam]["name"]),
-            }
-        else:
-            del dic_filt[lam]
+    mask = np.logical_and(times > t_min, times < t_max)
+    if not upper_limits:
+        mask = np.logical_and(mask, sigmas > 0)
+
+    # if dered_correction is 'True' it corrects the magnitudes [M_dered = M - correction]
+    if dered_correction:
+        mags = mags - np.array(
+            [
+                dered_CCM(np.asarray([lam]), R_V=R_V, EBV=EBV, A_V=A_V)[0]
+                for lam in lams
+            ]
+        )[band]
+
+    measures = PhotometryTable(
+        lams,
+        ["_".join(dic_filt[lam]["name"]) for lam in lams],
+        times[mask],
+        mags[mask],
+        sigmas[mask],
+        band[mask],
+    )
+    dic_filt = select_filters(dic_filt, [lam for lam in lams if lam in measures])
 
     assert list(dic_filt.keys()) == list(measures.keys())
 
@@ -337,6 +609,77 @@ def calc_lum_iso_from_mags(mags, dic_filt, distance):
     return integrate.simps(lum_lams, np.array(lambdas), axis=0)
 
 
+# The photosphere and the shells emit blackbody spectra, whose integral over frequency
+# is sigma_SB * T^4 / pi: the isotropized luminosity then follows from the lightcurve
+# variables with no wavelength sampling, and it does not depend on the redshift
+def calc_lum_iso(
+    flux_factors,
+    radius_photo,
+    T_photo=None,
+    lum_shells=None,
+    T_shells=None,
+    omegas=None,
+):
+    flux = np.zeros_like(radius_photo)
+    if T_photo is not None:
+        flux += np.where(
+            radius_photo > 0, radius_photo**2 * utils.sigma_SB * T_photo**4, 0
+        )
+    if lum_shells is not None and T_shells is not None and omegas is not None:
+        flux += (
+            np.where(T_shells != 0, lum_shells / omegas[None, :, None, None], 0)
+            .sum(axis=-1)
+            .sum(axis=0)
+        )
+    return (
+        4.0
+        * (
+            flux.T * flux_factors[: len(flux_factors) // 2][None, :]
+            + flux[::-1].T * flux_factors[len(flux_factors) // 2 :][None, :]
+        ).sum(axis=-1)
+    )
+
+
+# Log-spaced wavelengths (in meters), by default spanning the iso_calc dictionary range
+def log_wavelength_grid(num=200, lambda_min=2.0e-9, lambda_max=3.0e-4):
+    return np.logspace(np.log10(lambda_min), np.log10(lambda_max), num=num)
+
+
+# Spectral cross-check of calc_lum_iso: the flux density is sampled on the given
+# wavelengths (or on a log-spaced grid with that many points) and integrated in log(lambda)
+def calc_lum_iso_from_spectrum(
+    flux_factors,
+    wavelengths,
+    redshift,
+    radius_photo,
+    T_photo=None,
+    lum_shells=None,
+    T_shells=None,
+    omegas=None,
+):
+    if np.isscalar(wavelengths):
+        wavelengths = log_wavelength_grid(int(wavelengths))
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    # nu * L_nu at unit distance
+    lum_lams = (
+        calc_sed(
+            flux_factors,
+            wavelengths,
+            1.0,
+            redshift,
+            radius_photo,
+            T_photo=T_photo,
+            lum_shells=lum_shells,
+            T_shells=T_shells,
+            omegas=omegas,
+        )
+        * utils.fourpi
+        * utils.c
+        / (100.0 * wavelengths)
+    )
+    return integrate.simps(lum_lams, np.log(wavelengths), axis=-1)
+
+
 ###-------------------------------------------------------------------------------------------------
 # ------magnitude filter calculation-----------------------------------------------------------------
 ###-------------------------------------------------------------------------------------------------
@@ -346,7 +689,13 @@ def planckian_help(val):
     return (val > 10e-15) * (np.exp(val) - 1) + (val <= 10e-15) * val
 
 
-def planckian(nu, T_plk):
+# with lookup, x^3 / (e^x - 1) is interpolated from a table (planck.py) instead of
+# evaluating the exponential, with relative error below 1e-5
+def planckian(nu, T_plk, lookup=False):
+    if lookup:
+        from .planck import planckian as planckian_lookup
+
+        return planckian_lookup(nu, T_plk)
     return (
         2.0
         * utils.h
@@ -356,44 +705,291 @@ def planckian(nu, T_plk):
     )
 
 
-def calc_fnu(
-    flux_factors,
-    lambda_meters,
-    distance,
-    redshift,
+# Flux density of each angular bin (photosphere and optically thin shells) at the source
+# frame frequency nu, which can be an array: its axes are then leading the bins and time ones
+def calc_fnu_bins(
+    nu,
     radius_photo,
     T_photo=None,
     lum_shells=None,
     T_shells=None,
     omegas=None,
+    planck_lookup=False,
 ):
-    fnu_cont = np.zeros_like(radius_photo)
+    nu = np.asarray(nu)
+    fnu_cont = np.zeros(nu.shape + radius_photo.shape)
     if T_photo is not None:
         fnu_cont += np.where(
             radius_photo > 0,
             radius_photo**2
-            * planckian(utils.c / (100.0 * lambda_meters / (1.0 + redshift)), T_photo),
+            * planckian(
+                nu.reshape(nu.shape + (1,) * radius_photo.ndim),
+                T_photo,
+                lookup=planck_lookup,
+            ),
             0,
         )
     if lum_shells is not None and T_shells is not None and omegas is not None:
-        mask_zeroes = T_shells != 0
-        fnu_cont_tmp = np.zeros_like(T_shells)
-        fnu_cont_tmp[mask_zeroes] = (
-            lum_shells
-            / (omegas[None, :, None, None] * utils.sigma_SB * T_shells**4)
-            * planckian(utils.c / (100.0 * lambda_meters / (1.0 + redshift)), T_shells)
-        )[mask_zeroes]
-        fnu_cont += fnu_cont_tmp.sum(axis=-1).sum(axis=0)
+        fnu_cont += (
+            np.where(
+                T_shells != 0,
+                lum_shells
+                / (omegas[None, :, None, None] * utils.sigma_SB * T_shells**4)
+                * planckian(
+                    nu.reshape(nu.shape + (1,) * T_shells.ndim),
+                    T_shells,
+                    lookup=planck_lookup,
+                ),
+                0,
+            )
+            .sum(axis=-1)
+            .sum(axis=-3)
+        )
+    return fnu_cont
+
+
+# Sum of the bins flux densities weighted by the flux factors of the two hemispheres
+@instrumentation.timed("projection")
+def project_fnu(fnu_cont, flux_factors):
+    fnu_cont = np.swapaxes(fnu_cont, -1, -2)
     return (
-        (
-            fnu_cont.T * flux_factors[: len(flux_factors) // 2][None, :]
-            + fnu_cont[::-1].T * flux_factors[len(flux_factors) // 2 :][None, :]
-        ).sum(axis=-1)
+        fnu_cont * flux_factors[: len(flux_factors) // 2]
+        + fnu_cont[..., ::-1] * flux_factors[len(flux_factors) // 2 :]
+    ).sum(axis=-1)
+
+
+def calc_fnu(
+    flux_factors,
+    lambda_meters,
+    distance,
+    redshift,
+    radius_photo,
+    T_photo=None,
+    lum_shells=None,
+    T_shells=None,
+    omegas=None,
+    planck_lookup=False,
+):
+    return (
+        project_fnu(
+            calc_fnu_bins(
+                utils.c / (100.0 * lambda_meters / (1.0 + redshift)),
+                radius_photo,
+                T_photo=T_photo,
+                lum_shells=lum_shells,
+                T_shells=T_shells,
+                omegas=omegas,
+                planck_lookup=planck_lookup,
+            ),
+            flux_factors,
+        )
         * (1.0 + redshift)
         / distance**2
     )
 
 
+# Flux density F_nu(t, lambda) on an array of wavelengths (in meters), evaluated in
+# chunks of wavelengths (by default of ~1M elements of the intermediate arrays); with
+# filename, the result is written to (and returned as) a memory-mapped .npy file
+def calc_sed(
+    flux_factors,
+    wavelengths,
+    distance,
+    redshift,
+    radius_photo,
+    T_photo=None,
+    lum_shells=None,
+    T_shells=None,
+    omegas=None,
+    planck_lookup=False,
+    filename=None,
+    chunk_size=None,
+):
+    wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+    shape = (radius_photo.shape[-1], len(wavelengths))
+    if filename is None:
+        sed = np.empty(shape)
+    else:
+        sed = np.lib.format.open_memmap(filename, mode="w+", dtype=float, shape=shape)
+    if chunk_size is None:
+        chunk_size = max(
+            1, 2**20 // (radius_photo.size if T_shells is None else T_shells.size)
+        )
+
+    for i in range(0, len(wavelengths), chunk_size):
+        sed[:, i : i + chunk_size] = (
+            project_fnu(
+                calc_fnu_bins(
+                    utils.c / (100.0 * wavelengths[i : i + chunk_size] / (1.0 + redshift)),
+                    radius_photo,
+                    T_photo=T_photo,
+                    lum_shells=lum_shells,
+                    T_shells=T_shells,
+                    omegas=omegas,
+                    planck_lookup=planck_lookup,
+                ),
+                flux_factors,
+            ).T
+            * (1.0 + redshift)
+            / distance**2
+        )
+    if filename is not None:
+        sed.flush()
+    return sed
+
+
+class FilterResponses:
+    """
+    Synthetic photometry weights of the filters with a transmission curve (the
+    "transmission" entry of the filter dictionary: a file name in the transmission
+    data path, or a list of them, one per instrument, which are averaged). The curves
+    (two columns: wavelength in nm and transmission) are sampled on a shared grid of
+    wavelengths, made of num log-spaced points across each of them, and turned into a
+    matrix of quadrature weights: the AB band flux density <F_nu> of all the filters
+    is the product of the weights with F_nu evaluated once on the grid.
+    """
+
+    def __init__(self, lams, wavelengths, weights):
+        self.lams = list(lams)
+        self.wavelengths = wavelengths
+        self.weights = weights
+
+    @classmethod
+    def from_filters(cls, dic_filt, lams, transmission_data_path, num=32):
+        curves = {}
+        for lam in lams:
+            filenames = dic_filt[lam].get("transmission")
+            if filenames is None:
+                continue
+            if isinstance(filenames, str):
+                filenames = [filenames]
+            curves[lam] = [
+                utils.loadtxt_cached(
+                    os.path.join(transmission_data_path, filename), unpack=True
+                )[:2]
+                for filename in filenames
+            ]
+        if not curves:
+            return None
+
+        # wavelengths in m, on num log-spaced points across the support of every curve;
+        # where curves overlap, points closer than half the finest of their steps are
+        # dropped, so that the grid does not grow with the number of overlapping filters
+        supports = np.log(
+            [
+                [wave[trans > 0].min() * 1e-9, wave[trans > 0].max() * 1e-9]
+                for curve in curves.values()
+                for wave, trans in curve
+            ]
+        )
+        log_waves = np.unique(
+            np.concatenate([np.linspace(lo, hi, num) for lo, hi in supports])
+        )
+        covered = (log_waves >= supports[:, :1] - 1e-12) & (
+            log_waves <= supports[:, 1:] + 1e-12
+        )
+        steps = np.where(
+            covered, (supports[:, 1:] - supports[:, :1]) / (num - 1), np.inf
+        ).min(axis=0)
+        keep = [0]
+        for i in range(1, len(log_waves) - 1):
+            if log_waves[i] - log_waves[keep[-1]] >= 0.5 * steps[i]:
+                keep.append(i)
+        wavelengths = np.exp(log_waves[keep + [len(log_waves) - 1]])
+        # <F_nu> = int(F_nu T dlog(lambda)) / int(T dlog(lambda)), photon counting,
+        # with the trapezoidal rule in log(lambda)
+        dlog = np.diff(np.log(wavelengths))
+        quad = np.zeros_like(wavelengths)
+        quad[:-1] += 0.5 * dlog
+        quad[1:] += 0.5 * dlog
+        weights = np.zeros((len(curves), len(wavelengths)))
+        for row, curve in zip(weights, curves.values()):
+            for wave, trans in curve:
+                weight = quad * np.interp(
+                    wavelengths, wave * 1e-9, trans, left=0.0, right=0.0
+                )
+                row += weight / weight.sum() / len(curve)
+        return cls(curves.keys(), wavelengths, weights)
+
+    def __contains__(self, lam):
+        return lam in self.lams
+
+    def calc_fnu(
+        self,
+        flux_factors,
+        distance,
+        redshift,
+        radius_photo,
+        T_photo=None,
+        lum_shells=None,
+        T_shells=None,
+        omegas=None,
+        planck_lookup=False,
+    ):
+        fnu = calc_sed(
+            flux_factors,
+            self.wavelengths,
+            distance,
+            redshift,
+            radius_photo,
+            T_photo=T_photo,
+            lum_shells=lum_shells,
+            T_shells=T_shells,
+            omegas=omegas,
+            planck_lookup=planck_lookup,
+        ) @ self.weights.T
+        return {lam: fnu[:, i] for i, lam in enumerate(self.lams)}
+
+
+# Model magnitudes of every filter at the model times: filters with a transmission
+# curve in responses are integrated over their passband, the others are evaluated at
+# their central wavelength
+@instrumentation.timed("photometry")
+def calc_model_mags(
+    flux_factors,
+    lams,
+    dic_filt,
+    distance,
+    redshift,
+    radius_photo,
+    T_photo=None,
+    lum_shells=None,
+    T_shells=None,
+    omegas=None,
+    planck_lookup=False,
+    responses=None,
+):
+    lightcurve_vars = dict(
+        T_photo=T_photo,
+        lum_shells=lum_shells,
+        T_shells=T_shells,
+        omegas=omegas,
+        planck_lookup=planck_lookup,
+    )
+    band_fnu = (
+        {}
+        if responses is None
+        else responses.calc_fnu(
+            flux_factors, distance, redshift, radius_photo, **lightcurve_vars
+        )
+    )
+    return {
+        lam: (
+            -2.5 * np.log10(band_fnu[lam]) - 48.6
+            if lam in band_fnu
+            else m_filter(
+                flux_factors,
+                dic_filt[lam]["lambda"],
+                distance,
+                redshift,
+                radius_photo,
+                **lightcurve_vars,
+            )
+        )
+        for lam in lams
+    }
+
+
 def m_filter(
     flux_factors,
     lambda_meters,
@@ -404,6 +1000,7 @@ def m_filter(
     lum_shells=None,
     T_shells=None,
     omegas=None,
+    planck_lookup=False,
 ):
     return (
         -2.5
@@ -418,6 +1015,7 @@ def m_filter(
                 lum_shells=lum_shells,
                 T_shells=T_shells,
                 omegas=omegas,
+                planck_lookup=planck_lookup,
             )
         )
         - 48.6
@@ -441,11 +1039,27 @@ def calc_magnitudes(
     lum_shells=None,
     T_shells=None,
     omegas=None,
+    planck_lookup=False,
     measures=False,
     mag=None,
     t_start_filter=None,
+    responses=None,
     **kwargs,
 ):
+    model_mags = calc_model_mags(
+        flux_factors,
+        lams,
+        dic_filt,
+        distance,
+        redshift,
+        radius_photo,
+        T_photo=T_photo,
+        lum_shells=lum_shells,
+        T_shells=T_shells,
+        omegas=omegas,
+        planck_lookup=planck_lookup,
+        responses=responses,
+    )
 
     if measures:
         # calculate the magnitudes at the times specified in mag
@@ -455,17 +1069,7 @@ def calc_magnitudes(
                 "mag": np.interp(
                     (mag[lam]["time"] - t_start_filter) * utils.day2sec,
                     times,
-                    m_filter(
-                        flux_factors,
-                        dic_filt[lam]["lambda"],
-                        distance,
-                        redshift,
-                        radius_photo,
-                        T_photo=T_photo,
-                        lum_shells=lum_shells,
-                        T_shells=T_shells,
-                        omegas=omegas,
-                    ),
+                    model_mags[lam],
                 ),
             }
             for lam in lams
@@ -473,23 +1077,7 @@ def calc_magnitudes(
 
     else:
         # calculate the magnitudes at the specified times array
-        return {
-            lam: {
-                "time": times,
-                "mag": m_filter(
-                    flux_factors,
-                    dic_filt[lam]["lambda"],
-                    distance,
-                    redshift,
-                    radius_photo,
-                    T_photo=T_photo,
-                    lum_shells=lum_shells,
-                    T_shells=T_shells,
-                    omegas=omegas,
-                ),
-            }
-            for lam in lams
-        }
+        return {lam: {"time": times, "mag": model_mags[lam]} for lam in lams}
 
 
 ###-------------------------------------------------------------------------------------------------
@@ -513,6 +1101,7 @@ def prep_sigma(sigma, mag_diff=-1):
     return Sigma
 
 
+@instrumentation.timed("residuals")
 def calc_residuals(
     flux_factors,
     times,
@@ -527,26 +1116,32 @@ def calc_residuals(
     lum_shells=None,
     T_shells=None,
     omegas=None,
+    planck_lookup=False,
     sigma_sys=0,
+    responses=None,
     **kwargs,
 ):
+    model_mags = calc_model_mags(
+        flux_factors,
+        lams,
+        dic_filt,
+        distance,
+        redshift,
+        radius_photo,
+        T_photo=T_photo,
+        lum_shells=lum_shells,
+        T_shells=T_shells,
+        omegas=omegas,
+        planck_lookup=planck_lookup,
+        responses=responses,
+    )
 
     # calculate the difference in magnitudes at the times specified in mag
     mag_diffs = {
         lam: np.interp(
             (mag[lam]["time"] - t_start_filter) * utils.day2sec,
             times,
-            m_filter(
-                flux_factors,
-                dic_filt[lam]["lambda"],
-                distance,
-                redshift,
-                radius_photo,
-                T_photo=T_photo,
-                lum_shells=lum_shells,
-                T_shells=T_shells,
-                omegas=omegas,
-            ),
+            model_mags[lam],
         )
         - mag[lam]["mag"]
         for lam in lams
@@ -567,12 +1162,11 @@ def calc_residuals(
 
 
 def limit_lams(dic_filt, lams, mag, lam_list=None, lam_min=None, lam_max=None):
-    dic_filt = deepcopy(dic_filt)
-    lams = deepcopy(lams)
-    mag = deepcopy(mag)
+    if mag:
+        mag = PhotometryTable.from_dict(mag)
 
     if lam_list is None and lam_min is None and lam_max is None:
-        return dic_filt, lams, mag
+        return select_filters(dic_filt, lams), np.array(lams), mag
     else:
         if lam_min is None:
             lam_min = 0
@@ -580,39 +1174,33 @@ def limit_lams(dic_filt, lams, mag, lam_list=None, lam_min=None, lam_max=None):
             lam_max = np.inf
         if lam_list is None:
             lam_list = lams
-
-        for lam in lams:
-            if lam not in lam_list or lam < lam_min or lam > lam_max:
-                del dic_filt[lam]
-                if mag:
-                    del mag[lam]
+        lam_list = set(lam_list)
+
+        dic_filt = select_filters(
+            dic_filt,
+            [
+                lam
+                for lam in lams
+                if lam in lam_list and lam >= lam_min and lam <= lam_max
+            ],
+        )
+        if mag:
+            mag = mag.select_lams(list(dic_filt.keys()))
 
         return dic_filt, np.sort(np.asarray(list(dic_filt.keys()), dtype=int)), mag
 
 
 def limit_mags(dic_filt, lams, mag, mag_min=None, mag_max=None):
-    dic_filt = deepcopy(dic_filt)
-    lams = deepcopy(lams)
-    mag = deepcopy(mag)
-
     if not mag or (mag_min is None and mag_max is None):
-        return dic_filt, lams, mag
+        return select_filters(dic_filt, lams), np.array(lams), mag
     elif mag_min is None:
         mag_min = -np.inf
     elif mag_max is None:
         mag_max = np.inf
 
-    for lam in lams:
-        ids = np.nonzero(
-            np.logical_and(mag[lam]["mag"] >= mag_min, mag[lam]["mag"] <= mag_max)
-        )[0]
-        if not len(ids):
-            del dic_filt[lam]
-            del mag[lam]
-        else:
-            mag[lam]["mag"] = mag[lam]["mag"][ids]
-            mag[lam]["time"] = mag[lam]["time"][ids]
-            mag[lam]["sigma"] = mag[lam]["sigma"][ids]
+    mag = PhotometryTable.from_dict(mag)
+    mag = mag.select(np.logical_and(mag.mag >= mag_min, mag.mag <= mag_max))
+    dic_filt = select_filters(dic_filt, [lam for lam in lams if lam in mag])
 
     return dic_filt, np.sort(np.asarray(list(dic_filt.keys()), dtype=int)), mag
 
@@ -634,7 +1222,7 @@ def prep_inj_mag(
     if mag is None:
         injection_mag = {}
     else:
-        injection_mag = deepcopy(mag)
+        injection_mag = {lam: deepcopy(dict(mag[lam])) for lam in mag}
 
     if mag is None or not mag:
         assert (
@@ -0,0 +1,164 @@
+import itertools
+import sys
+
+import numpy as np
+
+from .store import ChunkStore, StoredModel, fill
+from .utils import package_version
+
+# Light curves precomputed on a grid of variables, for the analyses scanning the same
+# grids repeatedly (detectability maps, quick-look fits):
+# - generate_grid (or the `xkn grid` command) evaluates MKN on every node of the grid,
+#   in parallel processes, into a store of memory-mapped chunks (store.py) indexed by
+#   the grid and the configuration, resumed after an interruption by running it again;
+# - GridModel interpolates the stored magnitudes and bolometric luminosities
+#   multilinearly between the nodes, with the calc_magnitudes and calc_log_like of
+#   MKN (NaN outside the grid), reading from the chunks only the nodes it needs.
+# The grid is a dictionary {component: {variable: [values]}} of increasing node values,
+# e.g. {"dynamics": {"m_ej": [0.01, 0.02, 0.05]}, "glob": {"view_angle": [0, 0.5, 1]}},
+# whose nodes are stored in C order (the last variable changing fastest).
+
+
+def grid_axes(grid):
+    names = [[comp, var] for comp in grid for var in grid[comp]]
+    axes = [np.asarray(grid[comp][var], dtype=float) for comp, var in names]
+    for (comp, var), axis in zip(names, axes):
+        if np.any(np.diff(axis) <= 0):
+            sys.exit(f"The grid values of {var} ({comp}) are not increasing!")
+    return names, axes
+
+
+# Evaluate the outputs (see store.py) of all the nodes of the grid into the store at
+# path, resuming an interrupted evaluation with the same arguments; magnitudes fainter
+# than mag_limit are clipped to it.
+def generate_grid(
+    path,
+    shell_params,
+    glob_params,
+    mkn_vars,
+    grid,
+    chunk_size=64,
+    outputs=("mag", "lum_bol"),
+    mag_limit=40.0,
+    inj_dict=None,
+    max_workers=None,
+    logger=None,
+):
+    from .mkn import MKN
+
+    names, axes = grid_axes(grid)
+    mkn = MKN(
+        shell_params,
+        {**glob_params, "trace_file": None},
+        inj_dict=inj_dict,
+        log_level="WARNING",
+    )
+    if "mag" in outputs and mkn.lams is None:
+        sys.exit("No filters to compute the magnitudes of the grid!")
+    num = int(np.prod([len(axis) for axis in axes]))
+    store = ChunkStore(
+        path,
+        {
+            "version": package_version(),
+            "shell_params": shell_params,
+            "glob_params": glob_params,
+            "inj_dict": inj_dict,
+            "mkn_vars": mkn_vars,
+            "grid": grid,
+            "outputs": list(outputs),
+            "chunk_size": chunk_size,
+            "mag_limit": mag_limit,
+            "lams": np.asarray(mkn.lams).tolist() if "mag" in outputs else None,
+            "times": np.asarray(mkn.times).tolist(),
+        },
+        num_chunks=-(-num // chunk_size),
+    )
+    design = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(num, -1)
+    fill(
+        store,
+        shell_params,
+        glob_params,
+        mkn_vars,
+        names,
+        design,
+        chunk_size,
+        inj_dict=inj_dict,
+        outputs=outputs,
+        mag_limit=mag_limit,
+        max_workers=max_workers,
+        logger=logger,
+    )
+    return store
+
+
+class GridModel(StoredModel):
+    """
+    Multilinear interpolation of the light curves of the grid store at path, with the
+    MKN interface (calc_magnitudes, calc_log_like) and calc_lum_bol.
+    """
+
+    def __init__(self, path, log_level="WARNING"):
+        self.store = ChunkStore(path)
+        if self.store.missing():
+            sys.exit(f"The grid {path} is incomplete: run generate_grid again!")
+        metadata = self.store.metadata
+        names, self.axes = grid_axes(metadata["grid"])
+        self.shape = tuple(len(axis) for axis in self.axes)
+        self.chunk_size = metadata["chunk_size"]
+        super().__init__(self.store, names, log_name="GRID-MKN", log_level=log_level)
+
+    # nodes (indices in the store) and weights [corner, sample] of the interpolation
+    # for the values [sample, variable], with NaN weights outside the grid
+    def corners(self, values):
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        lower, weights = [], []
+        for axis, x in zip(self.axes, values.T):
+            i = np.clip(np.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 2)
+            if len(axis) == 1:
+                weight = np.zeros(len(x))
+            else:
+                weight = (x - axis[i]) / (axis[i + 1] - axis[i])
+            weight[(x < axis[0]) | (x > axis[-1])] = np.nan
+            lower.append(np.maximum(i, 0))
+            weights.append(weight)
+
+        nodes, node_weights = [], []
+        for upper in itertools.product(
+            *[[0, 1] if len(axis) > 1 else [0] for axis in self.axes]
+        ):
+            nodes.append(
+                np.ravel_multi_index(
+                    [i + shift for i, shift in zip(lower, upper)], self.shape
+                )
+            )
+            node_weights.append(
+                np.prod(
+                    [
+                        weight if shift else 1.0 - weight
+                        for weight, shift in zip(weights, upper)
+                    ],
+                    axis=0,
+                )
+            )
+        return nodes, node_weights
+
+    # the stored output name interpolated at the values [sample, variable]
+    def interpolate(self, name, values):
+        result = 0.0
+        for nodes, weights in zip(*self.corners(values)):
+            rows = self.store.take(name, nodes, self.chunk_size)
+            result = result + weights.reshape((-1,) + (1,) * (rows.ndim - 1)) * rows
+        return result
+
+    def predict(self, values):
+        return self.interpolate("mag", values), None
+
+    # times, bolometric luminosity summed over the angular bins and isotropized one for
+    # the viewing angle [erg/s]
+    def calc_lum_bol(self, mkn_vars):
+        values = self.values(mkn_vars)
+        return (
+            self.times,
+            self.interpolate("lum_bol", values)[0],
+            self.interpolate("lum_bol_iso", values)[0],
+        )
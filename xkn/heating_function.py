@@ -1,8 +1,11 @@
 import os
 import sys
+from functools import lru_cache
 
 import numpy as np
-from scipy.interpolate import RegularGridInterpolator, interp2d
+
+from . import instrumentation
+from .utils import bilinear, loadtxt_cached
 
 
 class HeatingFunction(object):
@@ -27,62 +30,86 @@ class HeatingFunction(object):
             )
 
     def __call__(self, ye, time, **kwargs):
-        if ye.shape:
-            return self.heat_func(ye, time, **kwargs)[:, np.argsort(np.argsort(ye))].T
-        else:
-            return self.heat_func(ye, time, **kwargs)[:, 0]
+        return self.heat_func(ye, time, **kwargs)
 
 
 # specifico il nome del file di input di Lippuner+ 2015
-def interpolating_function(s, tau):
-    filename = os.path.join(
-        os.path.dirname(os.path.abspath(__file__)),
-        "interp_tables",
-        "hires_sym0_results",
-    )
-    _, s_ar, tau_ar, A, alpha, B1, beta1, B2, beta2, B3, beta3 = np.loadtxt(
+filename = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "interp_tables",
+    "hires_sym0_results",
+)
+
+ye_grid = np.asarray(
+    [
+        0.01,
+        0.04,
+        0.07,
+        0.10,
+        0.13,
+        0.16,
+        0.19,
+        0.22,
+        0.25,
+        0.29,
+        0.32,
+        0.35,
+        0.38,
+        0.41,
+        0.44,
+        0.47,
+        0.50,
+    ]
+)
+log_t_grid = np.linspace(-2.0, 2.0, num=50, endpoint=True)
+
+
+# the fit table is parsed once
+@lru_cache(maxsize=None)
+def read_fits():
+    return loadtxt_cached(
         filename, unpack=True, usecols=(0, 1, 2, 5, 6, 7, 8, 9, 10, 11, 12)
     )
 
-    ye = np.asarray(
-        [
-            0.01,
-            0.04,
-            0.07,
-            0.10,
-            0.13,
-            0.16,
-            0.19,
-            0.22,
-            0.25,
-            0.29,
-            0.32,
-            0.35,
-            0.38,
-            0.41,
-            0.44,
-            0.47,
-            0.50,
-        ]
-    )
-    t_array = np.logspace(-2.0, 2.0, num=50, endpoint=True)
+
+# log10 of the heating rate on the (log t, ye) grid, computed once for every (s, tau)
+# node of the table
+@lru_cache(maxsize=None)
+def heating_table(s, tau):
+    _, s_ar, tau_ar, A, alpha, B1, beta1, B2, beta2, B3, beta3 = read_fits()
 
     # creo una matrice direttamente dell'heating rate
-    idx = np.nonzero(
-        np.logical_and(
-            s_ar == find_nearest(s_ar, s), tau_ar == find_nearest(tau_ar, tau)
-        )
-    )[0]
-    Q = [
+    idx = np.nonzero(np.logical_and(s_ar == s, tau_ar == tau))[0]
+    t = 10.0 ** log_t_grid[:, None]
+    Q = (
         A[idx] * t ** (-alpha[idx])
         + B1[idx] * np.exp(-t / beta1[idx])
         + B2[idx] * np.exp(-t / beta2[idx])
         + B3[idx] * np.exp(-t / beta3[idx])
-        for t in t_array
-    ]
-    Q = np.log10(np.array(Q))
+    )
+    return np.log10(Q)[None]
+
+
+instrumentation.register_lru_cache("read_fits", read_fits)
+instrumentation.register_lru_cache("heating_table", heating_table)
+
+
+def interpolating_function(s, tau):
+    _, s_ar, tau_ar = read_fits()[:3]
+    table = heating_table(find_nearest(s_ar, s), find_nearest(tau_ar, tau))
+
+    # bilinear interpolation in (ye, log t), constant outside of the table, evaluated
+    # pointwise on the broadcast of ye[..., None] (e.g. the bins) and time [day]
+    def heat_func(ye, time, **kwargs):
+        return bilinear(
+            ye_grid,
+            log_t_grid,
+            table,
+            np.asarray(ye)[..., None],
+            np.log10(time),
+        )[0]
 
-    return interp2d(ye, t_array, Q, kind="linear")
+    return heat_func
 
 
 def find_nearest(array, value):
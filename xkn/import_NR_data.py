@@ -1,10 +1,66 @@
+import glob
+import os
+import sys
+
 import numpy as np
 from scipy.interpolate import interp1d
 
+from . import instrumentation
+from .angular_distribution import bin_geometry
+from .utils import loadtxt_cached
+
+# smoothed and binned profiles, keyed by file (path, modification time and size) and
+# angular grid: they do not depend on the sampled variables
+_profiles = {}
+
+
+def read_NR_data(filename):
+    # binary fast path for large NR outputs: .npy files with the columns
+    # (theta, mass, ye, vel) along the first axis, or .npz files with these keys
+    if filename.endswith(".npy"):
+        th, mass, ye, vel = np.load(filename)[:4]
+    elif filename.endswith(".npz"):
+        with np.load(filename) as data:
+            th, mass, ye, vel = [data[key] for key in ["theta", "mass", "ye", "vel"]]
+    else:
+        th, mass, ye, vel = loadtxt_cached(filename, unpack=True, usecols=(0, 1, 2, 3))
+    return [np.array(x, dtype=float) for x in (th, mass, ye, vel)]
+
 
 def importNRprofiles(filename, angles):
+    stat = os.stat(filename)
+    angles = np.asarray(angles, dtype=float)
+    key = (
+        os.path.abspath(filename),
+        stat.st_mtime_ns,
+        stat.st_size,
+        angles.shape,
+        angles.tobytes(),
+    )
+    instrumentation.cache("NR_profiles", key in _profiles)
+    if key not in _profiles:
+        if len(_profiles) >= 256:
+            _profiles.clear()
+        _profiles[key] = calc_NR_profiles(*read_NR_data(filename), angles)
+    # copies, so that the cached profiles can not be modified by the caller
+    return [profile.copy() for profile in _profiles[key]]
+
+
+def importNRdirectory(dirname, angles, pattern="*"):
+    # batch loading of the profiles of many NR simulations (e.g. for grid studies),
+    # returns a dictionary {file name: (profile_m, profile_vel, profile_ye)}
+    filenames = sorted(
+        f for f in glob.glob(os.path.join(dirname, pattern)) if os.path.isfile(f)
+    )
+    if not filenames:
+        sys.exit(f"No NR data found in {dirname} with pattern {pattern}")
+    return {
+        os.path.basename(filename): importNRprofiles(filename, angles)
+        for filename in filenames
+    }
+
 
-    th, mass, ye, vel = np.loadtxt(filename, unpack=True, usecols=(0, 1, 2, 3))
+def calc_NR_profiles(th, mass, ye, vel, angles):
 
     mask = mass < 1.0e-9
     mass[mask] = 1.0e-9
@@ -12,12 +68,13 @@ def importNRprofiles(filename, angles):
     vel[mask] = 0.1
 
     # find the central angles and bin sizes
-    th_central = [0.5 * (a[1] + a[0]) for a in angles]
+    geometry = bin_geometry(angles)
+    th_central = geometry.mid
     dth = th[0]
     if dth == 0:
         sys.exit("NR data unsupported format: input central values for angular bins")
-    th_size = [np.cos(a - dth) - np.cos(a + dth) for a in th]
-    ang_size = [np.cos(a[0]) - np.cos(a[1]) for a in angles]
+    th_size = np.cos(th - dth) - np.cos(th + dth)
+    ang_size = geometry.dcos
     # smooth the mass
     mass_smooth = smooth_array(mass)
     mass_smooth = np.sum(mass) / np.sum(mass_smooth) * mass_smooth
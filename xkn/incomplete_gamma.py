@@ -1,32 +1,125 @@
 from math import gamma
-from mpmath import mp
-from numba import njit
-import matplotlib.pyplot as plt
-import mpmath
+
 import numpy as np
 
+from .utils import set_numba_cache_dir
 
-# Compute nodes and weights (without h) for the double exponential (or
-# tanh-sinh) rule with mpmath, coonvert them to Python floats, and scale the
-# nodes for the interval (0, 1).
-with mp.workdps(30):
-    m = 5
-    h = float(mp.fadd(2 ** -mp.mpf(m) * 2, 0, prec=53, rounding="n"))
-    tmp = mpmath.calculus.quadrature.TanhSinh(mp).calc_nodes(m, 53)
-    DE_nodes = np.array(
-        [
-            float(mp.fadd(mp.mpf(0.5) * (e + mp.mpf(1)), 0, prec=53, rounding="n"))
-            for e in np.array(tmp)[:, 0]
-        ]
-    )
-    DE_weights = np.array(
-        [float(mp.fadd(e, 0, prec=53, rounding="n")) for e in np.array(tmp)[:, 1]]
-    )
+set_numba_cache_dir()
+
+from numba import njit
+
+
+def tanh_sinh_nodes(m=5):
+    # Compute nodes and weights (without h) for the double exponential (or
+    # tanh-sinh) rule with mpmath, coonvert them to Python floats, and scale the
+    # nodes for the interval (0, 1). The constants below are the output for m = 5.
+    import mpmath
+    from mpmath import mp
+
+    with mp.workdps(30):
+        h = float(mp.fadd(2 ** -mp.mpf(m) * 2, 0, prec=53, rounding="n"))
+        tmp = mpmath.calculus.quadrature.TanhSinh(mp).calc_nodes(m, 53)
+        nodes = np.array(
+            [
+                float(mp.fadd(mp.mpf(0.5) * (e + mp.mpf(1)), 0, prec=53, rounding="n"))
+                for e in np.array(tmp)[:, 0]
+            ]
+        )
+        weights = np.array(
+            [float(mp.fadd(e, 0, prec=53, rounding="n")) for e in np.array(tmp)[:, 1]]
+        )
+    return h, nodes, weights
+
+
+h = 0.0625
+DE_nodes = np.array(
+    [
+        0.5245279836525389, 0.47547201634746106, 0.573208992145294,
+        0.42679100785470603, 0.6207831597694419, 0.3792168402305582,
+        0.666571132288819, 0.33342886771118097, 0.7099760556392236,
+        0.29002394436077644, 0.7505066946896546, 0.24949330531034544,
+        0.7877922453175759, 0.21220775468242417, 0.8215883794926023,
+        0.17841162050739764, 0.851775002573571, 0.148224997426429,
+        0.8783469543168649, 0.12165304568313502, 0.9013993706716207,
+        0.09860062932837936, 0.9211096231753785, 0.07889037682462156,
+        0.9377176988152044, 0.06228230118479566, 0.9515066407567869,
+        0.04849335924321307, 0.9627843170343063, 0.037215682965693664,
+        0.9718673930263786, 0.02813260697362142, 0.9790680113551068,
+        0.020931988644893155, 0.9846833664484587, 0.015316633551541333,
+        0.9889881175933325, 0.011011882406667513, 0.9922294155837155,
+        0.007770584416284585, 0.994624215545067, 0.005375784454933052,
+        0.9963584985984136, 0.003641501401586357, 0.9975880130776636,
+        0.002411986922336323, 0.9984401590640959, 0.001559840935904063,
+        0.9990166681577168, 0.000983331842283123, 0.999396767149403,
+        0.0006032328505970504, 0.999640555960896, 0.0003594440391040223,
+        0.9997923751757588, 0.00020762482424120635, 0.9998839857997804,
+        0.00011601420021958247, 0.9999374325243902, 6.256747560982676e-05,
+        0.9999675099625412, 3.2490037458788156e-05, 0.9999837965339717,
+        1.6203466028270116e-05, 0.9999922599511354, 7.74004886458779e-06,
+        0.9999964689383315, 3.531061668557176e-06, 0.9999984662245952,
+        1.5337754048212471e-06, 0.999999367735933, 6.322640670452292e-07,
+        0.9999997535028597, 2.464971402815556e-07, 0.9999999094468563,
+        9.055314361649568e-08, 0.9999999687770392, 3.122296081311249e-08,
+        0.9999999899372516, 1.0062748399122897e-08, 0.9999999969820671,
+        3.0179328991761383e-09, 0.9999999991616809, 8.383190258710971e-10,
+        0.9999999997853939, 2.1460611369319402e-10, 0.9999999999496388,
+        5.036113837186542e-11, 0.9999999999892276, 1.0772331294521011e-11,
+        0.9999999999979123, 2.0876965620982565e-12, 0.9999999999996357,
+        3.642368632143867e-13, 0.9999999999999432, 5.681934927196096e-14,
+        0.9999999999999921, 7.867767548963265e-15, 0.999999999999999,
+        9.59609454855381e-16, 0.9999999999999999, 1.0224797704233678e-16,
+        1.0, 9.434791533646705e-18, 1.0,
+        7.469358244178614e-19,
+    ]
+)
+DE_weights = np.array(
+    [
+        1.5677814313072218, 1.5677814313072218, 1.5438811161769592,
+        1.5438811161769592, 1.4972262225410362, 1.4972262225410362,
+        1.4300083548722997, 1.4300083548722997, 1.3452788847662516,
+        1.3452788847662516, 1.2467012074518578, 1.2467012074518578,
+        1.1382722433763053, 1.1382722433763053, 1.0240449331118116,
+        1.0240449331118116, 0.9078793791548954, 0.9078793791548954,
+        0.7932427008205167, 0.7932427008205167, 0.6830685163442638,
+        0.6830685163442638, 0.5796781030877877, 0.5796781030877877,
+        0.4847580912147554, 0.4847580912147554, 0.3993847415257171,
+        0.3993847415257171, 0.3240825396115289, 0.3240825396115289,
+        0.2589046395140535, 0.2589046395140535, 0.20352399885860176,
+        0.20352399885860176, 0.15732620348436616, 0.15732620348436616,
+        0.11949741128869593, 0.11949741128869593, 0.08910313924094146,
+        0.08910313924094146, 0.0651555334325362, 0.0651555334325362,
+        0.046668208054846616, 0.046668208054846616, 0.03269873272660903,
+        0.03269873272660903, 0.022379471063648477, 0.022379471063648477,
+        0.01493783509605013, 0.01493783509605013, 0.00970722373939169,
+        0.00970722373939169, 0.0061300376320830305, 0.0061300376320830305,
+        0.0037542509774318345, 0.0037542509774318345, 0.0022250827064786427,
+        0.0022250827064786427, 0.0012733279447082382, 0.0012733279447082382,
+        0.0007018595156842423, 0.0007018595156842423, 0.0003716669362167776,
+        0.0003716669362167776, 0.0001885644297670032, 0.0001885644297670032,
+        9.139081749071013e-05, 9.139081749071013e-05, 4.21831838417576e-05,
+        4.21831838417576e-05, 1.8481813599879218e-05, 1.8481813599879218e-05,
+        7.659575852520317e-06, 7.659575852520317e-06, 2.9916615878138786e-06,
+        2.9916615878138786e-06, 1.0968835125901265e-06, 1.0968835125901265e-06,
+        3.759541186236063e-07, 3.759541186236063e-07, 1.199244278290277e-07,
+        1.199244278290277e-07, 3.543477717142195e-08, 3.543477717142195e-08,
+        9.649888896108964e-09, 9.649888896108964e-09, 2.409177325647594e-09,
+        2.409177325647594e-09, 5.482835779709498e-10, 5.482835779709498e-10,
+        1.130605534749468e-10, 1.130605534749468e-10, 2.098933540451147e-11,
+        2.098933540451147e-11, 3.4841937670261058e-12, 3.4841937670261058e-12,
+        5.134127524501421e-13, 5.134127524501421e-13, 6.663992283308765e-14,
+        6.663992283308765e-14, 7.556721775780566e-15, 7.556721775780566e-15,
+        7.420993230992217e-16, 7.420993230992217e-16, 6.252804844610456e-17,
+        6.252804844610456e-17,
+    ]
+)
+
+# signatures compiled by `xkn warmup`
+numba_signatures = {"scaled_upper_gamma": ["float64(float64, float64)"]}
 
 
 # Note this is HEAVILY optimized for handling s in (0, 1) and z in (-inf, 0).
 # For any other arguments, it will give wrong results.
-@njit(fastmath=True)
+@njit(fastmath=True, cache=True)
 def scaled_upper_gamma(s, z):
 
     if s == 0.5:
@@ -82,9 +175,14 @@ def scaled_upper_gamma(s, z):
 
 if __name__ == "__main__":
 
+    # accuracy and timing against mpmath: python -m xkn.incomplete_gamma <s>
+
     import sys
     import timeit
 
+    import matplotlib.pyplot as plt
+    from mpmath import mp
+
     mp.dps = 100
 
     s = float(sys.argv[1])
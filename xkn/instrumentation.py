@@ -0,0 +1,169 @@
+import json
+import os
+import time
+import tracemalloc
+from functools import wraps
+
+# Opt-in instrumentation of the model evaluation: wall time and number of calls of the
+# stages of MKN, Ejecta, Shell and filters, and hits and misses of the caches.
+# It is disabled by default (or enabled with XKN_INSTRUMENT=1), and stage() and
+# cache() then reduce to a check of the flag:
+#   from xkn import instrumentation
+#   instrumentation.enable()
+#   mkn.calc_log_like(mkn_vars)
+#   instrumentation.stats()               # dict
+#   instrumentation.dump("stats.jsonl")   # one JSON line per stage and cache
+#   instrumentation.reset()
+# Stages can be nested (e.g. heating within photosphere): "time" includes the nested
+# stages, "self_time" excludes them. While tracemalloc is tracing, the stages also
+# record their peak memory: the largest traced allocation above the memory in use at
+# their start, over all calls (tracemalloc.reset_peak is called at every stage start,
+# so the peak of an enclosing block has to be measured as a stage as well).
+
+enabled = os.environ.get("XKN_INSTRUMENT", "0") not in ["", "0"]
+
+# stage: [calls, time, self_time, peak_memory]
+_stages = {}
+# cache: [hits, misses]
+_caches = {}
+# functools.lru_cache functions, with the cache_info at the last reset
+_lru_caches = {}
+# time and traced memory peak of the stages nested in the ones being timed, innermost
+# last
+_open = []
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    _stages.clear()
+    _caches.clear()
+    for name, (func, _) in _lru_caches.items():
+        _lru_caches[name] = (func, func.cache_info())
+
+
+class _Stage(object):
+    __slots__ = ["name", "start", "memory"]
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _open.append([0.0, 0])
+        if tracemalloc.is_tracing():
+            self.memory = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        else:
+            self.memory = None
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        nested_time, nested_peak = _open.pop()
+        record = _stages.setdefault(self.name, [0, 0.0, 0.0, None])
+        record[0] += 1
+        record[1] += elapsed
+        record[2] += elapsed - nested_time
+        if self.memory is not None and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], nested_peak)
+            record[3] = max(record[3] or 0, peak - self.memory[0])
+            # the enclosing stage peak, since its start or its last nested stage
+            peak = max(peak, self.memory[1])
+        else:
+            peak = 0
+        if _open:
+            _open[-1][0] += elapsed
+            _open[-1][1] = max(_open[-1][1], peak)
+
+
+class _NoStage(object):
+    __slots__ = []
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_stage = _NoStage()
+
+
+# context manager timing the enclosed block as the given stage
+def stage(name):
+    return _Stage(name) if enabled else _no_stage
+
+
+# decorator timing every call of the function as the given stage
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# lookup in a cache, e.g. cache("bin_geometry", key in _bin_geometries)
+def cache(name, hit):
+    if enabled:
+        _caches.setdefault(name, [0, 0])[0 if hit else 1] += 1
+
+
+# functools.lru_cache functions are read from their cache_info
+def register_lru_cache(name, func):
+    _lru_caches[name] = (func, func.cache_info())
+    return func
+
+
+def stats():
+    caches = {
+        name: {"hits": hits, "misses": misses}
+        for name, (hits, misses) in _caches.items()
+    }
+    for name, (func, start) in _lru_caches.items():
+        info = func.cache_info()
+        caches[name] = {
+            "hits": info.hits - start.hits,
+            "misses": info.misses - start.misses,
+        }
+    for counts in caches.values():
+        lookups = counts["hits"] + counts["misses"]
+        counts["hit_rate"] = counts["hits"] / lookups if lookups else None
+    return {
+        "stages": {
+            name: {
+                "calls": calls,
+                "time": total,
+                "self_time": self_time,
+                "peak_memory": peak_memory,
+            }
+            for name, (calls, total, self_time, peak_memory) in _stages.items()
+        },
+        "caches": caches,
+    }
+
+
+# append the statistics to a JSON lines file, one line per stage and per cache, with
+# the optional extra fields (e.g. a label of the run)
+def dump(filename, **extra):
+    current = stats()
+    timestamp = time.time()
+    with open(filename, "a") as f:
+        for kind in ["stages", "caches"]:
+            for name, values in current[kind].items():
+                record = {"timestamp": timestamp, "kind": kind[:-1], "name": name}
+                f.write(json.dumps({**record, **values, **extra}) + "\n")
@@ -1,5 +1,7 @@
 import sys
+import json
 import logging
+from collections import OrderedDict
 from copy import deepcopy
 from warnings import filterwarnings
 
@@ -8,9 +10,13 @@ filterwarnings("ignore")
 import numpy as np
 
 from . import filters as flt
+from . import instrumentation
 from .angular_distribution import AngularDistribution
-from .ejecta import Ejecta
-from .plotting import plot_magnitudes
+from .delayed_acceptance import DelayedAcceptance
+from .ejecta import Ejecta, lightcurve_vars
+from .model_cache import ModelCache
+from .precision import apply_precision
+from .trace import TraceRecorder, recorded
 from .utils import (
     Mpc2cm,
     sec2day,
@@ -39,6 +45,8 @@ class MKN:
         self.set_ejecta(list(shell_params.keys()), shell_params)
         self.set_glob_params(glob_params)
         self.gen_inj_data(inj_dict)
+        self.set_recorder()
+        self.set_model_cache()
         self.logger.info("--- MKN object fully initialized. ---")
 
     #####
@@ -62,12 +70,42 @@ class MKN:
         self.logger.info("Initialized ejecta.")
 
     def set_glob_params(self, glob_params):
-        self.glob_params = glob_params
+        # resolution of the precision preset, if any (see precision.py)
+        self.glob_params = apply_precision(glob_params)
         self.set_flux_factor_func()
         self.set_angles_omegas()
         self.set_filter_data()
         self.set_redshift()
         self.set_times()
+        # tabulated Planck function in the magnitudes (see planck.py)
+        self.planck_lookup = bool(self.glob_params.get("planck_lookup"))
+
+    # calls of calc_log_like and calc_magnitudes recorded in trace_file (see trace.py)
+    def set_recorder(self):
+        if check_dict_variables(dic=(self.glob_params, ["trace_file"]), logger=None):
+            self.recorder = TraceRecorder(
+                self.glob_params["trace_file"],
+                self.shell_params,
+                self.glob_params,
+                self.inj_dict,
+            )
+            self.logger.info(f"Recording the calls to {self.recorder.filename}.")
+        else:
+            self.recorder = None
+
+    # lightcurve variables and magnitudes cached on disk in model_cache (see
+    # model_cache.py)
+    def set_model_cache(self):
+        if check_dict_variables(dic=(self.glob_params, ["model_cache"]), logger=None):
+            self.model_cache = ModelCache(
+                self.glob_params["model_cache"],
+                self.shell_params,
+                self.glob_params,
+                max_size=self.glob_params.get("model_cache_size"),
+            )
+            self.logger.info(f"Caching the model in {self.model_cache.path}.")
+        else:
+            self.model_cache = None
 
     def set_flux_factor_func(self):
         check_dict_variables(
@@ -141,6 +179,7 @@ class MKN:
             self.logger.debug(
                 f"   settings: path={self.glob_params['filter_data_path']}."
             )
+            self.set_filter_responses()
         else:
             (
                 self.dic_filt_full,
@@ -150,8 +189,28 @@ class MKN:
                 self.lams,
                 self.mag,
             ) = (None, None, None, None, None, None)
+            self.responses = None
             self.logger.info("Did not initialize filter data from local data.")
 
+    # quadrature weights of the filters with a transmission curve, on a shared wavelength grid
+    def set_filter_responses(self):
+        if not check_dict_variables(
+            dic=(self.glob_params, ["transmission_data_path"]), logger=None
+        ):
+            self.responses = None
+            return
+        self.responses = flt.FilterResponses.from_filters(
+            self.dic_filt,
+            self.lams,
+            self.glob_params["transmission_data_path"],
+            num=self.glob_params.get("transmission_num") or 32,
+        )
+        if self.responses is not None:
+            self.logger.info("Initialized filter transmission curves.")
+            self.logger.debug(
+                f"   settings: path={self.glob_params['transmission_data_path']}, filters={self.responses.lams}, wavelengths={len(self.responses.wavelengths)}."
+            )
+
     def set_redshift(self):
         check_dict_variables(
             dic=(self.glob_params, ["cosmology"]),
@@ -230,9 +289,9 @@ class MKN:
         if inj_dict is None:
             return
         else:
-            mkn = MKN(
+            mkn = get_mkn(
                 inj_dict["shell_params"],
-                inj_dict["glob_params"],
+                {**inj_dict["glob_params"], "trace_file": None},
                 log_name="INJ-MKN",
                 log_level="WARNING",
             )
@@ -256,22 +315,24 @@ class MKN:
                 mag_min=inj_dict["glob_params"]["mag_min"],
                 mag_max=inj_dict["glob_params"]["mag_max"],
             )
+            self.set_filter_responses()
         self.logger.info("Initialized injection.")
 
     #####
     # from obs frame to source frame time
     #####
     # Compute source time
-    def time_source(self, mkn_vars):
+    def time_source(self, mkn_vars, times=None):
         return time_safe(
-            self.times / (1.0 + self.redshift(mkn_vars["glob"]["distance"])),
+            (self.times if times is None else times)
+            / (1.0 + self.redshift(mkn_vars["glob"]["distance"])),
             self.glob_params["t_0"],
         )
 
     # Truncate observer time for consistency with source time array length
-    def time_observer(self, mkn_vars):
+    def time_observer(self, mkn_vars, times=None):
         return time_safe(
-            self.times,
+            self.times if times is None else times,
             self.glob_params["t_0"]
             * (1.0 + self.redshift(mkn_vars["glob"]["distance"])),
         )
@@ -279,6 +340,7 @@ class MKN:
     #####
     # model quantities calculation: flux_factors, lightcurve variables, and magnitudes
     #####
+    @instrumentation.timed("projection")
     def calc_flux_factors(self, mkn_vars):
         if mkn_vars["glob"]["view_angle"] > np.pi / 2:
             return self.flux_factor_func(
@@ -287,19 +349,92 @@ class MKN:
         else:
             return self.flux_factor_func(np.degrees(mkn_vars["glob"]["view_angle"]))
 
-    def calc_lightcurve_vars(self, mkn_vars):
-        return self.ejecta.calc_lightcurve_vars(
+    # Select the angular bins whose flux factor, in either hemisphere orientation, is
+    # above ff_toll times the largest one; the others are not evaluated
+    def calc_visible_bins(self, mkn_vars):
+        if not check_dict_variables(dic=(self.glob_params, ["ff_toll"]), logger=None):
+            return None
+        flux_factors = self.calc_flux_factors(mkn_vars)
+        weights = np.maximum(
+            flux_factors[: len(flux_factors) // 2],
+            flux_factors[len(flux_factors) // 2 :][::-1],
+        )
+        return weights > self.glob_params["ff_toll"] * np.amax(weights)
+
+    @instrumentation.timed("lightcurve")
+    def calc_lightcurve_vars(self, mkn_vars, times=None):
+        times = self.time_source(mkn_vars, times=times)
+        if self.model_cache is not None:
+            key = self.model_cache.key("lightcurve_vars", mkn_vars, times)
+            state = self.model_cache.get(key)
+            if state is not None:
+                return self.ejecta.set_lightcurve_vars(state)
+        lightcurve = self.ejecta.calc_lightcurve_vars(
             self.angles,
             self.omegas,
-            self.time_source(mkn_vars),
+            times,
             mkn_vars,
             mkn_vars["glob"],
             self.glob_params,
             logger=self.logger,
+            bins=self.calc_visible_bins(mkn_vars),
         )
+        if self.model_cache is not None:
+            self.model_cache.put(
+                key,
+                {
+                    name: var
+                    for name, var in zip(lightcurve_vars, lightcurve)
+                    if var is not None
+                },
+            )
+        return lightcurve
 
+    @recorded
     def calc_magnitudes(self, mkn_vars, measures=False):
         self.calc_lightcurve_vars(mkn_vars)
+        if self.model_cache is None:
+            return self.calc_magnitudes_from_vars(mkn_vars, measures)
+        # keyed also by the filters and the times of the measures
+        key = self.model_cache.key(
+            "magnitudes",
+            mkn_vars,
+            self.times,
+            measures,
+            np.asarray(self.lams).tolist(),
+            (
+                np.concatenate([self.mag[lam]["time"] for lam in self.lams])
+                if measures
+                else None
+            ),
+        )
+        # the filters are concatenated, split by their number of times
+        arrays = self.model_cache.get(key)
+        if arrays is None:
+            mags = self.calc_magnitudes_from_vars(mkn_vars, measures)
+            self.model_cache.put(
+                key,
+                {
+                    name: np.concatenate([mags[lam][name] for lam in self.lams])
+                    for name in ["time", "mag"]
+                },
+            )
+            return mags
+        if measures:
+            sizes = [len(self.mag[lam]["time"]) for lam in self.lams]
+        else:
+            sizes = len(self.lams) * [len(arrays["time"]) // len(self.lams)]
+        splits = np.cumsum(sizes)[:-1]
+        return {
+            lam: {"time": time, "mag": mag}
+            for lam, time, mag in zip(
+                self.lams,
+                np.split(arrays["time"], splits),
+                np.split(arrays["mag"], splits),
+            )
+        }
+
+    def calc_magnitudes_from_vars(self, mkn_vars, measures):
         return flt.calc_magnitudes(
             self.calc_flux_factors(mkn_vars),
             self.time_observer(mkn_vars),
@@ -312,11 +447,33 @@ class MKN:
             lum_shells=self.ejecta.lum_shells,
             T_shells=self.ejecta.T_shells,
             omegas=self.omegas,
+            planck_lookup=self.planck_lookup,
+            responses=self.responses,
             measures=measures,
             mag=self.mag,
             t_start_filter=self.glob_params["t_start_filter"],
         )
 
+    # Flux density F_nu(t, lambda) [erg/s/cm^2/Hz] at the wavelengths [m] and observer
+    # times (by default the MKN ones) returned with it, truncated as in time_observer;
+    # with filename, it is written in chunks to a memory-mapped .npy file
+    def calc_sed(self, mkn_vars, wavelengths, times=None, filename=None, chunk_size=None):
+        self.calc_lightcurve_vars(mkn_vars, times=times)
+        return self.time_observer(mkn_vars, times=times), flt.calc_sed(
+            self.calc_flux_factors(mkn_vars),
+            wavelengths,
+            mkn_vars["glob"]["distance"] * Mpc2cm,
+            self.redshift(mkn_vars["glob"]["distance"]),
+            self.ejecta.radius_photo,
+            T_photo=self.ejecta.T_photo,
+            lum_shells=self.ejecta.lum_shells,
+            T_shells=self.ejecta.T_shells,
+            omegas=self.omegas,
+            planck_lookup=self.planck_lookup,
+            filename=filename,
+            chunk_size=chunk_size,
+        )
+
     #####
     # residuals and log_like calculation
     #####
@@ -336,14 +493,22 @@ class MKN:
             lum_shells=self.ejecta.lum_shells,
             T_shells=self.ejecta.T_shells,
             omegas=self.omegas,
+            planck_lookup=self.planck_lookup,
+            responses=self.responses,
             sigma_sys=mkn_vars["glob"]["sigma_sys"],
         )
 
+    @recorded
     def calc_log_like(self, mkn_vars):
         return -0.5 * sum(
             [sum(residual**2) for residual in self.calc_residuals(mkn_vars).values()]
         ) + self.calc_log_like_normalization(mkn_vars)
 
+    # two-stage likelihood for delayed-acceptance MCMC, screening the proposals with a
+    # coarse MKN (see delayed_acceptance.py)
+    def delayed_acceptance(self, coarse_glob_params=None, rng=None):
+        return DelayedAcceptance(self, coarse_glob_params=coarse_glob_params, rng=rng)
+
     def calc_log_like_normalization(self, mkn_vars):
         return (
             -0.5
@@ -368,15 +533,57 @@ class MKN:
     #####
     # isotropized luminosity calculation for model consistency check
     #####
-    def calc_lum_iso(self, mkn_vars, t_scale=None, t_num=None, t_min=None, t_max=None):
-        return calc_lum_iso_fake_filters(
-            self.shell_params,
-            self.glob_params,
-            mkn_vars,
-            t_scale=t_scale,
-            t_num=t_num,
-            t_min=t_min,
-            t_max=t_max,
+    # The lightcurve variables are computed on the lin/log times of glob_params (or on
+    # the ones given here) and the isotropized luminosity is integrated analytically
+    # over wavelength; with wavelengths (an array in meters or a number of log-spaced
+    # points) it is instead integrated from the flux density, as a spectral cross-check
+    def calc_lum_iso(
+        self,
+        mkn_vars,
+        t_scale=None,
+        t_num=None,
+        t_min=None,
+        t_max=None,
+        wavelengths=None,
+    ):
+        times_params = {
+            key: self.glob_params.get(key) if val is None else val
+            for key, val in zip(
+                ["t_scale", "t_min", "t_max", "t_num"], [t_scale, t_min, t_max, t_num]
+            )
+        }
+        if times_params["t_scale"] not in ["lin", "log"]:
+            self.logger.error(
+                "lum_iso calculation has to be done with t_usage = lin or log! ... Exiting."
+            )
+            sys.exit()
+        times = init_times(**times_params)
+
+        self.calc_lightcurve_vars(mkn_vars, times=times)
+        flux_factors = self.calc_flux_factors(mkn_vars)
+        lightcurve_vars = dict(
+            T_photo=self.ejecta.T_photo,
+            lum_shells=self.ejecta.lum_shells,
+            T_shells=self.ejecta.T_shells,
+            omegas=self.omegas,
+        )
+        if wavelengths is None:
+            lum_iso = flt.calc_lum_iso(
+                flux_factors, self.ejecta.radius_photo, **lightcurve_vars
+            )
+        else:
+            lum_iso = flt.calc_lum_iso_from_spectrum(
+                flux_factors,
+                wavelengths,
+                self.redshift(mkn_vars["glob"]["distance"]),
+                self.ejecta.radius_photo,
+                **lightcurve_vars,
+            )
+        return (
+            self.time_observer(mkn_vars, times=times),
+            self.time_source(mkn_vars, times=times),
+            flt.calc_lum_iso_from_bol(self.ejecta.lum_bol, flux_factors, self.omegas),
+            lum_iso,
         )
 
     #####
@@ -396,6 +603,9 @@ class MKN:
         legendsize=12,
         legend_geom=[0, 0, 3, 4],
     ):
+        # matplotlib is only loaded when plotting
+        from .plotting import plot_magnitudes
+
         plot_magnitudes(
             self,
             mkn_vars,
@@ -428,9 +638,61 @@ def gen_inj_dict(
     }
 
 
+#####
+# In-process pool of initialized MKN objects
+#####
+# MKN objects keyed by their configuration and logging settings, the least recently
+# used ones dropped above mkn_pool_size
+_mkn_pool = OrderedDict()
+mkn_pool_size = 8
+
+
+# numpy values of the configurations by value (str shortens large arrays)
+def pool_key_default(val):
+    if isinstance(val, (np.ndarray, np.generic)):
+        return val.tolist()
+    return str(val)
+
+
+# An initialized MKN for shell_params, glob_params and inj_dict, shared with the
+# previous callers with the same configuration and logging settings (e.g. in loops
+# over configurations, the injection of gen_inj_data and calc_lum_iso_fake_filters):
+# its parameters must not be modified, and its lightcurve variables are the ones of
+# its last evaluation.
+# Data files changed in the meantime are not read again, unless clear_mkn_pool is
+# called.
+def get_mkn(shell_params, glob_params, inj_dict=None, log_name="MKN", log_level="INFO"):
+    key = json.dumps(
+        [shell_params, glob_params, inj_dict, log_name, log_level],
+        sort_keys=True,
+        default=pool_key_default,
+    )
+    instrumentation.cache("mkn_pool", key in _mkn_pool)
+    if key in _mkn_pool:
+        _mkn_pool.move_to_end(key)
+        return _mkn_pool[key]
+    mkn = MKN(
+        deepcopy(shell_params),
+        deepcopy(glob_params),
+        inj_dict=deepcopy(inj_dict),
+        log_name=log_name,
+        log_level=log_level,
+    )
+    _mkn_pool[key] = mkn
+    while len(_mkn_pool) > mkn_pool_size:
+        _mkn_pool.popitem(last=False)
+    return mkn
+
+
+def clear_mkn_pool():
+    _mkn_pool.clear()
+
+
 #####
 # Auxiliary functions for lum_iso calculation
 #####
+# Previous implementation of MKN.calc_lum_iso, through the magnitudes of the iso_calc
+# fake filters: kept as an independent check of the direct calculation
 def calc_lum_iso_fake_filters(
     shell_params,
     glob_params,
@@ -442,6 +704,7 @@ def calc_lum_iso_fake_filters(
 ):
     glob_params_lum_iso = deepcopy(glob_params)
     glob_params_lum_iso["filter_dictionary"] = "iso_calc"
+    glob_params_lum_iso["trace_file"] = None
 
     if t_scale is not None:
         glob_params_lum_iso["t_scale"] = t_scale
@@ -452,7 +715,7 @@ def calc_lum_iso_fake_filters(
     if t_max is not None:
         glob_params_lum_iso["t_max"] = t_max
 
-    mkn = MKN(
+    mkn = get_mkn(
         shell_params, glob_params_lum_iso, log_name="LUM-ISO-MKN", log_level="WARNING"
     )
     if glob_params_lum_iso["t_scale"] not in ["lin", "log"]:
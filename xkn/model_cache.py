@@ -0,0 +1,140 @@
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+
+from . import instrumentation
+from .utils import package_version
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: evictions are not serialized
+    fcntl = None
+
+# Content-addressed on-disk cache of the model evaluations of MKN (the model_cache glob
+# parameter): the lightcurve variables of calc_lightcurve_vars and the magnitudes of
+# calc_magnitudes are stored as compressed .npz files named after the hash of the xkn
+# version, shell_params, glob_params (but the cache settings), mkn_vars and times, so
+# that reruns of an analysis or samplers revisiting a point read them back instead of
+# evaluating the model again. Note that data and filter files are keyed by their path
+# only, and a source tree that is not installed has no version: the cache has to be
+# cleared when they change.
+# The cache is shared by concurrent processes: entries are written under a temporary
+# name and renamed into place, and an entry removed by another process is a miss.
+# When the cache grows above its size (model_cache_size, MiB), the least recently used
+# entries (by modification time, updated at every hit) are evicted down to 80% of it,
+# by one process at a time.
+
+# glob parameters not affecting the model
+unkeyed_glob_params = ["trace_file", "model_cache", "model_cache_size"]
+
+
+class ModelCache(object):
+
+    def __init__(self, path, shell_params, glob_params, max_size=None):
+        self.path = path
+        self.max_size = (1024 if max_size is None else max_size) * 2**20
+        self.config = json.dumps(
+            [
+                package_version(),
+                shell_params,
+                {
+                    key: val
+                    for key, val in glob_params.items()
+                    if key not in unkeyed_glob_params
+                },
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        os.makedirs(path, exist_ok=True)
+        self.size = self.scan()[1]
+
+    # hash of the configuration, the kind of entry and its arguments (arrays by value)
+    def key(self, kind, *args):
+        digest = hashlib.sha256(self.config.encode())
+        digest.update(kind.encode())
+        for arg in args:
+            if isinstance(arg, np.ndarray):
+                digest.update(np.ascontiguousarray(arg).tobytes())
+            else:
+                digest.update(json.dumps(arg, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.npz")
+
+    # the arrays of the entry, None if missing
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            with np.load(path) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+        except FileNotFoundError:
+            instrumentation.cache("model_cache", False)
+            return None
+        except (OSError, ValueError, EOFError):
+            # incomplete or corrupted entry
+            self.remove(path)
+            instrumentation.cache("model_cache", False)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        instrumentation.cache("model_cache", True)
+        return arrays
+
+    def put(self, key, arrays):
+        path = self.entry_path(key)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(buffer.getbuffer())
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self.size += buffer.getbuffer().nbytes
+        if self.size > self.max_size:
+            self.evict()
+
+    # entries (path, size, modification time) and their total size
+    def scan(self):
+        entries = []
+        for subdir in os.scandir(self.path):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith(".npz"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((entry.path, stat.st_size, stat.st_mtime_ns))
+        return entries, sum(size for _, size, _ in entries)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        with open(os.path.join(self.path, "lock"), "a") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # another process is evicting
+                    return
+            entries, self.size = self.scan()
+            for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                if self.size <= 0.8 * self.max_size:
+                    break
+                self.remove(path)
+                self.size -= size
@@ -1,9 +1,8 @@
 import numpy as np
 import os
 import sys
-from scipy.interpolate import RegularGridInterpolator
 
-from .utils import smoothclamp, oneoverpi, sec2day, day2sec
+from .utils import smoothclamp, oneoverpi, sec2day, day2sec, loadtxt_cached
 
 
 class NuclearHeat(object):
@@ -72,34 +71,44 @@ class SkynetFits(object):
         "interp_tables",
         "skynet_fit_parameters.dat",
     )
-    tau_raw, entropy_raw, ye_raw, A_raw, alpha_raw = np.loadtxt(
-        filename, unpack=True, usecols=(0, 1, 2, 3, 4)
-    )
+    # the table is loaded at the first lookup
+    params = None
 
-    taus = np.unique(tau_raw)
-    entropys = np.unique(entropy_raw)
-    yes = np.unique(ye_raw)
+    @classmethod
+    def load(cls):
+        tau_raw, entropy_raw, ye_raw, A_raw, alpha_raw = loadtxt_cached(
+            cls.filename, unpack=True, usecols=(0, 1, 2, 3, 4)
+        )
 
-    As = A_raw.reshape((len(taus), len(entropys), len(yes)))
-    alphas = alpha_raw.reshape((len(taus), len(entropys), len(yes)))
+        cls.taus = np.unique(tau_raw)
+        cls.entropys = np.unique(entropy_raw)
+        cls.yes = np.unique(ye_raw)
 
-    # Linear 3D interpolation of the parameters
-    A_interp = RegularGridInterpolator(
-        (taus, entropys, yes), As, bounds_error=False, fill_value=None, method="nearest"
-    )
-    alpha_interp = RegularGridInterpolator(
-        (taus, entropys, yes),
-        alphas,
-        bounds_error=False,
-        fill_value=None,
-        method="nearest",
-    )
+        # nearest-neighbour lookup of the parameters: the cell of each node is bounded by
+        # the midpoints to its neighbours (ties go to the lower node) and the inputs
+        # outside the table are assigned to the first or last node
+        cls.edges = [0.5 * (x[1:] + x[:-1]) for x in (cls.taus, cls.entropys, cls.yes)]
+
+        # A and alpha fused along the last axis, so that one lookup returns both
+        shape = (len(cls.taus), len(cls.entropys), len(cls.yes))
+        cls.params = np.stack(
+            [A_raw.reshape(shape), alpha_raw.reshape(shape)], axis=-1
+        )
+
+    @classmethod
+    def lookup(cls, ye, s, tau):
+        if cls.params is None:
+            cls.load()
+        idx = tuple(
+            np.searchsorted(edges, x) for edges, x in zip(cls.edges, (tau, s, ye))
+        )
+        return cls.params[idx]
 
 
 # function calculating touple of parameters for given set of inputs
 def skynet_heating_params(ye, s, tau):  # units: s[k_B/baryon] tau[ms]
-    A = SkynetFits.A_interp((tau, s, ye))
-    alpha = SkynetFits.alpha_interp((tau, s, ye))
+    params = SkynetFits.lookup(ye, s, tau)
+    A, alpha = params[..., 0], params[..., 1]
     return A * day2sec**alpha, alpha  # units: A[erg/s/g]
 
 
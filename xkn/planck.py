@@ -0,0 +1,116 @@
+import numpy as np
+
+from .utils import c, h, kB, set_numba_cache_dir
+
+set_numba_cache_dir()
+
+from numba import njit
+
+# Tabulated g(x) = x^3 / (e^x - 1), with x = h nu / (kB T), for the Planck function
+# B_nu(T) = 2 (kB T)^3 / (h c)^2 * g(x).
+# - x < 1: series of x / (e^x - 1) up to x^6, relative error < 1.4e-6 (at x = 1);
+# - 1 <= x < x_max: linear interpolation on a uniform grid of step dx, relative error
+#   < dx^2 / 8 * max|g''/g| = 7.6e-6, since |g''/g| < 1 (it tends to 1 for large x);
+# - x >= x_max: 0, as g(x_max) ~ 1e-296 (and e^x overflows in the exact form soon after).
+# The error bounds are checked, with the timings, in benchmarks/planck_lookup.py
+
+lookup_dx = 1.0 / 128.0
+lookup_x_max = 700.0
+max_rel_error = 7.6e-6
+
+
+def tabulate(dx=lookup_dx, x_max=lookup_x_max):
+    x = np.arange(int(round(x_max / dx)) + 1) * dx
+    table = np.zeros_like(x)
+    table[1:] = x[1:] ** 3 / np.expm1(x[1:])
+    return table
+
+
+lookup_table = tabulate()
+planck_factor = 2.0 * kB**3 / (h * c) ** 2
+h_kB = h / kB
+
+numba_signatures = {
+    "planck_x3_lookup": ["float64[::1](float64[::1], float64[::1], float64)"],
+    "planckian_lookup": [
+        "float64[:, ::1](float64[::1], float64[::1], float64[::1], float64)"
+    ],
+}
+
+
+# no fastmath: NaN temperatures have to propagate instead of indexing the table, and
+# zero temperatures give zero (numpy error model: no exception on division by zero)
+@njit(cache=True, error_model="numpy")
+def planck_x3_lookup(x, table, inv_dx):
+    out = np.empty_like(x)
+    n = len(table) - 1
+    for i in range(len(x)):
+        xi = x[i]
+        if xi >= 1.0:
+            u = xi * inv_dx
+            if u < n:
+                j = int(u)
+                out[i] = table[j] + (u - j) * (table[j + 1] - table[j])
+            else:
+                out[i] = 0.0
+        else:
+            x2 = xi * xi
+            out[i] = x2 * (
+                1.0 - 0.5 * xi + x2 / 12.0 - x2 * x2 / 720.0 + x2 * x2 * x2 / 30240.0
+            )
+    return out
+
+
+# B_nu(T) for every pair of frequencies nu and temperatures T, with g interpolated as
+# in planck_x3_lookup
+@njit(cache=True, error_model="numpy")
+def planckian_lookup(nu, T, table, inv_dx):
+    out = np.empty((len(nu), len(T)))
+    n = len(table) - 1
+    for i in range(len(nu)):
+        u_nu = h_kB * inv_dx * nu[i]
+        out_nu = out[i]
+        for j in range(len(T)):
+            u = u_nu / T[j]
+            factor = planck_factor * T[j] * T[j] * T[j]
+            if u >= inv_dx and u < n:
+                k = int(u)
+                out_nu[j] = factor * (table[k] + (u - k) * (table[k + 1] - table[k]))
+            elif u >= n:
+                out_nu[j] = 0.0
+            else:
+                x = u / inv_dx
+                x2 = x * x
+                out_nu[j] = (
+                    factor
+                    * x2
+                    * (
+                        1.0
+                        - 0.5 * x
+                        + x2 / 12.0
+                        - x2 * x2 / 720.0
+                        + x2 * x2 * x2 / 30240.0
+                    )
+                )
+    return out
+
+
+def planck_x3(x):
+    x = np.asarray(x, dtype=float)
+    return planck_x3_lookup(
+        np.ascontiguousarray(x).ravel(), lookup_table, 1.0 / lookup_dx
+    ).reshape(x.shape)
+
+
+# Planck function B_nu(T) [erg/s/cm^2/Hz/sr], with nu and T broadcast as in numpy: the
+# fused kernel is used when nu is constant along the T axes (scalar, or with trailing
+# unit axes, as in filters.calc_fnu_bins)
+def planckian(nu, T):
+    nu = np.asarray(nu, dtype=float)
+    T = np.asarray(T, dtype=float)
+    lead = nu.shape[: nu.ndim - T.ndim] if nu.ndim >= T.ndim else ()
+    if nu.size == int(np.prod(lead)):
+        return planckian_lookup(
+            nu.ravel(), np.ascontiguousarray(T).ravel(), lookup_table, 1.0 / lookup_dx
+        ).reshape(lead + T.shape)
+    return 2.0 * (kB * T) ** 3 / (h * c) ** 2 * planck_x3(h * nu / kB / T)
@@ -0,0 +1,179 @@
+import sys
+import time
+
+import numpy as np
+
+# Numerical resolution of the model, set by the glob parameters:
+# - slices_num: polar angle slices (12, 18, 24 or 30);
+# - t_num: times of the lin/log time grids;
+# - vel_num: velocity points of the grossman model;
+# - n_thin: optically thin shells (thin_shells);
+# - diff_lum_N, diff_lum_Np, diff_lum_Np_K: terms of the expansion, points of the 1D
+#   interpolation and of the 3D interpolation mesh in DiffusionLum
+#   (ricigliano_lippold; 500, 300 and 50 100 50 if None): the expansion converges
+#   only with about one mesh point per term (as in the accurate preset), with 100
+#   points for 500 terms the luminosity after a few days is off by up to ~0.5 mag;
+# - villar_NN: points of the early time integral of the villar model (100 if None).
+# The precision glob parameter (fast, default or accurate) overrides them all with the
+# preset values (default being the values of the example configuration, with a
+# converged DiffusionLum mesh), while autotune searches the cheapest resolution that
+# keeps the magnitudes of a configuration within a given error from the accurate
+# preset. On the example configuration, at the times of the measures, the default and
+# fast presets are within 0.03 and 0.2 mag of the accurate one for grossman, and
+# within 0.05 mag (0.4 s) and 0.3 mag (0.06 s) for ricigliano_lippold, whose legacy
+# mesh (50 100 50) is 0.8 mag off at 0.26 s.
+
+presets = {
+    "fast": {
+        "slices_num": 12,
+        "t_num": 30,
+        "vel_num": 25,
+        "n_thin": 30,
+        "diff_lum_N": 200,
+        "diff_lum_Np": 150,
+        "diff_lum_Np_K": [35, 200, 35],
+        "villar_NN": 50,
+    },
+    "default": {
+        "slices_num": 30,
+        "t_num": 60,
+        "vel_num": 50,
+        "n_thin": 100,
+        "diff_lum_N": 500,
+        "diff_lum_Np": 300,
+        "diff_lum_Np_K": [50, 500, 50],
+        "villar_NN": 100,
+    },
+    "accurate": {
+        "slices_num": 30,
+        "t_num": 120,
+        "vel_num": 100,
+        "n_thin": 200,
+        "diff_lum_N": 1000,
+        "diff_lum_Np": 600,
+        "diff_lum_Np_K": [100, 1000, 100],
+        "villar_NN": 200,
+    },
+}
+
+# values tried by autotune for every knob, from the cheapest
+candidates = {
+    "slices_num": [12, 18, 24, 30],
+    "t_num": [30, 45, 60, 90, 120],
+    "vel_num": [25, 35, 50, 70, 100],
+    "n_thin": [20, 30, 50, 100, 200],
+    "diff_lum_N": [100, 200, 300, 500, 1000],
+    "diff_lum_Np": [100, 150, 300, 600],
+    "diff_lum_Np_K": [
+        [25, 50, 25],
+        [50, 100, 50],
+        [35, 200, 35],
+        [50, 250, 50],
+        [50, 500, 50],
+        [100, 1000, 100],
+    ],
+    "villar_NN": [25, 50, 100, 200],
+}
+
+
+# glob_params with the resolution of the precision preset (if any)
+def apply_precision(glob_params):
+    precision = glob_params.get("precision")
+    if precision is None:
+        return glob_params
+    if precision not in presets:
+        sys.exit(
+            f"Unknown precision {precision}! Please choose one of: {', '.join(presets)}."
+        )
+    return {**glob_params, **presets[precision]}
+
+
+# the knobs that change the model of the given glob_params
+def relevant_knobs(glob_params):
+    knobs = ["slices_num"]
+    if glob_params["t_scale"] in ["lin", "log"]:
+        knobs.append("t_num")
+    if glob_params["lc_model"] == "grossman":
+        knobs.append("vel_num")
+    elif glob_params["lc_model"] == "villar":
+        knobs.append("villar_NN")
+    elif glob_params["lc_model"] == "ricigliano_lippold":
+        knobs += ["diff_lum_N", "diff_lum_Np", "diff_lum_Np_K"]
+        if glob_params.get("thin_shells"):
+            knobs.append("n_thin")
+    return knobs
+
+
+# largest magnitude difference from the reference ones, interpolated on the reference
+# times (the times of the measures are not sorted), where these are brighter than
+# mag_limit (NaN magnitudes are compared as such: a mismatch is an infinite error)
+def mag_error(mags, mags_ref, mag_limit=30.0):
+    error = 0.0
+    for lam in mags_ref:
+        order = np.argsort(mags[lam]["time"])
+        mag = np.interp(
+            mags_ref[lam]["time"], mags[lam]["time"][order], mags[lam]["mag"][order]
+        )
+        finite = np.isfinite(mags_ref[lam]["mag"])
+        if np.any(np.isfinite(mag) != finite):
+            return np.inf
+        finite[finite] = mags_ref[lam]["mag"][finite] < mag_limit
+        if np.any(finite):
+            error = max(
+                error, np.amax(np.abs(mag[finite] - mags_ref[lam]["mag"][finite]))
+            )
+    return error
+
+
+def evaluate(shell_params, glob_params, mkn_vars, repeat):
+    from .mkn import MKN
+
+    mkn = MKN(shell_params, glob_params, log_level="WARNING")
+    # at the times of the measures, if any, as in the likelihood
+    measures = mkn.mag is not None and glob_params["filter_usage"] == "measures"
+    mags = mkn.calc_magnitudes(mkn_vars, measures=measures)
+    cost = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        mkn.calc_magnitudes(mkn_vars, measures=measures)
+        cost = min(cost, time.perf_counter() - start)
+    return mags, cost
+
+
+# Cheapest resolution (by coordinate descent from the accurate preset: every knob is
+# lowered in turn to the cheapest candidate keeping the error within target) for which
+# the magnitudes [mag] of mkn_vars differ by at most target from the accurate preset
+# ones. Returns the knob values, to be set in glob_params (with precision = None),
+# their error and calc_magnitudes time, and the time of the reference.
+def autotune(shell_params, glob_params, mkn_vars, target, repeat=3, logger=None):
+    glob_params = {**glob_params, "precision": None}
+    knobs = relevant_knobs(glob_params)
+    settings = {knob: presets["accurate"][knob] for knob in knobs}
+    mags_ref, cost_ref = evaluate(
+        shell_params, {**glob_params, **settings}, mkn_vars, repeat
+    )
+    error, cost = 0.0, cost_ref
+
+    for knob in knobs:
+        for value in candidates[knob]:
+            if value == settings[knob]:
+                break
+            trial = {**settings, knob: value}
+            trial_mags, trial_cost = evaluate(
+                shell_params, {**glob_params, **trial}, mkn_vars, repeat
+            )
+            trial_error = mag_error(trial_mags, mags_ref)
+            if logger is not None:
+                logger.info(
+                    f"autotune: {knob}={value}, error {trial_error:.2e} mag, {trial_cost:.3f} s"
+                )
+            if trial_error <= target:
+                settings, error, cost = trial, trial_error, trial_cost
+                break
+
+    return {
+        "settings": settings,
+        "error": error,
+        "time": cost,
+        "reference_time": cost_ref,
+    }
@@ -5,6 +5,7 @@ import scipy.integrate as integrate
 import scipy.optimize as optimize
 
 from . import import_NR_data as nrd
+from . import instrumentation
 from . import angular_distribution as ad
 from . import diffusion_luminosity as dl
 from . import heating_function as hf
@@ -40,6 +41,7 @@ class Shell(object):
             shell_params["heat_model"], shell_params["entropy"], shell_params["tau"]
         )
 
+    @instrumentation.timed("photosphere")
     def expansion_angular_distribution(
         self, angles, omegas, times, shell_vars, glob_vars, glob_params, **kwargs
     ):
@@ -62,6 +64,7 @@ class Shell(object):
     ###-------------------------------------------------------------------------------------------------
     ###-------------------------------------------------------------------------------------------------
 
+    @instrumentation.timed("profiles")
     def set_mass_vel_opacity_ye_entropy_tau_profiles(
         self, angles, shell_vars, glob_vars, glob_params, **kwargs
     ):
@@ -94,6 +97,18 @@ class Shell(object):
         else:
             self.tau = 1 / self.vel_rms
 
+    def calc_T_floor(self, mode, shell_vars, glob_vars):
+        if shell_vars["T_floor"] is None:
+            return utils.calc_Tfloor(
+                mode,
+                self.opacity if mode == "opacity" else self.ye,
+                glob_vars["T_floor_LA"],
+                glob_vars["T_floor_Ni"],
+            )
+        else:
+            return shell_vars["T_floor"]
+
+    @instrumentation.timed("diffusion")
     def generate_diff_lums(
         self, angles, times, shell_vars, glob_vars, glob_params, **kwargs
     ):
@@ -117,6 +132,7 @@ class Shell(object):
     ###-------------------------------------------------------------------------------------------------
     ###-------------------------------------------------------------------------------------------------
 
+    @instrumentation.timed("thin_shells")
     def expansion_angular_distribution_thin_layers(
         self, angles, omegas, times, shell_vars, glob_vars, glob_params, **kwargs
     ):
@@ -126,7 +142,8 @@ class Shell(object):
         else:
             alphas = glob_params["alpha"] * np.ones_like(omegas)
 
-        # velocity discretization
+        # velocity discretization: shell edges (v_shells), velocities at which each shell
+        # is evaluated (v_nodes) and shell masses (m_shells)
         if glob_params["shell_const"] == "vel":
             self.v_shells = np.linspace(0, self.vel_woll, glob_params["n_thin"])
         elif glob_params["shell_const"] == "mass":
@@ -140,59 +157,63 @@ class Shell(object):
                     for vel_woll, mass_scaled in zip(self.vel_woll, self.mass_scaled)
                 ]
             ).T
+        elif glob_params["shell_const"] == "gauss":
+            edges, nodes = utils.gauss_legendre_shells(glob_params["n_thin"] - 1)
+            self.v_shells = edges[:, None] * self.vel_woll
         else:
-            sys.exit('Choose "vel" or "mass" as constant shell mode.')
+            sys.exit('Choose "vel", "mass" or "gauss" as constant shell mode.')
+
+        if glob_params["shell_const"] == "gauss":
+            self.v_nodes = nodes[:, None] * self.vel_woll
+        else:
+            self.v_nodes = self.v_shells[:-1]
+        self.m_shells = utils.Mv_Woll(
+            self.mass_scaled, self.v_shells[:-1] / self.vel_woll
+        ) - utils.Mv_Woll(self.mass_scaled, self.v_shells[1:] / self.vel_woll)
 
         # thin regime luminosity computation #
         if self.params["therm_model"] == "BKWM_dens":
             self.lum_shells = np.zeros(
-                (len(angles), len(times), glob_params["n_thin"] - 1)
+                (len(omegas), len(times), glob_params["n_thin"] - 1)
             )
-            for i, v_shells in enumerate(self.v_shells.T):
-
-                e_nuc = np.array(
-                    [
-                        self.nuclear_heat(
-                            time / (1 - (v_shells[:-1] / self.vel_woll[i]) ** 2),
-                            omegas[i],
-                            self.mass_ej[i],
-                            self.vel_rms[i],
-                            alphas[i],
-                            glob_params["t0eps"],
-                            glob_params["sigma0"],
-                            glob_vars["eps0"],
-                            glob_params["cnst_eff"],
-                            glob_params["idx_eff"],
-                            self.thermalization,
-                            self.kappa_2_ye,
-                            self.heating_function,
-                            opacity=self.opacity[i],
-                            ye=self.ye[i],
-                            s=self.entropy[i],
-                            tau=self.tau[i],
-                            cnst_a_eps_nuc=glob_params["a_eps_nuc"],
-                            cnst_b_eps_nuc=glob_params["b_eps_nuc"],
-                            cnst_t_eps_nuc=glob_params["t_eps_nuc"],
-                            shell=self.name,
-                        )[0]
-                        for time in times
-                    ]
-                )
+            for i, v_nodes in enumerate(self.v_nodes.T):
+
+                with instrumentation.stage("heating"):
+                    e_nuc = np.array(
+                        [
+                            self.nuclear_heat(
+                                time / (1 - (v_nodes / self.vel_woll[i]) ** 2),
+                                omegas[i],
+                                self.mass_ej[i],
+                                self.vel_rms[i],
+                                alphas[i],
+                                glob_params["t0eps"],
+                                glob_params["sigma0"],
+                                glob_vars["eps0"],
+                                glob_params["cnst_eff"],
+                                glob_params["idx_eff"],
+                                self.thermalization,
+                                self.kappa_2_ye,
+                                self.heating_function,
+                                opacity=self.opacity[i],
+                                ye=self.ye[i],
+                                s=self.entropy[i],
+                                tau=self.tau[i],
+                                cnst_a_eps_nuc=glob_params["a_eps_nuc"],
+                                cnst_b_eps_nuc=glob_params["b_eps_nuc"],
+                                cnst_t_eps_nuc=glob_params["t_eps_nuc"],
+                                shell=self.name,
+                            )[0]
+                            for time in times
+                        ]
+                    )
 
                 self.lum_shells[i] = (
                     np.array(
                         [
-                            (
-                                utils.Mv_Woll(
-                                    self.mass_scaled[i],
-                                    v_shells[:-1] / self.vel_woll[i],
-                                )
-                                - utils.Mv_Woll(
-                                    self.mass_scaled[i], v_shells[1:] / self.vel_woll[i]
-                                )
-                            )
+                            self.m_shells[:, i]
                             * enuc
-                            / (1 - (v_shells[:-1] / self.vel_woll[i]) ** 2) ** alphas[i]
+                            / (1 - (v_nodes / self.vel_woll[i]) ** 2) ** alphas[i]
                             * omegas[i]
                             / utils.fourpi
                             for enuc in e_nuc
@@ -202,41 +223,35 @@ class Shell(object):
                 )
 
         elif self.params["therm_model"] in ["cnst", "power_law", "BKWM"]:
-            e_nuc = self.nuclear_heat(
-                times,
-                omegas,
-                self.mass_ej,
-                self.vel_rms,
-                alphas,
-                glob_params["t0eps"],
-                glob_params["sigma0"],
-                glob_vars["eps0"],
-                glob_params["cnst_eff"],
-                glob_params["idx_eff"],
-                self.thermalization,
-                self.kappa_2_ye,
-                self.heating_function,
-                opacity=self.opacity,
-                ye=self.ye,
-                s=self.entropy,
-                tau=self.tau,
-                cnst_a_eps_nuc=glob_params["a_eps_nuc"],
-                cnst_b_eps_nuc=glob_params["b_eps_nuc"],
-                cnst_t_eps_nuc=glob_params["t_eps_nuc"],
-                shell=self.name,
-            ).T
+            with instrumentation.stage("heating"):
+                e_nuc = self.nuclear_heat(
+                    times,
+                    omegas,
+                    self.mass_ej,
+                    self.vel_rms,
+                    alphas,
+                    glob_params["t0eps"],
+                    glob_params["sigma0"],
+                    glob_vars["eps0"],
+                    glob_params["cnst_eff"],
+                    glob_params["idx_eff"],
+                    self.thermalization,
+                    self.kappa_2_ye,
+                    self.heating_function,
+                    opacity=self.opacity,
+                    ye=self.ye,
+                    s=self.entropy,
+                    tau=self.tau,
+                    cnst_a_eps_nuc=glob_params["a_eps_nuc"],
+                    cnst_b_eps_nuc=glob_params["b_eps_nuc"],
+                    cnst_t_eps_nuc=glob_params["t_eps_nuc"],
+                    shell=self.name,
+                ).T
 
             self.lum_shells = np.einsum(
                 "ijk->kij",
                 np.array(
-                    (
-                        utils.Mv_Woll(
-                            self.mass_scaled, self.v_shells[:-1] / self.vel_woll
-                        )
-                        - utils.Mv_Woll(
-                            self.mass_scaled, self.v_shells[1:] / self.vel_woll
-                        )
-                    )
+                    self.m_shells
                     * e_nuc[:, None, :]
                     * omegas
                     / utils.fourpi
@@ -249,6 +264,7 @@ class Shell(object):
 
         return (
             self.v_shells.T,
+            self.v_nodes.T,
             self.lum_shells,
             self.vel_woll,
             self.mass_scaled,
@@ -278,15 +294,18 @@ class Shell(object):
 
         self.mass_scaled = self.mass_ej * utils.fourpi / omegas * 2e33
         vel_max = self.vel_rms * np.sqrt(5 / 3) * 3e10  # Ricigliano velocity profile
-        self.lum_bol = np.array(
-            [
-                glob_vars["nuc_fac"]
-                * diff_lum.calc_lum(vel_max[i], self.opacity[i], self.mass_scaled[i])
-                * omegas[i]
-                / utils.fourpi
-                for i, diff_lum in enumerate(self.diff_lums)
-            ]
-        )  # adjusting luminosity to bin size; *glob_vars['eps0']/2e18
+        with instrumentation.stage("diffusion"):
+            self.lum_bol = np.array(
+                [
+                    glob_vars["nuc_fac"]
+                    * diff_lum.calc_lum(
+                        vel_max[i], self.opacity[i], self.mass_scaled[i]
+                    )
+                    * omegas[i]
+                    / utils.fourpi
+                    for i, diff_lum in enumerate(self.diff_lums)
+                ]
+            )  # adjusting luminosity to bin size; *glob_vars['eps0']/2e18
         self.lum_bol[self.lum_bol < 0] = (
             0  # thin regime model break down (setting it to negligable value but big enough so there are no errors)
         )
@@ -332,12 +351,7 @@ class Shell(object):
             self.radius_photo = self.radius_photo.T
             return self.radius_photo, self.lum_bol
 
-        if shell_vars["T_floor"] is None:
-            T_f = utils.calc_Tfloor(
-                "ye", self.ye, glob_vars["T_floor_LA"], glob_vars["T_floor_Ni"]
-            )
-        else:
-            T_f = shell_vars["T_floor"]
+        T_f = self.calc_T_floor("ye", shell_vars, glob_vars)
 
         self.radius_photo = np.minimum(
             self.radius_photo,
@@ -390,39 +404,32 @@ class Shell(object):
                 ]
             )
 
-        self.lum_bol = m_rad * self.nuclear_heat(
-            times,
-            omegas,
-            self.mass_ej,
-            self.vel_rms,
-            glob_params["alpha"],
-            glob_params["t0eps"],
-            glob_params["sigma0"],
-            glob_vars["eps0"],
-            glob_params["cnst_eff"],
-            glob_params["idx_eff"],
-            self.thermalization,
-            self.kappa_2_ye,
-            self.heating_function,
-            opacity=self.opacity,
-            ye=self.ye,
-            s=self.entropy,
-            tau=self.tau,
-            cnst_a_eps_nuc=glob_params["a_eps_nuc"],
-            cnst_b_eps_nuc=glob_params["b_eps_nuc"],
-            cnst_t_eps_nuc=glob_params["t_eps_nuc"],
-            shell=self.name,
-        )
-
-        if shell_vars["T_floor"] is None:
-            T_f = utils.calc_Tfloor(
-                "opacity",
-                self.opacity,
-                glob_vars["T_floor_LA"],
-                glob_vars["T_floor_Ni"],
+        with instrumentation.stage("heating"):
+            self.lum_bol = m_rad * self.nuclear_heat(
+                times,
+                omegas,
+                self.mass_ej,
+                self.vel_rms,
+                glob_params["alpha"],
+                glob_params["t0eps"],
+                glob_params["sigma0"],
+                glob_vars["eps0"],
+                glob_params["cnst_eff"],
+                glob_params["idx_eff"],
+                self.thermalization,
+                self.kappa_2_ye,
+                self.heating_function,
+                opacity=self.opacity,
+                ye=self.ye,
+                s=self.entropy,
+                tau=self.tau,
+                cnst_a_eps_nuc=glob_params["a_eps_nuc"],
+                cnst_b_eps_nuc=glob_params["b_eps_nuc"],
+                cnst_t_eps_nuc=glob_params["t_eps_nuc"],
+                shell=self.name,
             )
-        else:
-            T_f = shell_vars["T_floor"]
+
+        T_f = self.calc_T_floor("opacity", shell_vars, glob_vars)
 
         self.radius_photo = np.minimum(
             ((v_fs * utils.c) * times),
@@ -441,6 +448,7 @@ class Shell(object):
 
     # NUCLEAR HEATING RATE
     # luminosity integrand
+    @instrumentation.timed("heating")
     def L_in(self, omegas, times, glob_vars, glob_params):
         return (
             self.mass_ej
@@ -503,16 +511,10 @@ class Shell(object):
             angles, shell_vars, glob_vars, glob_params
         )
 
-        self.lum_bol = self.L_villar(times, omegas, glob_vars, glob_params, NN=100)
-        if shell_vars["T_floor"] is None:
-            T_floor = utils.calc_Tfloor(
-                "opacity",
-                self.opacity,
-                glob_vars["T_floor_LA"],
-                glob_vars["T_floor_Ni"],
-            )
-        else:
-            T_floor = shell_vars["T_floor"]
+        self.lum_bol = self.L_villar(
+            times, omegas, glob_vars, glob_params, NN=glob_params.get("villar_NN") or 100
+        )
+        T_floor = self.calc_T_floor("opacity", shell_vars, glob_vars)
         _, self.radius_photo = self.vel_rms * np.meshgrid(self.vel_rms, times)
         self.radius_photo = np.minimum(
             self.radius_photo,
@@ -525,3 +527,53 @@ class Shell(object):
         ).T
 
         return self.radius_photo, self.lum_bol
+
+
+class StackedShell(Shell):
+    """
+    Stack of ejecta shells sharing the same thermalization, nuclear heating and
+    opacity-ye models, evaluated as a single shell over the concatenated
+    (component x bin) profiles. The omegas passed to its methods have to be tiled
+    accordingly, while shell_vars is the dictionary of all the components variables.
+    """
+
+    def __init__(self, shells):
+        self.shells = shells
+        self.name = "+".join([shell.name for shell in shells])
+        self.params = shells[0].params
+        self.expansion_model = shells[0].expansion_model
+        self.thermalization = shells[0].thermalization
+        self.nuclear_heat = shells[0].nuclear_heat
+        self.kappa_2_ye = shells[0].kappa_2_ye
+        self.heating_function = shells[0].heating_function
+
+    def set_mass_vel_opacity_ye_entropy_tau_profiles(
+        self, angles, shell_vars, glob_vars, glob_params, **kwargs
+    ):
+        for shell in self.shells:
+            shell.set_mass_vel_opacity_ye_entropy_tau_profiles(
+                angles, shell_vars[shell.name], glob_vars, glob_params, **kwargs
+            )
+        for key in ["mass_ej", "vel_rms", "opacity", "ye", "entropy", "tau"]:
+            setattr(
+                self, key, np.concatenate([getattr(shell, key) for shell in self.shells])
+            )
+
+    def calc_T_floor(self, mode, shell_vars, glob_vars):
+        return np.concatenate(
+            [
+                np.broadcast_to(
+                    shell.calc_T_floor(mode, shell_vars[shell.name], glob_vars),
+                    shell.opacity.shape,
+                )
+                for shell in self.shells
+            ]
+        )
+
+
+# key identifying the shells that can be stacked together
+def stack_key(shell_params):
+    return tuple(
+        shell_params[key]
+        for key in ["therm_model", "heat_model", "ye_k_dep", "entropy", "tau"]
+    )
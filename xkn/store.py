@@ -0,0 +1,324 @@
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import filters as flt
+from .utils import day2sec
+
+# Model evaluations of a parameter design (the training set of emulator.py, the grid of
+# grid.py), stored in chunks along the samples: every chunk is a directory with one
+# .npy file per field, written under a temporary name and renamed into place once
+# complete, so that an interrupted or concurrent generation leaves no partial chunks
+# and is resumed by evaluating the missing ones; the chunks are read back
+# memory-mapped. index.json holds the metadata of the store (configuration and design)
+# and the number of chunks.
+# The fields of every sample are its values of the variables ("values") and the
+# outputs of the model on the MKN times:
+# - "mag": magnitudes of all the filters [lam, time];
+# - "lum_bol": bolometric luminosity [erg/s] summed over the angular bins, and
+#   "lum_bol_iso" the isotropized one for the viewing angle [time].
+
+
+class ChunkStore(object):
+
+    def __init__(self, path, metadata=None, num_chunks=None):
+        self.path = path
+        index_path = os.path.join(path, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            if metadata is not None and index["metadata"] != json.loads(
+                json.dumps(metadata, default=str)
+            ):
+                sys.exit(
+                    f"The store {path} was created with a different configuration!"
+                )
+        elif metadata is None:
+            sys.exit(f"No store found in {path}!")
+        else:
+            os.makedirs(path, exist_ok=True)
+            index = {"metadata": metadata, "num_chunks": num_chunks}
+            tmp_path = f"{index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(index, f, default=str)
+            os.replace(tmp_path, index_path)
+            index = json.loads(json.dumps(index, default=str))
+        self.metadata = index["metadata"]
+        self.num_chunks = index["num_chunks"]
+        self.chunks = {}
+
+    def chunk_path(self, i):
+        return os.path.join(self.path, f"chunk_{i:06d}")
+
+    def missing(self):
+        return [
+            i for i in range(self.num_chunks) if not os.path.isdir(self.chunk_path(i))
+        ]
+
+    def write(self, i, arrays):
+        tmp_path = f"{self.chunk_path(i)}.{os.getpid()}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        try:
+            os.rename(tmp_path, self.chunk_path(i))
+        except OSError:
+            # already written by another process
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def read_chunk(self, i, name, mmap_mode="r"):
+        return np.load(
+            os.path.join(self.chunk_path(i), f"{name}.npy"), mmap_mode=mmap_mode
+        )
+
+    # rows of the field at the indices along the samples of the store, gathered from
+    # the memory-mapped chunks of chunk_size samples
+    def take(self, name, indices, chunk_size):
+        chunk_ids, offsets = np.divmod(indices, chunk_size)
+        rows = None
+        for i in np.unique(chunk_ids):
+            if (i, name) not in self.chunks:
+                self.chunks[(i, name)] = self.read_chunk(i, name)
+            chunk = self.chunks[(i, name)]
+            if rows is None:
+                rows = np.empty(np.shape(indices) + chunk.shape[1:], dtype=chunk.dtype)
+            mask = chunk_ids == i
+            rows[mask] = chunk[offsets[mask]]
+        return rows
+
+    # the field of all the chunks, concatenated
+    def read(self, name):
+        missing = self.missing()
+        if missing:
+            sys.exit(
+                f"The store {self.path} is incomplete ({len(missing)} missing chunks)!"
+            )
+        return np.concatenate(
+            [self.read_chunk(i, name) for i in range(self.num_chunks)]
+        )
+
+
+# mkn_vars with the variables names = [[component, variable], ...] set to values
+def set_vars(mkn_vars, names, values):
+    mkn_vars = {comp: dict(comp_vars) for comp, comp_vars in mkn_vars.items()}
+    for (comp, var), value in zip(names, values):
+        mkn_vars[comp][var] = float(value)
+    return mkn_vars
+
+
+# outputs of the model for mkn_vars on the MKN times: the magnitudes fainter than
+# mag_limit (and NaN) are clipped to it, and the observer times truncated by
+# time_observer are filled with the first value, so that all the samples share the
+# same shape
+def sample_outputs(mkn, mkn_vars, outputs, mag_limit):
+    if "mag" in outputs:
+        mags = mkn.calc_magnitudes(mkn_vars)
+    else:
+        mkn.calc_lightcurve_vars(mkn_vars)
+    times = mkn.time_observer(mkn_vars)
+    results = {}
+    if "mag" in outputs:
+        results["mag"] = np.array(
+            [
+                np.interp(
+                    mkn.times,
+                    times,
+                    np.nan_to_num(
+                        np.minimum(mags[lam]["mag"], mag_limit),
+                        nan=mag_limit,
+                        posinf=mag_limit,
+                    ),
+                )
+                for lam in mkn.lams
+            ]
+        )
+    if "lum_bol" in outputs:
+        results["lum_bol"] = np.interp(
+            mkn.times, times, np.sum(mkn.ejecta.lum_bol, axis=0)
+        )
+        results["lum_bol_iso"] = np.interp(
+            mkn.times,
+            times,
+            flt.calc_lum_iso_from_bol(
+                mkn.ejecta.lum_bol, mkn.calc_flux_factors(mkn_vars), mkn.omegas
+            ),
+        )
+    return results
+
+
+# the MKN of every worker process
+_worker = {}
+
+
+def _init_worker(
+    shell_params, glob_params, inj_dict, mkn_vars, names, outputs, mag_limit
+):
+    from .mkn import MKN
+
+    _worker["mkn"] = MKN(
+        shell_params,
+        {**glob_params, "trace_file": None},
+        inj_dict=inj_dict,
+        log_level="WARNING",
+    )
+    _worker.update(
+        mkn_vars=mkn_vars, names=names, outputs=outputs, mag_limit=mag_limit
+    )
+
+
+def _evaluate_chunk(values):
+    results = [
+        sample_outputs(
+            _worker["mkn"],
+            set_vars(_worker["mkn_vars"], _worker["names"], sample),
+            _worker["outputs"],
+            _worker["mag_limit"],
+        )
+        for sample in values
+    ]
+    arrays = {"values": values}
+    for name in results[0]:
+        arrays[name] = np.array([result[name] for result in results])
+    return arrays
+
+
+# Evaluate the outputs of the missing chunks of the store for the design (values of
+# the variables names [sample, variable], split in chunks of chunk_size samples), in
+# max_workers processes (by default one per CPU).
+def fill(
+    store,
+    shell_params,
+    glob_params,
+    mkn_vars,
+    names,
+    design,
+    chunk_size,
+    inj_dict=None,
+    outputs=("mag",),
+    mag_limit=40.0,
+    max_workers=None,
+    logger=None,
+):
+    missing = store.missing()
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    initargs = (
+        shell_params,
+        glob_params,
+        inj_dict,
+        mkn_vars,
+        names,
+        list(outputs),
+        mag_limit,
+    )
+    chunks = [design[i * chunk_size : (i + 1) * chunk_size] for i in missing]
+    if max_workers > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=initargs
+        ) as executor:
+            results = executor.map(_evaluate_chunk, chunks)
+            for n, (i, arrays) in enumerate(zip(missing, results)):
+                store.write(i, arrays)
+                if logger is not None:
+                    logger.info(f"chunk {i}: {n + 1}/{len(missing)} evaluated")
+    else:
+        _init_worker(*initargs)
+        for n, (i, values) in enumerate(zip(missing, chunks)):
+            store.write(i, _evaluate_chunk(values))
+            if logger is not None:
+                logger.info(f"chunk {i}: {n + 1}/{len(missing)} evaluated")
+
+
+class StoredModel(object):
+    """
+    MKN interface of the models built on a store (Emulator, GridModel), from their
+    predict method, returning the magnitudes [sample, lam, time] on the MKN times for
+    the values [sample, variable] of the store variables, and their standard deviation
+    (None without error estimates). The data and the likelihood are the ones of the
+    MKN of the store configuration; the variables of mkn_vars outside the store ones
+    must be equal to the stored mkn_vars, but sigma_sys (likelihood only).
+    """
+
+    def __init__(self, store, names, log_name="STORE-MKN", log_level="WARNING"):
+        from .mkn import MKN
+
+        metadata = store.metadata
+        self.names = names
+        self.mkn_vars = metadata["mkn_vars"]
+        self.times = np.array(metadata["times"])
+        self.mkn = MKN(
+            metadata["shell_params"],
+            {**metadata["glob_params"], "trace_file": None},
+            inj_dict=metadata["inj_dict"],
+            log_name=log_name,
+            log_level=log_level,
+        )
+        self.lams = self.mkn.lams
+        if (
+            metadata["lams"] is not None
+            and np.asarray(self.lams).tolist() != metadata["lams"]
+        ):
+            sys.exit(f"The filters of {store.path} differ from the ones of its MKN!")
+
+    def values(self, mkn_vars):
+        mismatch = [
+            f"{var} ({comp})"
+            for comp, comp_vars in self.mkn_vars.items()
+            for var, val in comp_vars.items()
+            if [comp, var] not in self.names
+            and [comp, var] != ["glob", "sigma_sys"]
+            and mkn_vars.get(comp, {}).get(var) != val
+        ]
+        if mismatch:
+            sys.exit(
+                f"The variables {', '.join(mismatch)} differ from the ones of the store!"
+            )
+        return [mkn_vars[comp][var] for comp, var in self.names]
+
+    # as MKN.calc_magnitudes, with the standard deviation of the magnitudes ("sigma")
+    # if the model has error estimates
+    def calc_magnitudes(self, mkn_vars, measures=False):
+        mags, sigma = self.predict(self.values(mkn_vars))
+        if measures:
+            times = {
+                lam: (
+                    self.mkn.mag[lam]["time"] - self.mkn.glob_params["t_start_filter"]
+                )
+                * day2sec
+                for lam in self.lams
+            }
+        else:
+            times = {lam: self.times for lam in self.lams}
+        results = {}
+        for i, lam in enumerate(self.lams):
+            results[lam] = {
+                "time": times[lam],
+                "mag": np.interp(times[lam], self.times, mags[0, i]),
+            }
+            if sigma is not None:
+                results[lam]["sigma"] = np.interp(times[lam], self.times, sigma[0, i])
+        return results
+
+    # as MKN.calc_log_like; with return_error, also the standard deviation of the
+    # log-likelihood propagated (to first order) from the one of the magnitudes (zero
+    # without error estimates)
+    def calc_log_like(self, mkn_vars, return_error=False):
+        mags = self.calc_magnitudes(mkn_vars, measures=True)
+        log_like = self.mkn.calc_log_like_normalization(mkn_vars)
+        variance = 0.0
+        for lam in self.lams:
+            mag_diff = mags[lam]["mag"] - self.mkn.mag[lam]["mag"]
+            sigma2 = (
+                flt.prep_sigma(self.mkn.mag[lam]["sigma"], mag_diff=mag_diff) ** 2
+                + mkn_vars["glob"]["sigma_sys"] ** 2
+            )
+            log_like -= 0.5 * np.sum(mag_diff**2 / sigma2)
+            if "sigma" in mags[lam]:
+                variance += np.sum((mag_diff / sigma2 * mags[lam]["sigma"]) ** 2)
+        if return_error:
+            return log_like, np.sqrt(variance)
+        return log_like
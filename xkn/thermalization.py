@@ -1,6 +1,6 @@
 import numpy as np
 import sys
-from scipy.interpolate import interp1d, interp2d
+from scipy.interpolate import interp1d
 
 from . import extrapolation_2d as expol
 from . import utils
@@ -30,10 +30,10 @@ class Thermalization(object):
                 [1.39, 1.21, 1.13, 0.90],
                 [1.52, 1.39, 1.32, 1.13],
             ]
-            # define the interpolation functions
-            self.fa = interp2d(x, y, a, kind="linear")
-            self.fb = interp2d(x, y, b, kind="linear")
-            self.fd = interp2d(x, y, d, kind="linear")
+            # tables for the pointwise bilinear interpolation of the parameters
+            self.x = np.array(x)
+            self.y = np.array(y)
+            self.abd = np.array([a, b, d])
 
         elif therm_model == "BKWM_1d":
             self.therm_efficiency = BKWM_therm_efficiency
@@ -132,7 +132,7 @@ class Thermalization(object):
         xnew = np.log10(utils.fourpi / omegas * mass_ej)  # mass     [Msun]
         ynew = vel  # velocity [c]
         # compute the parameters by linear interpolation in the table
-        return [func(xnew, ynew) for func in [self.fa, self.fb, self.fd]]
+        return list(utils.bilinear(self.x, self.y, self.abd, xnew, ynew))
 
     def therm_efficiency_params_1d(self, omegas, mass_ej, vel):
         # assign the value of x=m/v^2
@@ -156,7 +156,6 @@ def BKWM_therm_efficiency(cls, **kwargs):
     coeffs = cls.therm_efficiency_params(
         kwargs["omegas"], kwargs["mass_ej"], kwargs["vel"]
     )
-    coeffs = [np.diag(coeff) for coeff in coeffs]
     times_days = kwargs["times"] * utils.sec2day
     _, times_days = np.meshgrid(coeffs[0], times_days)
     tmp = 2.0 * coeffs[1] * times_days ** coeffs[2]
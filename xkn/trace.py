@@ -0,0 +1,111 @@
+import json
+import os
+import struct
+import time
+from functools import wraps
+
+import numpy as np
+
+from .utils import package_version
+
+# Workload traces: the MKN.calc_log_like and MKN.calc_magnitudes calls (mkn_vars, wall
+# time and result) are appended to a compact binary file when the trace_file glob
+# parameter is set ("{pid}" in the name is replaced by the process id, e.g. for
+# parallel samplers), and can be replayed with benchmarks/replay.py.
+# The file starts with magic and is a sequence of records, each made of a kind byte
+# (little endian) and:
+# - kind 0 (schema): uint32 length and JSON of the xkn version, shell_params,
+#   glob_params, inj_dict and [component, variable, type] list of the mkn_vars of the
+#   following calls, written again whenever they change (also between the MKN objects
+#   of a process appending to the same file);
+# - kinds 1, 2, 3 (calc_log_like, calc_magnitudes, calc_magnitudes with measures):
+#   float64 wall time, uint32 number of results, then the variables (None as NaN) and
+#   the results (the log-likelihood, or the magnitudes of all bands concatenated) as
+#   float64.
+
+magic = b"XKNTRACE1"
+SCHEMA = 0
+kinds = {
+    ("calc_log_like", False): 1,
+    ("calc_magnitudes", False): 2,
+    ("calc_magnitudes", True): 3,
+}
+
+# schema record last written by this process to every trace file (absolute path)
+_written_schemas = {}
+
+
+class TraceRecorder(object):
+
+    def __init__(self, filename, shell_params, glob_params, inj_dict=None):
+        self.filename = os.path.abspath(filename.replace("{pid}", str(os.getpid())))
+        self.config = {
+            "version": package_version(),
+            "shell_params": shell_params,
+            "glob_params": glob_params,
+            "inj_dict": inj_dict,
+        }
+        self.schema = None
+        self.schema_record = None
+
+    def record(self, kind, mkn_vars, elapsed, results):
+        schema = [
+            [comp, var, "bool" if isinstance(val, bool) else "float"]
+            for comp, comp_vars in mkn_vars.items()
+            for var, val in comp_vars.items()
+        ]
+        if schema != self.schema:
+            self.schema = schema
+            payload = json.dumps({**self.config, "vars": schema}, default=str).encode()
+            self.schema_record = struct.pack("<BI", SCHEMA, len(payload)) + payload
+        values = np.array(
+            [
+                np.nan if val is None else float(val)
+                for comp_vars in mkn_vars.values()
+                for val in comp_vars.values()
+            ]
+        )
+        results = np.asarray(results, dtype=float).ravel()
+        chunks = [
+            struct.pack("<BdI", kind, elapsed, len(results))
+            + values.tobytes()
+            + results.tobytes()
+        ]
+        # one write per call, in append mode, preceded by the schema if the last one
+        # written to the file is another (or the file is new)
+        with open(self.filename, "ab") as f:
+            new = f.tell() == 0
+            if new or _written_schemas.get(self.filename) != self.schema_record:
+                chunks.insert(0, self.schema_record)
+                _written_schemas[self.filename] = self.schema_record
+            if new:
+                chunks.insert(0, magic)
+            f.write(b"".join(chunks))
+
+
+# the log-likelihood, or the magnitudes of all bands concatenated
+def flatten_results(results):
+    if isinstance(results, dict):
+        return np.concatenate([results[lam]["mag"] for lam in results])
+    return [results]
+
+
+# decorator of the MKN methods recording their calls when a trace file is set
+def recorded(method):
+    @wraps(method)
+    def wrapper(self, mkn_vars, *args, **kwargs):
+        if self.recorder is None:
+            return method(self, mkn_vars, *args, **kwargs)
+        start = time.perf_counter()
+        results = method(self, mkn_vars, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        measures = bool(kwargs.get("measures", args[0] if args else False))
+        self.recorder.record(
+            kinds[(method.__name__, measures)],
+            mkn_vars,
+            elapsed,
+            flatten_results(results),
+        )
+        return results
+
+    return wrapper
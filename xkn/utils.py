@@ -1,13 +1,13 @@
+import hashlib
 import os
 import sys
 from copy import deepcopy
 
-import astropy.units as apu
 import numpy as np
-from astropy.cosmology import Planck18, z_at_value
 from scipy.interpolate import InterpolatedUnivariateSpline
 
 from . import __path__ as mkn_path
+from . import instrumentation
 
 mkn_path = mkn_path[0]
 
@@ -31,6 +31,69 @@ small = 1.0e-10  # [-]
 huge = 1.0e30  # [-]
 
 
+# ---binary cache of the data tables---
+def cache_dir():
+    return os.environ.get(
+        "XKN_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "xkn")
+    )
+
+
+# compiled numba kernels are cached on disk, in the xkn cache directory unless numba is
+# configured otherwise: to be called before numba is imported, which reads
+# NUMBA_CACHE_DIR once
+def set_numba_cache_dir():
+    os.environ.setdefault("NUMBA_CACHE_DIR", os.path.join(cache_dir(), "numba"))
+
+
+def cached_array(name, key, compute, mmap_mode=None):
+    # arrays are stored as .npy files in the cache directory, named after the hash of
+    # the key; if the cache is not writable, the array is computed at every first use
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir(), f"{name}.{digest}.npy")
+    try:
+        array = np.load(cache_path, mmap_mode=mmap_mode)
+        instrumentation.cache("cached_array", True)
+        return array
+    except (OSError, ValueError, EOFError):
+        instrumentation.cache("cached_array", False)
+        array = compute()
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return array
+
+
+def loadtxt_cached(filename, unpack=False, **kwargs):
+    # text tables are parsed once, the binary copy is invalidated when the table changes
+    stat = os.stat(filename)
+    table = cached_array(
+        os.path.basename(filename),
+        (
+            os.path.abspath(filename),
+            stat.st_size,
+            stat.st_mtime_ns,
+            sorted(kwargs.items()),
+        ),
+        lambda: np.loadtxt(filename, **kwargs),
+    )
+    return table.T if unpack else table
+
+
+# version of the installed xkn package (None for a source tree that is not installed)
+def package_version():
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("xkn")
+    except PackageNotFoundError:
+        return None
+
+
 class ObserverProjection(object):
 
     def __init__(self, slices_num, slices_dist):
@@ -46,7 +109,7 @@ class ObserverProjection(object):
         return np.array([f(angle) for f in self.flux_interpolant])
 
     def read_flux_factors(self):
-        flux_factors = np.loadtxt(self.data_path).T
+        flux_factors = loadtxt_cached(self.data_path).T
         return [
             InterpolatedUnivariateSpline(flux_factors[0], f) for f in flux_factors[1:]
         ]
@@ -156,10 +219,7 @@ def init_times(
 
 def time_measures(mag, t_start_filter, toll):
     all_time = (
-        np.unique(
-            np.sort(np.array([el for lam in mag for el in list(mag[lam]["time"])]))
-        )
-        - t_start_filter
+        np.unique(np.concatenate([mag[lam]["time"] for lam in mag])) - t_start_filter
     )
     if toll is None:
         return all_time * day2sec
@@ -230,6 +290,29 @@ def Mv_Woll(mass, ratio):
     )
 
 
+# pointwise bilinear interpolation of the tables (stacked along the first axis) on
+# the regular grid (y, x), constant outside of the grid; xnew and ynew are broadcast
+def bilinear(x, y, tables, xnew, ynew):
+    xnew = np.clip(xnew, x[0], x[-1])
+    ynew = np.clip(ynew, y[0], y[-1])
+    i = np.clip(np.searchsorted(x, xnew, side="right") - 1, 0, len(x) - 2)
+    j = np.clip(np.searchsorted(y, ynew, side="right") - 1, 0, len(y) - 2)
+    wx = (xnew - x[i]) / (x[i + 1] - x[i])
+    wy = (ynew - y[j]) / (y[j + 1] - y[j])
+    return (1.0 - wy) * (
+        (1.0 - wx) * tables[:, j, i] + wx * tables[:, j, i + 1]
+    ) + wy * ((1.0 - wx) * tables[:, j + 1, i] + wx * tables[:, j + 1, i + 1])
+
+
+def gauss_legendre_shells(n):
+    # Gauss-Legendre nodes for the velocity ratio in [0, 1]; the shell edges are the
+    # partial sums of the weights, which bracket the nodes
+    nodes, weights = np.polynomial.legendre.leggauss(n)
+    edges = np.append(0.0, np.cumsum(0.5 * weights))
+    edges[-1] = 1.0
+    return edges, 0.5 * (nodes + 1.0)
+
+
 def mass_scaled_thin(radius_photo, times, vel_woll, mass_scaled):
     return np.where(
         radius_photo / times <= vel_woll,
@@ -329,6 +412,9 @@ class Redshift(object):
         return 0
 
     def get_z(self, distance, z_min=0.0, z_max=2.0):
+        import astropy.units as apu
+        from astropy.cosmology import Planck18, z_at_value
+
         return float(
             z_at_value(Planck18.luminosity_distance, distance * apu.Mpc, z_min, z_max)
         )